@@ -0,0 +1,94 @@
+"""
+Compare the JSON codecs on recorded session payloads.
+
+For each log, measures the time to decode a /api/parse_logs request body (the
+full logs array), to encode a /api/get_log response, and to write and read the
+log as JSONL, with each available codec (see coauthor_interface/json_codec.py).
+Without --log_dir, synthetic keystroke logs are used.
+
+Usage: python scripts/bench_json_codec.py [--log_dir ../logs] [--max_logs 20] [--repeat 5]
+"""
+
+import argparse
+from time import perf_counter
+
+from coauthor_interface import json_codec
+from coauthor_interface.backend.helper import retrieve_log_paths
+from coauthor_interface.backend.reader import read_log
+
+
+def make_logs(n_logs):
+    return [
+        {
+            "eventName": "text-insert",
+            "eventSource": "user",
+            "eventTimestamp": 1750000000000 + i * 100,
+            "textDelta": {"ops": [{"retain": i}, {"insert": "a"}]},
+            "cursorRange": "",
+            "currentDoc": "a" * i,
+            "currentCursor": {"index": i, "length": 0},
+            "currentSuggestions": [],
+            "currentSuggestionIndex": 0,
+            "currentHoverIndex": "",
+            "currentN": "5",
+            "currentMaxToken": "30",
+            "currentTemperature": "0.9",
+            "currentTopP": "1",
+            "currentPresencePenalty": "0",
+            "currentFrequencyPenalty": "0.5",
+        }
+        for i in range(n_logs)
+    ]
+
+
+def load_logs(log_dir, max_logs):
+    if not log_dir:
+        return [make_logs(2000), make_logs(10000)]
+    paths = sorted(retrieve_log_paths(log_dir).values())[:max_logs]
+    return [read_log(path) for path in paths]
+
+
+def measure(function, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        function()
+    return (perf_counter() - start) / repeat
+
+
+def bench_codec(codec, logs, repeat):
+    request_bodies = [codec.dumps({"session_id": "bench", "logs": log}) for log in logs]
+    timings = {
+        "decode request": lambda: [codec.loads(body) for body in request_bodies],
+        "encode response": lambda: [codec.dumps({"status": True, "logs": log}) for log in logs],
+        "write jsonl": lambda: ["".join(codec.dumps(event) + "\n" for event in log) for log in logs],
+    }
+    lines = [[codec.dumps(event) for event in log] for log in logs]
+    timings["read jsonl"] = lambda: [[codec.loads(line) for line in log_lines] for log_lines in lines]
+    return {name: measure(function, repeat) for name, function in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log_dir", type=str, default=None)
+    parser.add_argument("--max_logs", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logs = load_logs(args.log_dir, args.max_logs)
+    n_events = sum(len(log) for log in logs)
+    size = sum(len(json_codec.StdlibCodec().dumps(log)) for log in logs)
+    print(f"{len(logs)} logs, {n_events} events, {size / 1e6:.1f} MB of JSON")
+
+    codec_names = ["stdlib"] + (["orjson"] if json_codec.orjson is not None else [])
+    results = {name: bench_codec(json_codec.get_codec(name), logs, args.repeat) for name in codec_names}
+
+    print(f"{'':20}" + "".join(f"{name:>12}" for name in codec_names))
+    for operation in results["stdlib"]:
+        row = "".join(f"{results[name][operation] * 1e3:>10.1f}ms" for name in codec_names)
+        print(f"{operation:20}{row}")
+    if "orjson" not in results:
+        print("orjson is not installed; install it with `pip install orjson` to compare")
+
+
+if __name__ == "__main__":
+    main()
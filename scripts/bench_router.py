@@ -0,0 +1,147 @@
+"""
+Measure how /api/parse_logs throughput scales with the number of router workers.
+
+For each worker count, the session-affinity router (coauthor_interface.backend.router)
+is started with the given config, sessions are started, and every session sends
+/api/parse_logs requests concurrently with a growing document, as the frontend does.
+
+Usage:
+    python scripts/bench_router.py --config_dir ../config --log_dir /tmp/bench_logs --access_code demo
+"""
+
+import argparse
+import concurrent.futures
+import subprocess
+import sys
+import time
+
+import requests
+
+SENTENCES = [
+    "The old lighthouse keeper climbed the stairs every night.",
+    "He counted the ships that passed along the rocky coast.",
+    "One evening, a small boat drifted toward the shore without a sail.",
+    "Nobody on board answered when he called out into the dark.",
+]
+
+
+def make_logs(n_events):
+    """Insert the words of SENTENCES one at a time."""
+    words = " ".join(SENTENCES * (n_events // 40 + 1)).split(" ")
+    logs = []
+    doc = ""
+    for i in range(n_events):
+        insert = ("" if i == 0 else " ") + words[i]
+        logs.append(
+            {
+                "eventName": "text-insert",
+                "eventSource": "user",
+                "eventTimestamp": 1750000000000 + i * 500,
+                "textDelta": {"ops": [{"retain": len(doc)}, {"insert": insert}]}
+                if doc
+                else {"ops": [{"insert": insert}]},
+                "currentDoc": doc + insert,
+                "currentCursor": {"index": len(doc + insert), "length": 0},
+            }
+        )
+        doc += insert
+    return logs
+
+
+def wait_until_ready(base_url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/healthz/ready", timeout=5).status_code == 200:
+                return True
+        except requests.ConnectionError:
+            pass
+        time.sleep(1)
+    return False
+
+
+def start_sessions(base_url, access_code, n_sessions):
+    session_ids = []
+    for _ in range(n_sessions):
+        data = requests.post(f"{base_url}/api/start_session", json={"accessCode": access_code}).json()
+        if data.get("status"):
+            session_ids.append(data["session_id"])
+        else:
+            print(f"Failed to start session: {data.get('message', 'Unknown error')}")
+    return session_ids
+
+
+def run_session(base_url, session_id, n_requests, events_per_request):
+    logs = make_logs(n_requests * events_per_request)
+    for i in range(1, n_requests + 1):
+        payload = {"session_id": session_id, "logs": logs[: i * events_per_request]}
+        requests.post(f"{base_url}/api/parse_logs", json=payload)
+    return n_requests
+
+
+def run_benchmark(base_url, session_ids, n_requests, events_per_request):
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(session_ids)) as executor:
+        futures = [
+            executor.submit(run_session, base_url, session_id, n_requests, events_per_request)
+            for session_id in session_ids
+        ]
+        total = sum(future.result() for future in futures)
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config_dir", type=str, required=True)
+    parser.add_argument("--log_dir", type=str, required=True)
+    parser.add_argument("--access_code", type=str, required=True)
+    parser.add_argument("--port", type=int, default=5600)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--requests_per_session", type=int, default=20)
+    parser.add_argument("--events_per_request", type=int, default=10)
+    parser.add_argument("--startup_timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    base_url = f"http://localhost:{args.port}"
+    results = []
+    for n_workers in args.workers:
+        command = [
+            sys.executable,
+            "-m",
+            "coauthor_interface.backend.router",
+            "--config_dir",
+            args.config_dir,
+            "--log_dir",
+            args.log_dir,
+            "--port",
+            str(args.port),
+            "--proj_name",
+            f"bench_router_{n_workers}",
+            "--workers",
+            str(n_workers),
+        ]
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        try:
+            if not wait_until_ready(base_url, args.startup_timeout):
+                print(f"Router with {n_workers} workers did not become ready")
+                continue
+            session_ids = start_sessions(base_url, args.access_code, args.sessions)
+            throughput = run_benchmark(
+                base_url, session_ids, args.requests_per_session, args.events_per_request
+            )
+            results.append((n_workers, throughput))
+            print(f"{n_workers} workers: {throughput:.1f} parse_logs requests/s")
+        finally:
+            process.terminate()
+            process.wait()
+
+    if results:
+        baseline = results[0][1]
+        print("\nworkers  requests/s  speedup")
+        for n_workers, throughput in results:
+            print(f"{n_workers:>7}  {throughput:>10.1f}  {throughput / baseline:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
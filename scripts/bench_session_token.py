@@ -0,0 +1,95 @@
+"""
+Measure the cost of stateless session tokens.
+
+Compares the time to encode and decode a session token, and its size, against
+the size of the raw logs payload that the frontend already sends with every
+request.
+
+Usage: python scripts/bench_session_token.py [--n_logs 2000] [--n_actions 5]
+"""
+
+import argparse
+import json
+from time import perf_counter, time
+
+from coauthor_interface.backend.action_history import ActionHistory
+from coauthor_interface.backend.session_token import (
+    SessionTokenCodec,
+    encode_session,
+    session_from_token_state,
+)
+
+
+def make_logs(n_logs):
+    return [
+        {
+            "eventName": "text-insert",
+            "eventSource": "user",
+            "eventTimestamp": 1750000000000 + i * 100,
+            "textDelta": {"ops": [{"retain": i}, {"insert": "a"}]},
+            "currentDoc": "a" * i,
+            "currentCursor": {"index": i, "length": 0},
+        }
+        for i in range(n_logs)
+    ]
+
+
+def make_session(n_actions):
+    history = ActionHistory()
+    history.extend(
+        [
+            {
+                "action_type": "insert_text",
+                "level_1_action_type": "insert_text",
+                "level_3_action_type": "compose_sentence",
+                "action_delta": ["INSERT", i * 10, 10],
+                "action_start_time": "2025/06/20 12:00:00",
+                "action_end_time": "2025/06/20 12:00:05",
+                "action_start_writing": "a" * i * 10,
+                "action_end_writing": "a" * (i + 1) * 10,
+            }
+            for i in range(n_actions)
+        ]
+    )
+    return {
+        "session_id": "0" * 32,
+        "access_code": "demo",
+        "verification_code": "0" * 32,
+        "start_timestamp": time(),
+        "last_query_timestamp": time(),
+        "show_interventions": True,
+        "current_action_in_progress": None,
+        "parsed_actions": history,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_logs", type=int, default=2000)
+    parser.add_argument("--n_actions", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    codec = SessionTokenCodec("benchmark-secret")
+    session = make_session(args.n_actions)
+
+    start = perf_counter()
+    for _ in range(args.repeat):
+        token = encode_session(codec, session, n_actions=args.n_actions)
+    encode_time = (perf_counter() - start) / args.repeat
+
+    start = perf_counter()
+    for _ in range(args.repeat):
+        session_from_token_state(codec.decode(token))
+    decode_time = (perf_counter() - start) / args.repeat
+
+    logs_size = len(json.dumps(make_logs(args.n_logs)))
+    print(f"Token size:         {len(token)} bytes")
+    print(f"Logs payload size:  {logs_size} bytes ({args.n_logs} logs)")
+    print(f"Token overhead:     {100 * len(token) / logs_size:.2f}% of the request payload")
+    print(f"Encode time:        {encode_time * 1e6:.1f} us")
+    print(f"Decode time:        {decode_time * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Write the document snapshot sidecars of the session logs of an archive.
+
+The server writes the snapshots of a log when it is saved or checkpointed (see
+coauthor_interface/backend/doc_snapshots.py); /api/seek_log only reads them.
+This adds the missing or stale sidecars of every log under --log_dir, e.g.,
+of logs saved before snapshots were written. Each sidecar is appended to or
+atomically replaced, so the server can keep running.
+
+Usage: python scripts/build_snapshots.py --log_dir ../logs [--interval 100] [--workers 8]
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from coauthor_interface.backend.doc_snapshots import DocumentSnapshots
+from coauthor_interface.backend.log_index import is_log_file
+
+
+def find_logs(log_dir):
+    for root, _, names in os.walk(log_dir):
+        for name in names:
+            if is_log_file(name):
+                yield os.path.join(root, name)
+
+
+def build(path, interval):
+    """Return True if the snapshots of one log are up to date."""
+    try:
+        DocumentSnapshots(interval=interval).update(path)
+    except Exception as e:
+        print(f"# Failed to build the snapshots of {path}: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log_dir", type=str, required=True)
+    parser.add_argument("--interval", type=int, default=100)  # The server's --snapshot_interval
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    paths = sorted(find_logs(args.log_dir))
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(build, paths, [args.interval] * len(paths), chunksize=16))
+    n_failed = results.count(False)
+    print(f"Built the snapshots of {len(paths) - n_failed} logs ({n_failed} failed)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
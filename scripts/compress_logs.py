@@ -0,0 +1,101 @@
+"""
+Compress the session logs of an archive in parallel.
+
+Every plain .json/.jsonl log under --log_dir is replaced by a .gz or .zst copy
+that read_log and /api/get_log read transparently. Logs modified within the
+last --min_age seconds are skipped, since they may belong to live sessions
+that are still appended to. With --verify, each compressed copy is read back
+and compared with the original before the original is removed.
+
+Usage: python scripts/compress_logs.py --log_dir ../logs [--compression gzip] [--workers 8] [--verify]
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter, time
+
+from coauthor_interface.backend.log_compression import COMPRESSIONS, check_compression, compress_log_file
+from coauthor_interface.backend.log_index import is_log_file
+from coauthor_interface.backend.reader import read_log
+
+
+def find_logs(log_dir, min_age):
+    now = time()
+    for root, _, names in os.walk(log_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            if not is_log_file(name) or name.endswith((".gz", ".zst")):
+                continue
+            if now - os.path.getmtime(path) < min_age:
+                continue
+            yield path
+
+
+def compress(path, compression, level, verify):
+    """Compress one log and return (original size, compressed size), or None on failure."""
+    try:
+        size = os.path.getsize(path)
+        compressed_path = compress_log_file(path, compression, level=level, remove=not verify)
+        if verify:
+            if read_log(compressed_path) != read_log(path):
+                os.remove(compressed_path)
+                print(f"# Compressed copy of {path} does not match; keeping the original")
+                return None
+            os.remove(path)
+        return size, os.path.getsize(compressed_path)
+    except Exception as e:
+        print(f"# Failed to compress {path}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log_dir", type=str, required=True)
+    parser.add_argument("--compression", type=str, choices=COMPRESSIONS[1:], default="gzip")
+    parser.add_argument("--level", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--min_age", type=float, default=3600)  # Seconds since the last modification
+    parser.add_argument("--verify", action="store_true")
+    parser.add_argument("--dry_run", action="store_true")
+    args = parser.parse_args()
+    check_compression(args.compression)
+
+    paths = list(find_logs(args.log_dir, args.min_age))
+    print(f"Found {len(paths)} logs to compress")
+    if args.dry_run:
+        for path in paths:
+            print(path)
+        return
+
+    start = perf_counter()
+    original_bytes = 0
+    compressed_bytes = 0
+    n_failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = executor.map(
+            compress,
+            paths,
+            [args.compression] * len(paths),
+            [args.level] * len(paths),
+            [args.verify] * len(paths),
+            chunksize=16,
+        )
+        for result in results:
+            if result is None:
+                n_failed += 1
+                continue
+            original_bytes += result[0]
+            compressed_bytes += result[1]
+
+    elapsed = perf_counter() - start
+    print(f"Compressed {len(paths) - n_failed} logs in {elapsed:.1f}s ({n_failed} failed)")
+    if original_bytes:
+        print(
+            f"Size: {original_bytes / 1e6:.1f} MB -> {compressed_bytes / 1e6:.1f} MB "
+            f"({100 * compressed_bytes / original_bytes:.1f}%)"
+        )
+
+
+if __name__ == "__main__":
+    main()
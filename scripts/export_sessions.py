@@ -0,0 +1,113 @@
+"""
+Export the sessions of a log archive as one compressed file.
+
+Writes the sessions that match the filters (those of scripts/find_sessions.py)
+as gzipped NDJSON, one line per session with its metadata and log, or as a
+tar file of the logs and metadata.jsonl (see
+coauthor_interface/backend/log_export.py). Sessions are read one at a time,
+so memory does not grow with the size of the export. With --analyze, the
+actions of the post-session analysis (run_post_session_analysis) are computed
+in --workers processes and added to each session.
+
+Usage: python scripts/export_sessions.py --log_dir ../logs --output study.ndjson.gz [--format ndjson]
+       [--compression gzip] [--analyze] [--workers 8] [--domain story] [--start 2024-05-01] [--min_events 100]
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+from time import perf_counter
+
+from coauthor_interface.backend.log_compression import COMPRESSIONS, check_compression
+from coauthor_interface.backend.log_export import EXPORT_FORMATS, SessionExporter, iter_sessions
+from coauthor_interface.backend.log_index import LogPathIndex
+from coauthor_interface.backend.log_storage import FileLogStorage, SQLiteLogStorage
+from coauthor_interface.backend.metrics import METRICS
+from coauthor_interface.backend.session_query import SessionQueryIndex
+
+
+def parse_time(value):
+    """Return the timestamp (seconds) of an ISO date or time, or of a number of seconds."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_bool(value):
+    return value.lower() == "true"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log_dir", type=str, required=True)
+    parser.add_argument("--replay_dir", type=str, default=None)  # Where the logs are; --log_dir by default
+    parser.add_argument(
+        "--log_db", type=str, default=None
+    )  # Export from a log database (--log_storage sqlite)
+    parser.add_argument("--output", type=str, default=None)  # Standard output by default
+    parser.add_argument("--format", type=str, choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--compression", type=str, choices=COMPRESSIONS, default="gzip")
+    parser.add_argument("--level", type=int, default=None)
+    parser.add_argument("--analyze", action="store_true")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--access_code", type=str, default=None)
+    parser.add_argument("--domain", type=str, default=None)
+    parser.add_argument("--engine", type=str, default=None)
+    parser.add_argument("--show_interventions", type=parse_bool, default=None)
+    parser.add_argument("--start", type=parse_time, default=None)  # Sessions started at or after
+    parser.add_argument("--end", type=parse_time, default=None)  # Sessions started before
+    parser.add_argument("--min_events", type=int, default=None)
+    parser.add_argument("--max_events", type=int, default=None)
+    args = parser.parse_args()
+    check_compression(args.compression)
+
+    if args.log_db:
+        storage = index = SQLiteLogStorage(args.log_db)
+    else:
+        path_index = LogPathIndex(args.replay_dir or args.log_dir, check_interval=0)
+        storage = FileLogStorage(args.log_dir, path_index=path_index)
+        index = SessionQueryIndex(
+            os.path.join(args.log_dir, "sessions.db"),
+            metadata_path=os.path.join(args.log_dir, "metadata.txt"),
+            path_index=path_index,
+            reader=storage.reader,
+        )
+    filters = {
+        name: getattr(args, name)
+        for name in (
+            "access_code",
+            "domain",
+            "engine",
+            "show_interventions",
+            "start",
+            "end",
+            "min_events",
+            "max_events",
+        )
+    }
+    exporter = SessionExporter(
+        storage, args.format, args.compression, args.level, analyze=args.analyze, workers=args.workers
+    )
+
+    start = perf_counter()
+    f = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in exporter.iter_export(iter_sessions(index, **filters)):
+            f.write(chunk)
+    finally:
+        if args.output:
+            f.close()
+    index.close()
+
+    counters = METRICS.snapshot()["counters"]
+    print(
+        f"Exported {counters.get('export_sessions_written', 0)} sessions"
+        f" ({counters.get('export_bytes_written', 0) / 1e6:.1f} MB) in {perf_counter() - start:.1f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
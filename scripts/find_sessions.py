@@ -0,0 +1,97 @@
+"""
+Find the sessions of a log archive by their metadata and number of events.
+
+Queries the session index of --log_dir (<log_dir>/sessions.db, shared with the
+server and updated with the records appended to metadata.txt and the logs
+saved since the last query; see coauthor_interface/backend/session_query.py),
+or the log database given with --log_db. Prints one CSV row per session, or
+the full metadata records as JSON lines with --format jsonl.
+
+Usage: python scripts/find_sessions.py --log_dir ../logs [--access_code demo] [--domain story] [--engine gpt-4]
+       [--show_interventions true] [--start 2024-05-01] [--end 2024-06-01] [--min_events 100]
+       [--max_events 5000] [--offset 0] [--limit 100] [--format csv]
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+
+from coauthor_interface.backend.log_index import LogPathIndex
+from coauthor_interface.backend.log_storage import SQLiteLogStorage
+from coauthor_interface.backend.session_query import SessionQueryIndex
+
+FIELDS = ["session_id", "access_code", "domain", "engine", "show_interventions", "start_time", "n_events"]
+
+
+def parse_time(value):
+    """Return the timestamp (seconds) of an ISO date or time, or of a number of seconds."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_bool(value):
+    return value.lower() == "true"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log_dir", type=str, required=True)
+    parser.add_argument("--replay_dir", type=str, default=None)  # Where the logs are; --log_dir by default
+    parser.add_argument("--log_db", type=str, default=None)  # Query a log database (--log_storage sqlite)
+    parser.add_argument("--access_code", type=str, default=None)
+    parser.add_argument("--domain", type=str, default=None)
+    parser.add_argument("--engine", type=str, default=None)
+    parser.add_argument("--show_interventions", type=parse_bool, default=None)
+    parser.add_argument("--start", type=parse_time, default=None)  # Sessions started at or after
+    parser.add_argument("--end", type=parse_time, default=None)  # Sessions started before
+    parser.add_argument("--min_events", type=int, default=None)
+    parser.add_argument("--max_events", type=int, default=None)
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=None)  # All matching sessions by default
+    parser.add_argument("--format", type=str, choices=["csv", "jsonl"], default="csv")
+    args = parser.parse_args()
+
+    if args.log_db:
+        index = SQLiteLogStorage(args.log_db)
+    else:
+        index = SessionQueryIndex(
+            os.path.join(args.log_dir, "sessions.db"),
+            metadata_path=os.path.join(args.log_dir, "metadata.txt"),
+            path_index=LogPathIndex(args.replay_dir or args.log_dir, check_interval=0),
+        )
+    filters = {
+        name: getattr(args, name)
+        for name in (
+            "access_code",
+            "domain",
+            "engine",
+            "show_interventions",
+            "start",
+            "end",
+            "min_events",
+            "max_events",
+        )
+    }
+    sessions = index.find_sessions(offset=args.offset, limit=args.limit, **filters)
+
+    if args.format == "jsonl":
+        for session in sessions:
+            sys.stdout.write(json.dumps(session) + "\n")
+    else:
+        writer = csv.DictWriter(sys.stdout, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for session in sessions:
+            start_timestamp = session.get("start_timestamp")
+            start_time = datetime.fromtimestamp(start_timestamp).isoformat() if start_timestamp else None
+            writer.writerow(dict(session, start_time=start_time))
+    print(f"Found {len(sessions)} sessions ({index.count_sessions(**filters)} in total)", file=sys.stderr)
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Import a log archive into an SQLite log database.
+
+Copies the session metadata records of <log_dir>/metadata.txt and every log
+under --log_dir (see coauthor_interface/backend/log_storage.py) into --log_db,
+so that a server started with --log_storage sqlite serves the sessions saved
+before. Logs that are already in the database with the same number of events
+are skipped, so the import can be run again after more sessions are saved.
+
+Usage: python scripts/import_logs.py --log_dir ../logs [--log_db ../logs/logs.db] [--batch_size 256]
+"""
+
+import argparse
+import os
+import sys
+
+from coauthor_interface.backend.log_storage import DEFAULT_BATCH_SIZE, FileLogStorage, SQLiteLogStorage
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log_dir", type=str, required=True)
+    parser.add_argument("--log_db", type=str, default=None)  # <log_dir>/logs.db by default
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE)  # Events per database row
+    args = parser.parse_args()
+
+    source = FileLogStorage(args.log_dir)
+    target = SQLiteLogStorage(
+        args.log_db or os.path.join(args.log_dir, "logs.db"), batch_size=args.batch_size
+    )
+
+    n_records = 0
+    for record in source.records():
+        target.record_session(record)
+        n_records += 1
+
+    n_imported = n_skipped = n_failed = 0
+    for session_id in sorted(source.sessions()):
+        try:
+            log = source.read_log(session_id)
+            try:
+                if target.count(session_id) == len(log):
+                    n_skipped += 1
+                    continue
+            except KeyError:
+                pass
+            target.save_log(session_id, log)
+            n_imported += 1
+        except Exception as e:
+            print(f"# Failed to import the log of {session_id}: {e}", file=sys.stderr)
+            n_failed += 1
+    target.close()
+    print(
+        f"Imported {n_records} metadata records and {n_imported} logs "
+        f"({n_skipped} already imported, {n_failed} failed) into {target.path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
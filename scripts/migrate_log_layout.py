@@ -0,0 +1,39 @@
+"""
+Move the session logs of a project into the sharded layout.
+
+Moves every log saved directly in <log_dir>/<proj_name> (the flat layout), and
+its sidecar files, into the shard directories of its session (see
+coauthor_interface/backend/log_layout.py). The server keeps finding flat logs,
+so the migration can run while it is serving: a session checkpointed in the
+flat layout continues in its shard once its files are moved. Logs that are
+still being written (hidden .ingest-* files) are left in place. Logs are
+stored flat by default, so start the server with the same --log_shard_depth
+before migrating, and keep it.
+
+Usage: python scripts/migrate_log_layout.py --log_dir ../logs --proj_name demo [--log_shard_depth 2] [--dry_run]
+"""
+
+import argparse
+import os
+
+from coauthor_interface.backend.log_layout import SHARDED_DEPTH, migrate_to_sharded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log_dir", type=str, required=True)
+    parser.add_argument("--proj_name", type=str, required=True)
+    parser.add_argument("--log_shard_depth", type=int, default=SHARDED_DEPTH)
+    parser.add_argument("--dry_run", action="store_true")  # Report what would be moved
+    args = parser.parse_args()
+
+    if args.log_shard_depth <= 0:
+        parser.error("--log_shard_depth must be positive")
+    proj_dir = os.path.join(args.log_dir, args.proj_name)
+    results = migrate_to_sharded(proj_dir, depth=args.log_shard_depth, dry_run=args.dry_run)
+    action = "Would move" if args.dry_run else "Moved"
+    print(f"{action} {results['moved']} files ({len(results['skipped'])} skipped) in {proj_dir}")
+
+
+if __name__ == "__main__":
+    main()
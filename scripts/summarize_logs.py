@@ -0,0 +1,76 @@
+"""
+Tabulate the summaries of the session logs of an archive.
+
+Reads the summary sidecar of every log under --log_dir (see
+coauthor_interface/backend/log_summary.py) and writes one CSV row per session.
+Logs without a summary (e.g., saved before summaries were written) are
+summarized once, and their summaries are saved unless --no_save is given.
+
+Usage: python scripts/summarize_logs.py --log_dir ../logs [--output summaries.csv] [--workers 8]
+"""
+
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from coauthor_interface.backend.log_index import get_session_id_of_log, is_log_file
+from coauthor_interface.backend.log_summary import MASK_AUTHORS, load_summary
+
+FIELDS = ["session_id", "n_events", "duration", "n_characters"] + [
+    f"{author}_fraction" for author in MASK_AUTHORS.values()
+]
+
+
+def find_logs(log_dir):
+    for root, _, names in os.walk(log_dir):
+        for name in names:
+            if is_log_file(name):
+                yield os.path.join(root, name)
+
+
+def summarize(path, save):
+    """Return the CSV row of one log, or None on failure."""
+    try:
+        summary = load_summary(path, save=save)
+    except Exception as e:
+        print(f"# Failed to summarize {path}: {e}", file=sys.stderr)
+        return None
+    row = {
+        "session_id": get_session_id_of_log(os.path.basename(path)),
+        "n_events": summary["n_events"],
+        "duration": summary["duration"],
+        "n_characters": len(summary["last_text"]),
+    }
+    for author, fraction in summary["authorship"].items():
+        row[f"{author}_fraction"] = round(fraction, 4)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log_dir", type=str, required=True)
+    parser.add_argument("--output", type=str, default=None)  # Standard output by default
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--no_save", action="store_true")
+    args = parser.parse_args()
+
+    paths = sorted(find_logs(args.log_dir))
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        rows = list(executor.map(summarize, paths, [not args.no_save] * len(paths), chunksize=16))
+
+    f = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(row for row in rows if row is not None)
+    finally:
+        if args.output:
+            f.close()
+    n_failed = sum(row is None for row in rows)
+    print(f"Summarized {len(paths) - n_failed} logs ({n_failed} failed)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
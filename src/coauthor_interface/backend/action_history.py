@@ -0,0 +1,143 @@
+"""
+Bounded history of parsed actions for a live session.
+
+A live session only needs the most recent actions to detect level 3 patterns,
+so `ActionHistory` keeps a fixed-size window of recent actions together with
+compact rolling aggregates (counts per action type and character totals).
+The full history is appended to a JSONL file on disk when a path is given,
+which keeps per-session memory flat regardless of the session length. Each `extend` serializes its actions once and appends them with a
+single write, which a `WriteBehindWriter` batches with the appends of other
+requests (see write_behind.py).
+"""
+
+import collections
+import json
+
+DEFAULT_WINDOW_SIZE = 50
+
+ACTION_TYPE_LEVELS = ("level_1_action_type", "level_2_action_type", "level_3_action_type")
+
+
+class ActionHistory:
+    def __init__(self, window_size=DEFAULT_WINDOW_SIZE, history_path=None):
+        self.window_size = window_size
+        self.history_path = history_path
+
+        self.window = collections.deque(maxlen=window_size)
+        self.total_count = 0
+        self.type_counts = {level: collections.Counter() for level in ACTION_TYPE_LEVELS}
+        self.inserted_chars = 0
+        self.deleted_chars = 0
+        self.last_action_end_time = None
+
+    def __len__(self):
+        """Number of actions currently held in the window."""
+        return len(self.window)
+
+    def __iter__(self):
+        return iter(self.window)
+
+    def extend(self, actions, writer=None):
+        """Add new actions to the window, update aggregates, and persist them.
+
+        With `writer` (a WriteBehindWriter), the actions are queued for the background thread
+        instead of being written on the calling thread.
+        """
+        if not actions:
+            return
+
+        self.window.extend(actions)
+        self.total_count += len(actions)
+
+        for action in actions:
+            for level in ACTION_TYPE_LEVELS:
+                action_type = action.get(level)
+                if action_type:
+                    self.type_counts[level][action_type] += 1
+
+            delta = action.get("action_delta")
+            if delta and len(delta) >= 3:
+                if delta[0] == "INSERT":
+                    self.inserted_chars += delta[2]
+                elif delta[0] == "DELETE":
+                    self.deleted_chars += delta[2]
+
+            if action.get("action_end_time"):
+                self.last_action_end_time = action["action_end_time"]
+
+        if self.history_path:
+            self.append_to_file(actions, writer)
+
+    def append_to_file(self, actions, writer=None):
+        try:
+            data = "".join(json.dumps(action, default=str) + "\n" for action in actions)
+            if writer is not None:
+                writer.append(self.history_path, data)
+            else:
+                with open(self.history_path, "a") as f:
+                    f.write(data)
+        except Exception as e:
+            print("Failed to write action history")
+            print(e)
+
+    def recent(self, n_actions=None):
+        """Return the last `n_actions` actions in the window (all of them if None)."""
+        if n_actions is None or n_actions >= len(self.window):
+            return list(self.window)
+        if n_actions <= 0:
+            return []
+        return list(self.window)[-n_actions:]
+
+    def count(self, action_type, level="level_3_action_type"):
+        """Number of actions of `action_type` seen over the whole session."""
+        return self.type_counts[level][action_type]
+
+    def summarize(self):
+        return {
+            "total_count": self.total_count,
+            "window_count": len(self.window),
+            "type_counts": {level: dict(counter) for level, counter in self.type_counts.items()},
+            "inserted_chars": self.inserted_chars,
+            "deleted_chars": self.deleted_chars,
+            "last_action_end_time": self.last_action_end_time,
+        }
+
+    def to_state(self, n_actions=None):
+        """Compact, JSON-serializable state: the last `n_actions` actions and the aggregates.
+
+        Raw logs are dropped from the actions to keep the state small.
+        """
+        recent = [
+            {key: value for key, value in action.items() if key != "action_logs"}
+            for action in self.recent(n_actions)
+        ]
+        return {
+            "window_size": self.window_size,
+            "recent": recent,
+            "total_count": self.total_count,
+            "type_counts": {level: dict(counter) for level, counter in self.type_counts.items()},
+            "inserted_chars": self.inserted_chars,
+            "deleted_chars": self.deleted_chars,
+            "last_action_end_time": self.last_action_end_time,
+        }
+
+    @classmethod
+    def from_state(cls, state, window_size=None, history_path=None):
+        """Rebuild a history from `to_state` output (an empty history if `state` is None)."""
+        state = state or {}
+        history = cls(
+            window_size=window_size or state.get("window_size", DEFAULT_WINDOW_SIZE),
+            history_path=history_path,
+        )
+        history.window.extend(state.get("recent", []))
+        history.total_count = state.get("total_count", 0)
+        for level, counts in state.get("type_counts", {}).items():
+            history.type_counts[level].update(counts)
+        history.inserted_chars = state.get("inserted_chars", 0)
+        history.deleted_chars = state.get("deleted_chars", 0)
+        history.last_action_end_time = state.get("last_action_end_time")
+        return history
+
+    def to_json(self):
+        """JSON representation used when a session is written to the metadata file."""
+        return list(self.window)
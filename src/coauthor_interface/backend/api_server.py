@@ -2,32 +2,71 @@
 Starts a Flask server that handles API requests from the frontend.
 """
 
-import gc
+import atexit
 import os
 import random
+import signal
 import warnings
 from argparse import ArgumentParser
 from time import time
 
 import openai
 from openai import OpenAI
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS, cross_origin
+from werkzeug.exceptions import BadRequest
 
+from coauthor_interface import json_codec
 from coauthor_interface.thought_toolkit.active_plugins import ACTIVE_PLUGINS
+from coauthor_interface.backend.action_history import DEFAULT_WINDOW_SIZE, ActionHistory
 from coauthor_interface.backend.helper import (
     append_session_to_file,
     compute_stats,
     get_config_for_log,
     get_context_window_size,
+    get_last_document_from_log,
     get_last_text_from_log,
     get_uuid,
     print_current_sessions,
     print_verbose,
-    retrieve_log_paths,
     save_log_to_jsonl,
+    shard_for_session,
     check_for_level_3_actions,
 )
+from coauthor_interface.backend.coalesce import RequestCoalescer
+from coauthor_interface.backend.config_cache import ConfigCache
+from coauthor_interface.backend.doc_snapshots import DocumentSnapshots
+from coauthor_interface.backend.gc_policy import GC_MODES, GCPolicy
+from coauthor_interface.backend.log_checkpoint import CheckpointGapError, LogCheckpointer, LogSealedError
+from coauthor_interface.backend.log_compression import (
+    COMPRESSIONS,
+    check_compression,
+    compress_log_file,
+    get_compressed_path,
+)
+from coauthor_interface.backend.log_export import (
+    SessionExporter,
+    get_export_mimetype,
+    get_export_name,
+    iter_sessions,
+)
+from coauthor_interface.backend.log_index import LogPathIndex
+from coauthor_interface.backend.log_ingest import LogIngestor, StreamingParseError, parse_streaming_object
+from coauthor_interface.backend.log_layout import DEFAULT_SHARD_DEPTH, get_session_path
+from coauthor_interface.backend.log_reader import LogReader
+from coauthor_interface.backend.log_storage import (
+    DEFAULT_BATCH_SIZE,
+    QUERY_FILTERS,
+    STORAGES,
+    FileLogStorage,
+    SQLiteLogStorage,
+)
+from coauthor_interface.backend.log_summary import read_summary, remove_summary, summarize_log, write_summary
+from coauthor_interface.backend.memory import read_memory_usage
+from coauthor_interface.backend.metadata_index import MetadataIndex
+from coauthor_interface.backend.metrics import METRICS
+from coauthor_interface.backend.overload import DEGRADED, NORMAL, SHEDDING, LoadMonitor
 from coauthor_interface.backend.parsing import (
     filter_suggestions,
     parse_probability,
@@ -46,14 +85,20 @@ from coauthor_interface.thought_toolkit.parser_helper import (
 )
 from coauthor_interface.thought_toolkit.utils import get_spacy_similarity
 
+from coauthor_interface.backend.session_query import SessionQueryIndex
+from coauthor_interface.backend.session_store import SessionStore
+from coauthor_interface.backend.write_behind import WriteBehindWriter
+from coauthor_interface.backend.session_token import (
+    DEFAULT_MAX_TOKEN_SIZE,
+    SessionTokenCodec,
+    SessionTokenError,
+    encode_session,
+    session_from_token_state,
+)
 from coauthor_interface.backend.reader import (
-    read_access_codes,
     read_api_keys,
     read_blocklist,
-    read_examples,
     read_log,
-    read_prompts,
-    update_metadata,
 )
 
 from coauthor_interface.thought_toolkit.PluginInterface import InterventionEnum
@@ -62,13 +107,69 @@ warnings.filterwarnings("ignore", category=FutureWarning)
 
 DEV_MODE = os.getenv("DEV_MODE", "false").lower() == "true"
 
-SESSIONS = dict()
+SESSIONS = SessionStore()  # Idle sessions can be spilled to disk (see --session_spill_dir)
+PARSE_LOGS_COALESCER = RequestCoalescer("parse_logs")
+LOAD_MONITOR = LoadMonitor()  # Set with --max_queue_depth, --max_cpu_load, --max_upstream_calls
+CONFIG_CACHE = ConfigCache()  # Reloads changed files in config_dir (see --config_check_interval)
+METADATA_INDEX = MetadataIndex()  # Offsets of the records in metadata.txt
+LOG_CHECKPOINTS = LogCheckpointer()  # Appends checkpoints of session logs (see --checkpoint_fsync_interval)
+LOG_PATH_INDEX = LogPathIndex()  # Paths of the logs in replay_dir (see --log_index_check_interval)
+LOG_READER = LogReader()  # Reads ranges of events with line-offset indexes of the logs
+LOG_SNAPSHOTS = DocumentSnapshots(reader=LOG_READER)  # Set with --snapshot_interval
+SESSION_QUERY_INDEX = SessionQueryIndex()  # Sessions and event counts for /api/find_sessions
+GC_POLICY = GCPolicy()  # Set with --gc_mode, --gc_interval, --gc_thresholds, --gc_freeze
+WRITE_BEHIND = WriteBehindWriter()  # Writes metadata and logs off the request threads (see --write_behind_*)
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes and decodes request and response bodies with json_codec."""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {"separators"} or json_codec.current_codec().name == "stdlib":
+            return super().dumps(obj, **kwargs)  # e.g., indented output in debug mode
+        return json_codec.dumps(obj, default=self.default, sort_keys=self.sort_keys)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return json_codec.loads(s)
+
+
 app = Flask(__name__)
+app.json = CodecJSONProvider(app)
 CORS(app)  # For Access-Control-Allow-Origin
 
 SUCCESS = True
 FAILURE = False
 
+DEFAULT_QUERY_LIMIT = 100  # Sessions per page of /api/find_sessions
+MAX_QUERY_LIMIT = 1000
+
+# Defaults for settings that are overwritten by command-line arguments in __main__
+proj_dir = None
+action_window_size = DEFAULT_WINDOW_SIZE
+log_compression = "none"  # Compression of saved logs (see --log_compression)
+log_compression_level = None
+session_tokens = None  # SessionTokenCodec in stateless session mode (see --stateless_sessions)
+ready = False  # Set once the process is configured and serving requests
+session_shard = None  # (index, count) of this worker when sessions are sharded across workers (see router.py)
+write_ack_timeout = 0.0  # Seconds end_session waits for its log to be durable (see --write_ack_timeout)
+stream_ingest_min_bytes = 0  # end_session bodies this large are parsed as a stream; 0 disables
+log_shard_depth = 0  # Directory levels of the sharded log layout; 0 stores logs directly in proj_dir
+log_storage = None  # SQLiteLogStorage with --log_storage sqlite; metadata and logs are files otherwise
+export_storage = None  # LogStorage the logs of /api/export_sessions are read from
+export_workers = 1  # Processes analyzing exported sessions (see --export_workers)
+
+
+@app.before_request
+def track_request_start():
+    LOAD_MONITOR.request_started()
+
+
+@app.teardown_request
+def track_request_end(exception=None):
+    LOAD_MONITOR.request_finished()
+
 
 @app.route("/api/start_session", methods=["POST"])
 @cross_origin(origin="*")
@@ -76,125 +177,425 @@ def start_session():
     content = request.json
     result = {}
 
-    # Read latest prompts, examples, and access codes
-    # pylint: disable=possibly-used-before-assignment
-    examples = read_examples(config_dir)
-    prompts = read_prompts(config_dir)
-    # pylint: enable=possibly-used-before-assignment
-    allowed_access_codes = read_access_codes(config_dir)
+    load_level = LOAD_MONITOR.level()
+    if load_level == SHEDDING:
+        METRICS.increment("start_session_shed")
+        result["status"] = FAILURE
+        result["message"] = "The server is currently busy. Please try again in a moment."
+        result["retry_after"] = LOAD_MONITOR.retry_after
+        response = jsonify(result)
+        response.status_code = 503
+        response.headers["Retry-After"] = str(LOAD_MONITOR.retry_after)
+        return response
+
+    # Latest prompts, examples, and access codes (under load, skip checking config_dir for changes)
+    current_config = CONFIG_CACHE.get(check=load_level == NORMAL)
+    current_examples = current_config.examples
+    current_prompts = current_config.prompts
+    current_access_codes = current_config.access_codes
 
     # Check access codes
     access_code = content["accessCode"]
-    if access_code not in allowed_access_codes:
+    if access_code not in current_access_codes:
         if not access_code:
             access_code = "(not provided)"
         result["status"] = FAILURE
         result["message"] = f"Invalid access code: {access_code}. Please check your access code in URL."
-        print_current_sessions(SESSIONS, "Invalid access code")
+        print_current_sessions(SESSIONS.resident(), "Invalid access code")
         return jsonify(result)
 
-    config = allowed_access_codes[access_code]
+    config = current_access_codes[access_code]
 
     # Setup a new session
-    session_id = get_uuid()  # Generate unique session ID
+    session_id = new_session_id()  # Generate unique session ID
     verification_code = session_id
 
     # Information returned to user
     result = {
         "access_code": access_code,
         "session_id": session_id,
-        "example_text": examples[config.example],
-        "prompt_text": prompts[config.prompt],
+        "example_text": current_examples[config.example],
+        "prompt_text": current_prompts[config.prompt],
     }
     result.update(config.convert_to_dict())
 
+    # Keep only a bounded window of parsed actions in memory; the full history goes to disk
+    parsed_actions = ActionHistory(
+        window_size=action_window_size, history_path=get_action_history_path(session_id)
+    )
+
     # Information stored on the server
-    SESSIONS[session_id] = {
+    session = {
         "access_code": access_code,
         "session_id": session_id,
         "start_timestamp": time(),
         "last_query_timestamp": time(),
         "verification_code": verification_code,
-        "parsed_actions": [],
+        "parsed_actions": parsed_actions,
         "current_action_in_progress": None,
     }
-    SESSIONS[session_id].update(config.convert_to_dict())
-    SESSIONS[session_id]["active_plugins"] = str([plugin.get_plugin_name() for plugin in ACTIVE_PLUGINS])
-    SESSIONS[session_id]["researcher_notes"] = ""
+    session.update(config.convert_to_dict())
+    session["active_plugins"] = str([plugin.get_plugin_name() for plugin in ACTIVE_PLUGINS])
+    session["researcher_notes"] = ""
+
+    if session_tokens is not None:
+        # Stateless mode: the client carries the session state
+        try:
+            result["session_token"] = encode_session(session_tokens, session)
+        except SessionTokenError as e:
+            print(f"# Failed to create the session token of {session_id}: {e}")
+            return jsonify({"status": FAILURE, "message": f"Failed to create the session token: {e}"})
+    else:
+        SESSIONS[session_id] = session
 
     result["status"] = SUCCESS
 
-    session = SESSIONS[session_id]
     model_name = result["engine"].strip()
     domain = result["domain"] if "domain" in result else ""
 
     # pylint: disable=possibly-used-before-assignment
-    append_session_to_file(session, metadata_path)
+    if log_storage is not None:
+        try:
+            log_storage.record_session(session)
+        except Exception as e:
+            print(f"# Failed to record session {session_id}: {e}")
+    else:
+        append_session_to_file(session, metadata_path, writer=WRITE_BEHIND)
     print_verbose("New session created", session, verbose)
     # pylint: disable=possibly-used-before-assignment
 
     print_current_sessions(
-        SESSIONS,
+        SESSIONS.resident(),
         f"Session {session_id} ({domain}: {model_name}) has been started successfully.",
     )
 
-    gc.collect(generation=2)
+    GC_POLICY.collect_after_request()
     return jsonify(result)
 
 
+def new_session_id():
+    """Issue a session ID; when sessions are sharded, retry until the ID maps to this worker."""
+    session_id = get_uuid()
+    if session_shard is not None:
+        index, count = session_shard
+        while shard_for_session(session_id, count) != index:
+            session_id = get_uuid()
+    return session_id
+
+
+def get_session_log_path(session_id, suffix=".jsonl"):
+    """Return the path of the log (or another file) of a session in the project directory (see log_layout.py)."""
+    return get_session_path(proj_dir, session_id, suffix, depth=log_shard_depth)
+
+
+def get_metadata_store():
+    """Return the store of the session metadata records (anything with a get(session_id) method)."""
+    return log_storage if log_storage is not None else METADATA_INDEX
+
+
+def get_action_history_path(session_id):
+    if not proj_dir:
+        return None
+    return get_session_log_path(session_id, ".actions.jsonl")
+
+
+def get_request_session(content, session_id):
+    """Return the session of a request, or None if it is not valid.
+
+    In stateless mode, the session is rebuilt from the token sent by the client;
+    otherwise it is looked up in SESSIONS.
+    """
+    if session_tokens is not None and content.get("session_token"):
+        try:
+            state = session_tokens.decode(content["session_token"])
+        except SessionTokenError as e:
+            print(f"# Invalid session token for {session_id}: {e}")
+            return None
+        if state.get("session_id") != session_id:
+            print(f"# Session token does not belong to {session_id}")
+            return None
+        return session_from_token_state(
+            state, window_size=action_window_size, history_path=get_action_history_path(session_id)
+        )
+    return SESSIONS.get(session_id)
+
+
+def update_request_session(session_id, session, **fields):
+    """Set fields of the session of a request and return the session.
+
+    In SESSIONS, the fields are set under the session lock on the stored session, so the
+    sweeper cannot spill it in between and drop the update, even if `session` was spilled
+    and paged back in since it was looked up.
+    """
+    if not session.get("stateless"):
+        try:
+            with SESSIONS.lock(session_id):
+                session = SESSIONS[session_id]
+                session.update(fields)
+                return session
+        except KeyError:
+            # The session ended in the meantime
+            pass
+    session.update(fields)
+    return session
+
+
 @app.route("/api/end_session", methods=["POST"])
 @cross_origin(origin="*")
 def end_session():
-    content = request.json
+    content, ingestor = read_end_session_body()
     session_id = content["sessionId"]
-    log = content["logs"]
     remove_session = content.get("remove_session", True)  # Default to True for backward compatibility
 
-    # pylint: disable=possibly-used-before-assignment
-    path = os.path.join(proj_dir, session_id) + ".jsonl"
-    # pylint: enable=possibly-used-before-assignment
+    # Logs stored in a database (see --log_storage) have no path
+    path = get_session_log_path(session_id) if log_storage is None else None
 
     results = {}
     results["path"] = path
-    try:
-        save_log_to_jsonl(path, log)
-        results["status"] = SUCCESS
-    except Exception as e:
-        results["status"] = FAILURE
-        results["message"] = str(e)
-        print(e)
+    if log_storage is not None:
+        results.update(store_session_log(session_id, content, ingestor, seal=remove_session))
+        n_events = results.get("persisted")
+    elif "events" in content:
+        # Checkpoint mode: append the events after the last checkpoint and seal the log at the end
+        results.update(checkpoint_log(path, content, seal=remove_session))
+        n_events = results.get("persisted")
+    elif ingestor is not None:
+        # The events were already streamed to a temporary file; move it into place behind queued writes
+        n_events = ingestor.n_events
+        path = get_compressed_path(path, log_compression)
+        results["path"] = path
+        ticket = WRITE_BEHIND.write(
+            path, lambda: commit_ingested_log(path, session_id, ingestor), on_superseded=ingestor.discard
+        )
+        results["durable"] = ticket.wait(write_ack_timeout)
+        if ticket.done and ticket.error is not None:
+            results["status"] = FAILURE
+            results["message"] = str(ticket.error)
+            print(ticket.error)
+        else:
+            results["status"] = SUCCESS
+    else:
+        log = content["logs"]
+        n_events = len(log)
+        path = get_compressed_path(path, log_compression)
+        results["path"] = path
+        # Written by the write-behind thread; "durable" tells whether it was fsynced within write_ack_timeout
+        ticket = WRITE_BEHIND.write(path, lambda: save_session_log(path, session_id, log))
+        results["durable"] = ticket.wait(write_ack_timeout)
+        if ticket.done and ticket.error is not None:
+            results["status"] = FAILURE
+            results["message"] = str(ticket.error)
+            print(ticket.error)
+        else:
+            results["status"] = SUCCESS
     print_verbose(
         "Save log to file",
         {
             "session_id": session_id,
-            "len(log)": len(log),
+            "len(log)": n_events,
             "status": results["status"],
         },
         verbose,
     )
 
+    # Sessions of stateless mode are not stored on the server
+    if session_tokens is not None and content.get("session_token"):
+        session = get_request_session(content, session_id)
+        results["verification_code"] = session["verification_code"] if session else "SERVER_ERROR"
+        GC_POLICY.collect_after_request()
+        return jsonify(results)
+
     # Remove a finished session only if remove_session is True
     try:
-        session = SESSIONS[session_id]
-        results["verification_code"] = session["verification_code"]
+        # Wait for in-flight analysis of this session before removing it
+        with SESSIONS.lock(session_id):
+            session = SESSIONS[session_id]
+            results["verification_code"] = session["verification_code"]
+            if remove_session:
+                SESSIONS.pop(session_id)
         if remove_session:
-            SESSIONS.pop(session_id)
             print_current_sessions(
-                SESSIONS,
+                SESSIONS.resident(),
                 f"Session {session_id} has been saved and removed successfully.",
             )
         else:
             print_current_sessions(
-                SESSIONS,
+                SESSIONS.resident(),
                 f"Session {session_id} has been saved successfully (session kept active).",
             )
     except Exception as e:
         print(e)
         print("# Error at the end of end_session; ignore")
         results["verification_code"] = "SERVER_ERROR"
-        print_current_sessions(SESSIONS, f"Session {session_id} has not been saved.")
+        print_current_sessions(SESSIONS.resident(), f"Session {session_id} has not been saved.")
+
+    GC_POLICY.collect_after_request()
+    return jsonify(results)
+
+
+def read_end_session_body():
+    """Return the content of an end_session request, and a LogIngestor if its logs were streamed.
 
-    gc.collect(generation=2)
+    Bodies of at least stream_ingest_min_bytes are parsed as a stream: their logs are written to a
+    temporary file event by event instead of being loaded into memory.
+    """
+    if not stream_ingest_min_bytes or (request.content_length or 0) < stream_ingest_min_bytes:
+        return request.json, None
+
+    ingestor = LogIngestor(
+        proj_dir,  # pylint: disable=possibly-used-before-assignment
+        compression=log_compression,
+        level=log_compression_level,
+        snapshot_interval=LOG_SNAPSHOTS.interval,
+    )
+    try:
+        content, n_events = parse_streaming_object(request.stream, "logs", ingestor.add)
+    except StreamingParseError as e:
+        ingestor.discard()
+        raise BadRequest(f"Failed to parse the request body: {e}") from e
+    except Exception:
+        ingestor.discard()
+        raise
+    ingestor.close()
+    if n_events is None or "sessionId" not in content:
+        # A checkpoint (or an invalid request); its events are in content
+        ingestor.discard()
+        return content, None
+    METRICS.increment("end_session_streamed")
+    return content, ingestor
+
+
+def store_session_log(session_id, content, ingestor=None, seal=False):
+    """Save the log of an end_session request to log_storage: a checkpoint, a streamed log, or a full log."""
+    if "events" in content:
+        return checkpoint_log(None, content, seal=seal)
+    results = dict()
+    try:
+        events = ingestor.events() if ingestor is not None else content["logs"]
+        results["persisted"] = log_storage.save_log(session_id, events)
+        results["durable"] = True  # Committed in a single transaction
+        results["status"] = SUCCESS
+    except Exception as e:
+        results["status"] = FAILURE
+        results["message"] = str(e)
+        print(e)
+    finally:
+        if ingestor is not None:
+            ingestor.discard()
+    return results
+
+
+def commit_ingested_log(path, session_id, ingestor):
+    """Move a streamed session log into place and write its summary."""
+    ingestor.commit(path)
+    LOG_PATH_INDEX.record(path)
+    try:
+        config = get_config_for_log(session_id, get_metadata_store()) or None
+        write_summary(path, ingestor.summarize(config))
+    except Exception as e:
+        print(f"# Failed to write the summary of {path}: {e}")
+
+
+def save_session_log(path, session_id, log):
+    """Save a full session log with its sidecars (document snapshots and summary)."""
+    save_log_to_jsonl(path, log)
+    LOG_PATH_INDEX.record(path)
+    update_snapshots(path, log)
+    update_summary(path, session_id, log)
+
+
+def update_snapshots(path, log=None):
+    """Add the document snapshots of newly saved events; failures do not fail the save."""
+    try:
+        LOG_SNAPSHOTS.update(path, log)
+    except Exception as e:
+        print(f"# Failed to update the document snapshots of {path}: {e}")
+
+
+def update_summary(path, session_id, log=None):
+    """Write the summary sidecar of a saved log (see log_summary.py); failures do not fail the save.
+
+    Without `log`, the saved log is memory-mapped rather than loaded (see log_reader.py).
+    """
+    try:
+        if log is None:
+            with LOG_READER.map_log(path) as log:
+                summary = summarize_saved_log(path, session_id, log)
+        else:
+            summary = summarize_saved_log(path, session_id, log)
+        write_summary(path, summary)
+    except Exception as e:
+        print(f"# Failed to write the summary of {path}: {e}")
+
+
+def summarize_saved_log(path, session_id, log):
+    try:
+        document = LOG_SNAPSHOTS.seek(path, event=len(log) - 1, log=log, replay=False) if log else None
+    except Exception as e:
+        print(f"# Failed to read the document snapshots of {path}: {e}")
+        document = None
+    text, mask = (document["text"], document["mask"]) if document else get_last_document_from_log(log)
+    config = get_config_for_log(session_id, get_metadata_store()) or None
+    return summarize_log(log, text, mask, config)
+
+
+def checkpoint_log(path, content, seal=False):
+    """Append the events of a checkpoint (content["seq"] and content["events"]) to a log."""
+    results = dict()
+    try:
+        if log_storage is not None:
+            results["persisted"] = log_storage.append_events(
+                content["sessionId"], content["seq"], content["events"], seal=seal
+            )
+            results["status"] = SUCCESS
+            return results
+        results["persisted"] = LOG_CHECKPOINTS.append(path, content["seq"], content["events"], seal=seal)
+        update_snapshots(path)
+        if seal and log_compression != "none":
+            # Sealed logs are no longer appended to
+            path = compress_log_file(path, log_compression, level=log_compression_level)
+            results["path"] = path
+        LOG_PATH_INDEX.record(path)
+        if seal:
+            update_summary(path, content["sessionId"])
+        else:
+            remove_summary(path)
+        results["status"] = SUCCESS
+    except CheckpointGapError as e:
+        # The frontend resends the events from the persisted count
+        results["status"] = FAILURE
+        results["message"] = str(e)
+        results["persisted"] = e.persisted
+    except LogSealedError as e:
+        results["status"] = FAILURE
+        results["message"] = str(e)
+    except Exception as e:
+        results["status"] = FAILURE
+        results["message"] = str(e)
+        print(e)
+    return results
+
+
+@app.route("/api/checkpoint_log", methods=["POST"])
+@cross_origin(origin="*")
+def checkpoint():
+    """Append the events logged since the last checkpoint of a session.
+
+    Expects {"sessionId", "seq", "events"}, where seq is the number of events
+    persisted so far (the index of the first event in events), and returns the
+    new number of persisted events as "persisted". Checkpoints of unknown sessions are rejected.
+    """
+    content = request.json
+    session_id = content["sessionId"]
+    if get_request_session(content, session_id) is None:
+        return jsonify({"status": FAILURE, "message": "Invalid session."})
+    path = get_session_log_path(session_id) if log_storage is None else None
+    results = checkpoint_log(path, content)
+    print_verbose(
+        "Checkpoint log",
+        {"session_id": session_id, "seq": content["seq"], "persisted": results.get("persisted")},
+        verbose,
+    )
     return jsonify(results)
 
 
@@ -209,21 +610,19 @@ def query():
     prev_suggestions = content["suggestions"]
 
     results = {}
-    try:
-        SESSIONS[session_id]["last_query_timestamp"] = time()
-    except Exception as e:
-        print(f"# Ignoring an error in query: {e}")
+    session = get_request_session(content, session_id)
 
     # Check if session ID is valid
-    if session_id not in SESSIONS:
+    if session is None:
         results["status"] = FAILURE
         results["message"] = (
             "Your session has not been established due to invalid access code. Please check your access code in URL."
         )
         return jsonify(results)
+    session = update_request_session(session_id, session, last_query_timestamp=time())
 
     example = content["example"]
-    example_text = examples[example]  # pylint: disable=possibly-used-before-assignment
+    example_text = CONFIG_CACHE.get().examples[example]
 
     # Overwrite example text if it is manually provided
     if "example_text" in content:
@@ -250,13 +649,23 @@ def query():
     if not stop_sequence:
         stop_sequence = None
 
-    # Step 2
-    detected_plugins = analyze_and_update_actions(session_id, logs)
+    # Step 2 (level 3 analysis is skipped when degraded, and the whole analysis when shedding load)
+    load_level = LOAD_MONITOR.level()
+    level_3 = load_level == NORMAL
+    if load_level == DEGRADED:
+        METRICS.increment("query_level_3_skipped")
+    if load_level == SHEDDING:
+        METRICS.increment("query_analysis_skipped")
+        detected_plugins = []
+    elif session.get("stateless"):
+        detected_plugins = analyze_session_actions(session, logs, level_3=level_3)
+    else:
+        detected_plugins = analyze_and_update_actions(session_id, logs, level_3=level_3)
 
     # Parse doc
     doc = content["doc"]
 
-    modify_prompt = SESSIONS[session_id]["show_interventions"] and True in [
+    modify_prompt = session["show_interventions"] and True in [
         plugin.intervention_action().intervention_type == InterventionEnum.MODIFY_QUERY
         for plugin in detected_plugins
     ]
@@ -268,6 +677,15 @@ def query():
 
     prompt = results["effective_prompt"]
 
+    # Under load, serve suggestions cached for the same prompt (or, when shedding, the latest ones)
+    cache_key = [prompt, n, max_tokens, temperature, top_p, presence_penalty, frequency_penalty, stop, engine]
+    if load_level != NORMAL:
+        cached_results = get_cached_suggestions(session, cache_key, allow_stale=load_level == SHEDDING)
+        if cached_results is not None:
+            METRICS.increment("query_served_from_cache")
+            add_session_token(cached_results, session)
+            return jsonify(cached_results)
+
     # Query GPT-3
     openai_start_time = time()
     try:
@@ -277,34 +695,35 @@ def query():
             openai_end_time = time()
         else:
             client = OpenAI(api_key=api_keys[("openai", "default")])  # pylint: disable=possibly-used-before-assignment
-            if "---" in prompt:  # If the demarcation is there, then suggest an insertion
-                prompt, suffix = prompt.split("---")
-                response = client.completions.create(  # NOTE: originally was openai.Completion.create, but that was deprecated
-                    model=engine,
-                    prompt=prompt,
-                    suffix=suffix,
-                    n=n,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    top_p=top_p,
-                    presence_penalty=presence_penalty,
-                    frequency_penalty=frequency_penalty,
-                    logprobs=10,
-                    stop=stop_sequence,
-                )
-            else:
-                response = client.completions.create(  # NOTE: originally was openai.Completion.create, but that was deprecated
-                    model=engine,
-                    prompt=prompt,
-                    n=n,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    top_p=top_p,
-                    presence_penalty=presence_penalty,
-                    frequency_penalty=frequency_penalty,
-                    logprobs=10,
-                    stop=stop_sequence,
-                )
+            with LOAD_MONITOR.upstream_call():
+                if "---" in prompt:  # If the demarcation is there, then suggest an insertion
+                    prompt, suffix = prompt.split("---")
+                    response = client.completions.create(  # NOTE: originally was openai.Completion.create, but that was deprecated
+                        model=engine,
+                        prompt=prompt,
+                        suffix=suffix,
+                        n=n,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        presence_penalty=presence_penalty,
+                        frequency_penalty=frequency_penalty,
+                        logprobs=10,
+                        stop=stop_sequence,
+                    )
+                else:
+                    response = client.completions.create(  # NOTE: originally was openai.Completion.create, but that was deprecated
+                        model=engine,
+                        prompt=prompt,
+                        n=n,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        presence_penalty=presence_penalty,
+                        frequency_penalty=frequency_penalty,
+                        logprobs=10,
+                        stop=stop_sequence,
+                    )
             openai_end_time = time()
             suggestions = []
             for choice in response.choices:
@@ -367,10 +786,35 @@ def query():
     }
     results["counts"] = counts
     results["openai_time"] = openai_end_time - openai_start_time
+    session = update_request_session(
+        session_id, session, cached_suggestions={"key": cache_key, "results": dict(results)}
+    )
+    add_session_token(results, session)
     print_verbose("Result", results, verbose)
     return jsonify(results)
 
 
+def get_cached_suggestions(session, cache_key, allow_stale=False):
+    """Return the latest results of /api/query for a session if they match `cache_key`.
+
+    With `allow_stale`, the latest results are returned even if the prompt changed.
+    """
+    cached = session.get("cached_suggestions")
+    if cached is None or (cached["key"] != cache_key and not allow_stale):
+        return None
+    return {**cached["results"], "cached": True, "openai_time": 0}
+
+
+def add_session_token(results, session):
+    """Return the updated session state to the client in stateless mode."""
+    if session.get("stateless"):
+        try:
+            results["session_token"] = encode_session(session_tokens, session)
+        except SessionTokenError as e:
+            results["status"] = FAILURE
+            results["message"] = str(e)
+
+
 @app.route("/api/get_log", methods=["POST"])
 @cross_origin(origin="*")
 def get_log():
@@ -378,13 +822,27 @@ def get_log():
 
     content = request.json
     session_id = content["sessionId"]
-
-    # Retrieve the latest list of logs
-    log_paths = retrieve_log_paths(args.replay_dir)  # pylint: disable=possibly-used-before-assignment
+    paged = "offset" in content or "limit" in content
 
     try:
-        log_path = log_paths[session_id]
-        log = read_log(log_path)
+        if log_storage is not None:
+            # Only the rows of the requested events are read
+            log_path = None
+            offset, limit = get_log_range(content)
+            log, total = log_storage.read_range(session_id, offset, limit)
+        else:
+            log_path = LOG_PATH_INDEX.get(session_id)
+            if log_path is None:
+                raise KeyError(session_id)
+            if paged:
+                # Only read and parse the requested events
+                offset, limit = get_log_range(content)
+                log, total = LOG_READER.read_range(log_path, offset, limit)
+            else:
+                log = read_log(log_path)
+        if paged:
+            results["offset"] = offset
+            results["total"] = total
         results["status"] = SUCCESS
         results["logs"] = log
     except Exception as e:
@@ -396,9 +854,16 @@ def get_log():
 
     # Populate metadata
     try:
-        stats = compute_stats(log)
-        last_text = get_last_text_from_log(log)
-        config = get_config_for_log(session_id, metadata, metadata_path)  # pylint: disable=possibly-used-before-assignment
+        # The stats and the last text need the whole log, so they are not computed for a page
+        summary = None if paged or log_path is None else read_summary(log_path, n_events=len(log))
+        if summary is not None:
+            stats, last_text, config = summary["stats"], summary["last_text"], summary["config"]
+        else:
+            stats = None if paged else compute_stats(log)
+            last_text = None if paged else get_last_text(log_path, log)
+            config = None
+        if config is None:
+            config = get_config_for_log(session_id, get_metadata_store())
     except Exception as e:
         print(f"# Failed to retrieve metadata for the log: {e}")
         stats = None
@@ -412,6 +877,139 @@ def get_log():
     return results
 
 
+def get_last_text(log_path, log):
+    """Return the final document of a log, from its last document snapshot if possible."""
+    if log_path is None:
+        return get_last_text_from_log(log)
+    try:
+        document = LOG_SNAPSHOTS.seek(log_path, event=len(log) - 1, log=log, replay=False)
+        if document is not None:
+            return document["text"]
+    except Exception as e:
+        print(f"# Failed to read the document snapshots of {log_path}: {e}")
+    return get_last_text_from_log(log)
+
+
+@app.route("/api/seek_log", methods=["POST"])
+@cross_origin(origin="*")
+def seek_log():
+    """Return the document (text and authorship mask) after an event index or at a timestamp (ms).
+
+    Expects {"sessionId"} and either "event" or "timestamp"; the document is rebuilt from the
+    nearest document snapshot.
+    """
+    content = request.json
+    session_id = content["sessionId"]
+    results = dict()
+    try:
+        event, timestamp = content.get("event"), content.get("timestamp")
+        if log_storage is not None:
+            # No snapshots are stored in the database; the document is rebuilt from the prompt
+            document = DocumentSnapshots(interval=0, reader=log_storage).seek(
+                session_id, event=event, timestamp=timestamp
+            )
+        else:
+            log_path = LOG_PATH_INDEX.get(session_id)
+            if log_path is None:
+                raise KeyError(session_id)
+            document = LOG_SNAPSHOTS.seek(log_path, event=event, timestamp=timestamp)
+        if document is None:
+            raise ValueError(f"The log of {session_id} is empty")
+        results.update(document)
+        results["status"] = SUCCESS
+    except Exception as e:
+        results["status"] = FAILURE
+        results["message"] = str(e)
+    return jsonify(results)
+
+
+def get_log_range(content):
+    """Return the (offset, limit) of the requested events; limit is None for all remaining events."""
+    offset = int(content.get("offset") or 0)
+    limit = content.get("limit")
+    limit = None if limit is None else int(limit)
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset and limit must be non-negative")
+    return offset, limit
+
+
+@app.route("/api/stream_log", methods=["POST"])
+@cross_origin(origin="*")
+def stream_log():
+    """Stream the events [offset, offset + limit) of a log as NDJSON (one event per line).
+
+    Lines of plain .jsonl logs are sent as they are stored, without parsing them.
+    """
+    content = request.json
+    session_id = content["sessionId"]
+    try:
+        offset, limit = get_log_range(content)
+        if log_storage is not None:
+            log_storage.count(session_id)  # Raises KeyError before the response starts
+            lines = log_storage.iter_lines(session_id, offset, limit)
+        else:
+            log_path = LOG_PATH_INDEX.get(session_id)
+            if log_path is None:
+                raise KeyError(session_id)
+            lines = LOG_READER.iter_lines(log_path, offset, limit)
+    except Exception as e:
+        return jsonify({"status": FAILURE, "message": str(e)}), 404
+    return Response(lines, mimetype="application/x-ndjson")
+
+
+@app.route("/api/find_sessions", methods=["POST"])
+@cross_origin(origin="*")
+def find_sessions():
+    """Return the metadata records of the sessions that match the given filters, oldest first.
+
+    Expects any of the filters access_code, domain, engine, show_interventions, start and end
+    (start time in seconds), and min_events and max_events (number of events of the log), and
+    "offset" and "limit" (at most MAX_QUERY_LIMIT). Returns the records (with "n_events") as
+    "sessions" and the number of matching sessions as "total".
+    """
+    content = request.json
+    results = dict()
+    try:
+        offset, limit = get_log_range(content)
+        limit = min(DEFAULT_QUERY_LIMIT if limit is None else limit, MAX_QUERY_LIMIT)
+        filters = {name: content.get(name) for name in QUERY_FILTERS}
+        index = log_storage if log_storage is not None else SESSION_QUERY_INDEX
+        results["sessions"] = index.find_sessions(offset=offset, limit=limit, **filters)
+        results["total"] = index.count_sessions(**filters)
+        results["offset"] = offset
+        results["status"] = SUCCESS
+    except Exception as e:
+        results["status"] = FAILURE
+        results["message"] = str(e)
+    return jsonify(results)
+
+
+@app.route("/api/export_sessions", methods=["POST"])
+@cross_origin(origin="*")
+def export_sessions():
+    """Stream the sessions that match the filters of /api/find_sessions as one compressed file.
+
+    Expects the filters of /api/find_sessions and optionally "format" ("ndjson" or "tar"),
+    "compression" ("gzip", "zstd", or "none"), and "analyze" (add the actions of the
+    post-session analysis of each session). See log_export.py for the layout of the file.
+    """
+    content = request.json
+    try:
+        filters = {name: content.get(name) for name in QUERY_FILTERS}
+        format = content.get("format", "ndjson")
+        compression = content.get("compression", "gzip")
+        exporter = SessionExporter(
+            export_storage, format, compression, analyze=bool(content.get("analyze")), workers=export_workers
+        )
+        index = log_storage if log_storage is not None else SESSION_QUERY_INDEX
+        index.count_sessions(**filters)  # Raises on invalid filters before the response starts
+    except Exception as e:
+        return jsonify({"status": FAILURE, "message": str(e)}), 400
+    chunks = exporter.iter_export(iter_sessions(index, **filters))
+    headers = {"Content-Disposition": f"attachment; filename={get_export_name(format, compression)}"}
+    return Response(chunks, mimetype=get_export_mimetype(format, compression), headers=headers)
+
+
 @app.route("/api/parse_logs", methods=["POST"])
 @cross_origin(origin="*")
 def parse_logs():
@@ -422,6 +1020,11 @@ def parse_logs():
     3. Updates parsed_actions global variable
     4. Goes through the list of new actions and if switches the
     intervention_on variable if topic shift is detected
+
+    Requests for the same session that pile up while an analysis is running
+    are collapsed into a single run over the most recent logs. When the server
+    is degraded, only levels 1 and 2 are analyzed; when it sheds load, the
+    analysis is deferred to a later request.
     """
     # Step 1
     content = request.json
@@ -429,36 +1032,90 @@ def parse_logs():
     logs = content["logs"]
 
     try:
-        # Step 2
-        detected_plugins = analyze_and_update_actions(session_id, logs)
-
-        if SESSIONS[session_id]["show_interventions"] and len(detected_plugins) > 0:
-            return jsonify(
-                {
-                    "status": SUCCESS,
-                    "alert_author": True,
-                    "intervention_type": detected_plugins[0].intervention_action().intervention_type,
-                    "message": detected_plugins[0].intervention_action().intervention_message,
-                }
-            )
+        session = get_request_session(content, session_id)
+        if session is None:
+            return jsonify({"status": FAILURE, "alert_author": False, "message": "Invalid session."})
+
+        # When shedding load, defer the analysis; the next request analyzes the full logs again
+        load_level = LOAD_MONITOR.level()
+        if load_level == SHEDDING:
+            METRICS.increment("parse_logs_deferred")
+            return jsonify({"status": SUCCESS, "alert_author": False, "deferred": True})
+
+        # Step 2 (without level 3 when degraded)
+        if load_level == DEGRADED:
+            METRICS.increment("parse_logs_level_3_skipped")
+        if session.get("stateless"):
+            detected_plugins = analyze_session_actions(session, logs, level_3=load_level == NORMAL)
         else:
-            return jsonify({"status": SUCCESS, "alert_author": False})
+            detected_plugins = PARSE_LOGS_COALESCER.submit(
+                session_id,
+                logs,
+                lambda latest_logs: analyze_and_update_actions(
+                    session_id, latest_logs, level_3=LOAD_MONITOR.level() == NORMAL
+                ),
+            )
+
+        results = {"status": SUCCESS, "alert_author": False}
+        if session["show_interventions"] and len(detected_plugins) > 0:
+            results["alert_author"] = True
+            results["intervention_type"] = detected_plugins[0].intervention_action().intervention_type
+            results["message"] = detected_plugins[0].intervention_action().intervention_message
+        add_session_token(results, session)
+        return jsonify(results)
     except Exception as e:
         print(f"# Parsing failed: {e}")
         return jsonify({"status": FAILURE, "alert_author": False})
 
 
-def analyze_and_update_actions(session_id, logs):
+@app.route("/api/metrics", methods=["GET"])
+@cross_origin(origin="*")
+def get_metrics():
+    GC_POLICY.flush_metrics()
+    results = METRICS.snapshot()
+    results["sessions"] = SESSIONS.stats()
+    results["degradation_level"] = LOAD_MONITOR.level()
+    results["pid"] = os.getpid()
+    results["memory"] = read_memory_usage()
+    return jsonify(results)
+
+
+@app.route("/healthz/live", methods=["GET"])
+def get_liveness():
+    return jsonify({"status": SUCCESS, "pid": os.getpid()})
+
+
+@app.route("/healthz/ready", methods=["GET"])
+def get_readiness():
+    """Not ready until the process serves requests, and while it sheds new sessions."""
+    if not ready or LOAD_MONITOR.level() == SHEDDING:
+        return jsonify({"status": FAILURE, "pid": os.getpid()}), 503
+    return jsonify({"status": SUCCESS, "pid": os.getpid()})
+
+
+def analyze_and_update_actions(session_id, logs, level_3=True):
     """
-    Helper function to analyze actions and update session state.
-    Returns (new_actions, detected_plugins).
+    Helper function to analyze actions and update the state of a session in SESSIONS.
+    Returns the detected plugins.
+    The session lock is held while the session state is read and updated.
+    """
+    # Serialize analysis for the same session (e.g., concurrent /api/query and /api/parse_logs)
+    with SESSIONS.lock(session_id):
+        return analyze_session_actions(SESSIONS[session_id], logs, level_3=level_3)
+
+
+def analyze_session_actions(session, logs, level_3=True):
+    """Analyze actions from the raw logs and update the given session state in place.
+
+    Without `level_3` (when the server is degraded), only the level 1 and 2 actions are parsed and
+    recorded; the similarity-based level 3 analysis is skipped and no plugin is detected.
     """
     actions_analyzer = SameSentenceMergeAnalyzer(
-        last_action=SESSIONS[session_id]["current_action_in_progress"],
+        last_action=session["current_action_in_progress"],
         raw_logs=logs,
     )
 
-    SESSIONS[session_id]["current_action_in_progress"] = actions_analyzer.last_action
+    session["current_action_in_progress"] = actions_analyzer.last_action
     new_actions = actions_analyzer.actions_lst
     for action in new_actions:
         action["level_1_action_type"] = action["action_type"]
@@ -466,20 +1123,28 @@ def analyze_and_update_actions(session_id, logs):
     if actions_analyzer.last_action is not None:
         actions_analyzer.last_action = convert_last_action_to_complete_action(actions_analyzer.last_action)
 
-    new_actions = parse_level_3_actions(
-        {"current_session": new_actions}, similarity_fcn=get_spacy_similarity
-    )["current_session"]
+    if level_3:
+        new_actions = parse_level_3_actions(
+            {"current_session": new_actions}, similarity_fcn=get_spacy_similarity
+        )["current_session"]
 
     if len(new_actions) > 0:
-        SESSIONS[session_id]["parsed_actions"] += new_actions[:-1]  # update the parsed actions parameter
+        # Update the parsed actions; their history file is appended to behind the request
+        parsed_actions = session["parsed_actions"]
+        if isinstance(parsed_actions, ActionHistory):
+            parsed_actions.extend(new_actions[:-1], writer=WRITE_BEHIND)
+        else:
+            parsed_actions.extend(new_actions[:-1])
 
+    if not level_3:
+        return []
     detected_plugins = check_for_level_3_actions(
         new_actions, ACTIVE_PLUGINS, n_actions=1, pattern_count_threshold=1
     )
     return detected_plugins
 
 
-if __name__ == "__main__":
+def build_arg_parser():
     parser = ArgumentParser()
 
     # Required arguments
@@ -490,17 +1155,66 @@ if __name__ == "__main__":
 
     # Optional arguments
     parser.add_argument("--replay_dir", type=str, default="../logs")
+    parser.add_argument("--json_codec", type=str, choices=json_codec.CODECS, default="auto")  # Prefers orjson
+    parser.add_argument("--log_compression", type=str, choices=COMPRESSIONS, default="none")
+    parser.add_argument("--log_compression_level", type=int, default=None)
+    parser.add_argument("--write_behind_queue_size", type=int, default=1024)  # 0 writes on request threads
+    parser.add_argument("--write_behind_fsync_interval", type=float, default=1.0)  # 0 fsyncs every batch
+    parser.add_argument("--stream_ingest_min_bytes", type=int, default=1 << 20)  # 0 disables streaming
+    parser.add_argument("--write_ack_timeout", type=float, default=0.0)  # Seconds end_session waits for fsync
+    parser.add_argument("--snapshot_interval", type=int, default=100)  # Events per snapshot; 0 disables
+    parser.add_argument("--log_shard_depth", type=int, default=DEFAULT_SHARD_DEPTH)  # 0 stores logs flat
+    parser.add_argument("--log_storage", type=str, choices=STORAGES, default="files")
+    parser.add_argument("--log_db", type=str, default=None)  # SQLite database; <log_dir>/logs.db by default
+    parser.add_argument("--log_db_batch_size", type=int, default=DEFAULT_BATCH_SIZE)  # Events per row
+    parser.add_argument("--checkpoint_fsync_interval", type=float, default=1.0)  # 0 fsyncs every checkpoint
+    parser.add_argument("--log_index_check_interval", type=float, default=5.0)  # Seconds between checks
+    parser.add_argument("--export_workers", type=int, default=1)  # Processes analyzing exported sessions
 
     parser.add_argument("--debug", action="store_true")
     parser.add_argument("--verbose", action="store_true")
 
     parser.add_argument("--use_blocklist", action="store_true")
+    parser.add_argument("--config_check_interval", type=float, default=1.0)  # Seconds between checks
+
+    parser.add_argument("--action_window_size", type=int, default=DEFAULT_WINDOW_SIZE)
 
-    global args
-    args = parser.parse_args()
+    # Spill sessions that are idle for longer than --session_idle_timeout seconds to disk
+    parser.add_argument("--session_spill_dir", type=str, default=None)
+    parser.add_argument("--session_idle_timeout", type=float, default=15 * 60)
+    parser.add_argument("--session_sweep_interval", type=float, default=60)
+
+    # Degrade gracefully above these thresholds (disabled by default)
+    parser.add_argument("--max_queue_depth", type=int, default=None)
+    parser.add_argument("--max_cpu_load", type=float, default=None)
+    parser.add_argument("--max_upstream_calls", type=int, default=None)
+    parser.add_argument("--shed_ratio", type=float, default=1.5)
+    parser.add_argument("--retry_after", type=int, default=30)
+
+    # Stateless sessions: the session state is signed and carried by the client
+    parser.add_argument("--stateless_sessions", action="store_true")
+    parser.add_argument("--session_token_secret", type=str, default=os.getenv("SESSION_TOKEN_SECRET"))
+    parser.add_argument("--session_token_max_size", type=int, default=DEFAULT_MAX_TOKEN_SIZE)
+    parser.add_argument("--session_token_max_age", type=int, default=None)  # Seconds
+
+    # Garbage collection: no forced collections by default ("forced" collects after each session change)
+    parser.add_argument("--gc_mode", type=str, choices=GC_MODES, default="none")
+    parser.add_argument("--gc_interval", type=float, default=60)  # Seconds between "scheduled" collections
+    parser.add_argument("--gc_thresholds", type=int, nargs=3, default=None)
+    parser.add_argument("--gc_freeze", action="store_true")  # Freeze objects alive after startup
+
+    return parser
+
+
+def configure(cli_args):
+    """Set up the module-level settings of the server from the command-line arguments."""
+    global args, config_dir, proj_dir, metadata_path, api_keys, blocklist
+    global verbose, action_window_size, session_tokens, log_compression, log_compression_level
+    global write_ack_timeout, stream_ingest_min_bytes, log_shard_depth, log_storage
+    global export_storage, export_workers
+    args = cli_args
 
     # Create a project directory to store logs
-    global config_dir, proj_dir
     config_dir = args.config_dir
     proj_dir = os.path.join(args.log_dir, args.proj_name)
     if not os.path.exists(args.log_dir):
@@ -509,40 +1223,139 @@ if __name__ == "__main__":
         os.mkdir(proj_dir)
 
     # Create a text file for storing metadata
-    global metadata_path
     metadata_path = os.path.join(args.log_dir, "metadata.txt")
     if not os.path.exists(metadata_path):
         with open(metadata_path, "w") as f:
             f.write("")
 
     # Read and set API keys
-    global api_keys
     api_keys = read_api_keys(config_dir)
     if not DEV_MODE:
         openai.api_key = api_keys[("openai", "default")]
 
-    # Read examples (hidden prompts), prompts, and a blocklist
-    global examples, prompts, blocklist
-    examples = read_examples(config_dir)
-    prompts = read_prompts(config_dir)
+    # Read examples (hidden prompts), prompts, access codes, and a blocklist
+    CONFIG_CACHE.configure(config_dir, check_interval=args.config_check_interval)
+    CONFIG_CACHE.refresh()
     blocklist = []
     if args.use_blocklist:
         blocklist = read_blocklist(config_dir)
         print(f" # Using a blocklist: {len(blocklist)}")
 
-    # Read access codes
-    global allowed_access_codes
-    allowed_access_codes = read_access_codes(config_dir)
-
-    global session_id_history
-    metadata = dict()
-    metadata = update_metadata(metadata, metadata_path)
+    METADATA_INDEX.configure(metadata_path)
+    METADATA_INDEX.update()
+    codec = json_codec.set_codec(args.json_codec)
+    print(f" # Using the {codec.name} JSON codec")
+
+    check_compression(args.log_compression)
+    log_compression = args.log_compression
+    log_compression_level = args.log_compression_level
+    LOG_CHECKPOINTS.configure(fsync_interval=args.checkpoint_fsync_interval)
+    WRITE_BEHIND.configure(
+        max_queue=args.write_behind_queue_size, fsync_interval=args.write_behind_fsync_interval
+    )
+    write_ack_timeout = args.write_ack_timeout
+    stream_ingest_min_bytes = args.stream_ingest_min_bytes
+    log_shard_depth = args.log_shard_depth
+    if args.log_storage == "sqlite":
+        log_db = args.log_db or os.path.join(args.log_dir, "logs.db")
+        log_storage = SQLiteLogStorage(log_db, batch_size=args.log_db_batch_size)
+        print(f" # Storing session metadata and logs in {log_db}")
+    LOG_SNAPSHOTS.configure(interval=args.snapshot_interval)
+    LOG_PATH_INDEX.configure(
+        args.replay_dir,
+        index_path=os.path.join(args.log_dir, "log_paths.idx"),
+        check_interval=args.log_index_check_interval,
+    )
+    SESSION_QUERY_INDEX.configure(
+        os.path.join(args.log_dir, "sessions.db"),
+        metadata_path=metadata_path,
+        path_index=LOG_PATH_INDEX,
+        reader=LOG_READER,
+        check_interval=args.log_index_check_interval,
+    )
+    export_storage = log_storage or FileLogStorage(
+        args.log_dir,
+        args.proj_name,
+        compression=log_compression,
+        shard_depth=log_shard_depth,
+        path_index=LOG_PATH_INDEX,
+        reader=LOG_READER,
+    )
+    export_workers = args.export_workers
 
-    global verbose
     verbose = args.verbose
 
-    app.run(
-        host="0.0.0.0",
-        port=args.port,
-        debug=args.debug,
+    action_window_size = args.action_window_size
+
+    if args.session_spill_dir:
+        SESSIONS.configure(spill_dir=args.session_spill_dir, idle_timeout=args.session_idle_timeout)
+        print(f" # Spilling sessions idle for {args.session_idle_timeout}s to {args.session_spill_dir}")
+
+    LOAD_MONITOR.configure(
+        max_queue_depth=args.max_queue_depth,
+        max_cpu_load=args.max_cpu_load,
+        max_upstream_calls=args.max_upstream_calls,
+        shed_ratio=args.shed_ratio,
+        retry_after=args.retry_after,
     )
+
+    if args.stateless_sessions:
+        if not args.session_token_secret:
+            raise RuntimeError("--stateless_sessions requires --session_token_secret or SESSION_TOKEN_SECRET")
+        session_tokens = SessionTokenCodec(
+            args.session_token_secret,
+            max_token_size=args.session_token_max_size,
+            max_age=args.session_token_max_age,
+        )
+        print(" # Using stateless session tokens")
+
+    GC_POLICY.configure(
+        mode=args.gc_mode,
+        interval=args.gc_interval,
+        thresholds=args.gc_thresholds,
+        freeze=args.gc_freeze,
+    )
+    GC_POLICY.install()
+
+
+def start_background_tasks():
+    """Start the background threads of a serving process (threads do not survive a fork)."""
+    if args.session_spill_dir:
+        SESSIONS.start_sweeper(args.session_sweep_interval)
+    LOG_CHECKPOINTS.start()
+    WRITE_BEHIND.start()
+    GC_POLICY.start()
+    # Queued writes are already acknowledged to clients: write them out however the process exits
+    atexit.unregister(stop_background_tasks)
+    atexit.register(stop_background_tasks)
+
+
+def stop_background_tasks():
+    """Write out queued metadata and logs and fsync checkpoints before the process exits."""
+    WRITE_BEHIND.stop()
+    LOG_CHECKPOINTS.stop()
+    SESSION_QUERY_INDEX.close()
+    if log_storage is not None:
+        log_storage.close()
+
+
+def exit_on_signal(signum, frame):
+    """Turn SIGTERM into SystemExit, so that queued writes are flushed before the process exits."""
+    raise SystemExit(0)
+
+
+if __name__ == "__main__":
+    configure(build_arg_parser().parse_args())
+    GC_POLICY.after_warmup()
+    start_background_tasks()
+    signal.signal(signal.SIGTERM, exit_on_signal)
+    ready = True
+
+    try:
+        app.run(
+            host="0.0.0.0",
+            port=args.port,
+            debug=args.debug,
+        )
+    finally:
+        stop_background_tasks()
@@ -0,0 +1,91 @@
+"""
+Coalescing of redundant requests per key (e.g., per session).
+
+The frontend sends the full list of logs with every /api/parse_logs request,
+so a newer request for a session supersedes every older request that has not
+started yet. `RequestCoalescer` keeps at most one pending batch per key: while
+a run for the key is in progress, new requests join the pending batch and
+replace its arguments with the latest ones. When the run finishes, the pending
+batch is executed once and every waiter of the batch receives its result.
+"""
+
+import threading
+
+from coauthor_interface.backend.metrics import METRICS
+
+
+class _Batch:
+    def __init__(self, value):
+        self.value = value
+        self.waiters = 1
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class _KeyState:
+    def __init__(self):
+        self.running = False
+        self.pending = None
+
+
+class RequestCoalescer:
+    def __init__(self, name, metrics=METRICS):
+        self.name = name
+        self.metrics = metrics
+        self._condition = threading.Condition()
+        self._states = dict()
+
+    def submit(self, key, value, fn):
+        """Run `fn(value)` for `key`, collapsing it with newer requests for the same key.
+
+        Returns the result of the run that covered this request (which may have
+        been executed with a newer `value`) and re-raises its exception.
+        """
+        self.metrics.increment(f"{self.name}_requests")
+        with self._condition:
+            state = self._states.get(key)
+            if state is None:
+                state = _KeyState()
+                self._states[key] = state
+
+            batch = state.pending
+            if batch is None:
+                batch = _Batch(value)
+                state.pending = batch
+            else:
+                # An older request is still waiting: run once with the latest value instead
+                batch.value = value
+                batch.waiters += 1
+                self.metrics.increment(f"{self.name}_collapsed")
+
+            while not batch.done and state.running:
+                self._condition.wait()
+
+            if not batch.done:
+                # This thread runs the batch on behalf of all of its waiters
+                state.running = True
+                state.pending = None
+
+        if batch.done:
+            return self._result(batch)
+
+        try:
+            batch.result = fn(batch.value)
+        except Exception as e:
+            batch.error = e
+        finally:
+            self.metrics.increment(f"{self.name}_runs")
+            with self._condition:
+                batch.done = True
+                state.running = False
+                if state.pending is None:
+                    self._states.pop(key, None)
+                self._condition.notify_all()
+        return self._result(batch)
+
+    @staticmethod
+    def _result(batch):
+        if batch.error is not None:
+            raise batch.error
+        return batch.result
@@ -0,0 +1,150 @@
+"""
+Cached configuration with hot reload.
+
+`ConfigCache` keeps the parsed examples, prompts, and access codes of
+`config_dir` in an immutable `ConfigSnapshot`. At most every `check_interval`
+seconds, the modification times and sizes of the configuration files are
+checked; only the files that changed are parsed again, and a new snapshot
+replaces the previous one with a single reference assignment. Requests take
+one snapshot and use it throughout, so every route sees a consistent version
+of the configuration, and a burst of new sessions does not parse any file.
+"""
+
+import threading
+from pathlib import Path
+from time import time
+
+from coauthor_interface.backend.metrics import METRICS
+from coauthor_interface.backend.reader import read_access_code_file, read_example_file, read_prompts
+
+EXAMPLE = "example"
+PROMPTS = "prompts"
+ACCESS_CODES = "access_codes"
+
+
+class ConfigSnapshot:
+    """A parsed version of the configuration; never modified after it is created."""
+
+    def __init__(self, version, examples, prompts, access_codes):
+        self.version = version
+        self.examples = examples
+        self.prompts = prompts
+        self.access_codes = access_codes
+
+
+class ConfigCache:
+    def __init__(self, config_dir=None, check_interval=1.0, metrics=METRICS):
+        self._lock = threading.Lock()
+        self.metrics = metrics
+        self.configure(config_dir, check_interval)
+
+    def configure(self, config_dir, check_interval=1.0):
+        with self._lock:
+            self.config_dir = Path(config_dir) if config_dir else None
+            self.check_interval = check_interval
+            self._files = dict()  # path -> (kind, fingerprint, parsed content)
+            self._snapshot = None
+            self._last_check = None
+
+    def _is_due(self):
+        return self._last_check is None or time() - self._last_check >= self.check_interval
+
+    def get(self, check=True):
+        """Return the current snapshot.
+
+        With `check`, changed files are reloaded first (at most every `check_interval` seconds).
+        """
+        snapshot = self._snapshot
+        if snapshot is None or (check and self._is_due()):
+            snapshot = self.refresh(force=False)
+        return snapshot
+
+    def refresh(self, force=True):
+        """Reload the files that changed and return the current snapshot.
+
+        Errors while reloading keep the previous snapshot; errors on the first load are raised.
+        """
+        with self._lock:
+            if not force and self._snapshot is not None and not self._is_due():
+                return self._snapshot  # Another thread has just checked
+            self._last_check = time()
+
+            try:
+                changed = self._reload_changed_files()
+            except Exception as e:
+                if self._snapshot is None:
+                    raise
+                print(f"# Could not reload the configuration; keeping version {self._snapshot.version}: {e}")
+                self.metrics.increment("config_reload_errors")
+                return self._snapshot
+
+            if changed or self._snapshot is None:
+                self._snapshot = self._build_snapshot()
+                self.metrics.increment("config_reloads")
+                self.metrics.set_gauge("config_version", self._snapshot.version)
+            return self._snapshot
+
+    def _list_files(self):
+        """Return {path: kind} for the configuration files in config_dir."""
+        if self.config_dir is None or not self.config_dir.exists():
+            raise RuntimeError(f"Cannot find access code at {self.config_dir}")
+
+        files = dict()
+        examples_dir = self.config_dir / "examples"
+        if examples_dir.exists():
+            for file_path in examples_dir.iterdir():
+                if file_path.suffix == ".txt":
+                    files[file_path] = EXAMPLE
+        files[self.config_dir / "prompts.tsv"] = PROMPTS
+        for file_path in self.config_dir.iterdir():
+            if "access_code" in file_path.name and file_path.suffix == ".csv":
+                files[file_path] = ACCESS_CODES
+        return files
+
+    def _parse(self, kind, file_path):
+        if kind == EXAMPLE:
+            return read_example_file(file_path)
+        if kind == PROMPTS:
+            return read_prompts(self.config_dir)
+        return read_access_code_file(file_path)
+
+    def _reload_changed_files(self):
+        """Parse new and modified files and drop removed ones. Return True if anything changed."""
+        files = self._list_files()
+
+        # Parse everything before updating, so a failure leaves the cache unchanged
+        updates = dict()
+        for file_path, kind in files.items():
+            try:
+                stat = file_path.stat()
+            except FileNotFoundError:
+                if kind == PROMPTS:
+                    raise FileNotFoundError(f"Prompts file not found: {file_path}") from None
+                continue  # Removed since it was listed
+            fingerprint = (stat.st_mtime_ns, stat.st_size)
+            cached = self._files.get(file_path)
+            if cached is None or cached[1] != fingerprint:
+                updates[file_path] = (kind, fingerprint, self._parse(kind, file_path))
+
+        removed = [file_path for file_path in self._files if file_path not in files]
+        for file_path in removed:
+            del self._files[file_path]
+        self._files.update(updates)
+        self.metrics.increment("config_files_parsed", len(updates))
+        return bool(updates or removed)
+
+    def _build_snapshot(self):
+        examples = {"na": ""}
+        prompts = {"na": ""}
+        access_codes = dict()
+        for file_path in sorted(self._files):
+            kind, _, content = self._files[file_path]
+            if kind == EXAMPLE:
+                examples[file_path.stem] = content
+            elif kind == PROMPTS:
+                prompts = content
+            else:
+                access_codes.update(content)
+
+        version = self._snapshot.version + 1 if self._snapshot is not None else 1
+        return ConfigSnapshot(version, examples, prompts, access_codes)
@@ -0,0 +1,285 @@
+"""
+Document snapshots for random-access replay.
+
+The document at an event of a log is rebuilt by applying the ops of every
+event from `system-initialize` onward (see `get_text_and_mask`). Every
+`interval` events, `DocumentSnapshots` stores the document and its authorship
+mask in a sidecar next to the log, `<session_id>.snapshots.jsonl`, so the
+document at any event or timestamp is rebuilt from the nearest snapshot by
+applying at most `interval` events.
+
+Each line of the sidecar is a snapshot
+
+    {"event": n, "timestamp": t, "text": ..., "mask": ...}
+
+of the document after the events [start, n) of the log were applied, where
+start is the `event` of the first line (the system-initialize event, whose
+snapshot is the prompt) and t is the timestamp of event n - 1. Snapshots are
+appended as the log grows; if the log no longer matches the last snapshot
+(e.g., it was replaced), the sidecar is rebuilt and atomically replaced.
+
+Sidecars are only written by `update`, when a log is saved or checkpointed
+(or by scripts/build_snapshots.py for an existing archive). `seek` only reads
+them: without an up-to-date sidecar, the document is replayed in memory from
+the prompt, so read-only log directories can be replayed as well.
+"""
+
+import bisect
+import collections
+import fcntl
+import os
+import tempfile
+import threading
+
+from coauthor_interface import json_codec
+from coauthor_interface.backend.helper import apply_ops
+from coauthor_interface.backend.log_compression import split_log_suffix
+from coauthor_interface.backend.log_reader import LogReader
+from coauthor_interface.backend.metrics import METRICS
+
+SNAPSHOT_FILE_SUFFIX = ".snapshots.jsonl"
+SCAN_SIZE = 1000  # Events read at a time to find the system-initialize event
+
+
+def get_snapshot_path(log_path):
+    return split_log_suffix(log_path)[0] + SNAPSHOT_FILE_SUFFIX
+
+
+def apply_events(text, mask, events):
+    """Apply the text ops of events to a document and its mask."""
+    for event in events:
+        text_delta = event.get("textDelta")
+        if isinstance(text_delta, dict) and "ops" in text_delta:
+            text, mask = apply_ops(text, mask, text_delta["ops"], event["eventSource"])
+    return text, mask
+
+
+class SnapshotEntries:
+    """Positions of the snapshots in a sidecar (the snapshots are read on demand)."""
+
+    def __init__(self, inode):
+        self.inode = inode
+        self.size = 0
+        self.events = []
+        self.timestamps = []
+        self.spans = []  # (offset, length) of each line
+
+    def __len__(self):
+        return len(self.events)
+
+    def add_lines(self, data, position):
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end < 0:
+                break
+            snapshot = json_codec.loads(data[start:end])
+            self.events.append(snapshot["event"])
+            self.timestamps.append(snapshot["timestamp"])
+            self.spans.append((position + start, end - start))
+            start = end + 1
+        self.size = position + start
+
+
+class DocumentSnapshots:
+    def __init__(self, interval=100, reader=None, max_cached=256, metrics=METRICS):
+        self._lock = threading.Lock()
+        self.reader = reader or LogReader(metrics=metrics)
+        self.max_cached = max_cached
+        self.metrics = metrics
+        self._entries = collections.OrderedDict()  # snapshot path -> SnapshotEntries
+        self.configure(interval)
+
+    def configure(self, interval=100):
+        self.interval = interval
+
+    def _read_events(self, log_path, start, stop, log=None):
+        if stop <= start:
+            return []
+        if log is not None:
+            return log[start:stop]
+        return self.reader.read_range(log_path, start, stop - start)[0]
+
+    def _count_events(self, log_path, log=None):
+        return len(log) if log is not None else self.reader.count(log_path)
+
+    def _load_entries(self, snapshot_path):
+        """Return the up-to-date positions of the snapshots of a sidecar (None if there is none)."""
+        with self._lock:
+            try:
+                stat = os.stat(snapshot_path)
+            except FileNotFoundError:
+                self._entries.pop(snapshot_path, None)
+                return None
+
+            entries = self._entries.pop(snapshot_path, None)
+            if entries is None or entries.inode != stat.st_ino or entries.size > stat.st_size:
+                entries = SnapshotEntries(stat.st_ino)
+            if entries.size < stat.st_size:
+                with open(snapshot_path, "rb") as f:
+                    f.seek(entries.size)
+                    entries.add_lines(f.read(), entries.size)
+
+            self._entries[snapshot_path] = entries
+            while len(self._entries) > self.max_cached:
+                self._entries.popitem(last=False)
+            return entries
+
+    @staticmethod
+    def _read_snapshot(snapshot_path, entries, i):
+        offset, length = entries.spans[i]
+        with open(snapshot_path, "rb") as f:
+            f.seek(offset)
+            return json_codec.loads(f.read(length))
+
+    def _find_start(self, log_path, n_events, log=None):
+        """Return the index of the system-initialize event (0 if there is none)."""
+        for chunk_start in range(0, n_events, SCAN_SIZE):
+            events = self._read_events(log_path, chunk_start, min(n_events, chunk_start + SCAN_SIZE), log)
+            for i, event in enumerate(events):
+                if event.get("eventName") == "system-initialize":
+                    return chunk_start + i
+        return 0
+
+    def _get_prompt(self, log_path, start, log=None):
+        """Return the first snapshot: the prompt of the system-initialize event."""
+        prompt = self._read_events(log_path, start, start + 1, log)[0].get("currentDoc", "").strip()
+        return {"event": start, "timestamp": None, "text": prompt, "mask": "P" * len(prompt)}
+
+    def _is_current(self, log_path, entries, n_events, log=None):
+        """Check that the log still has the event of the last snapshot."""
+        last_event = entries.events[-1]
+        if last_event > n_events:
+            return False
+        if entries.timestamps[-1] is None:
+            return True
+        event = self._read_events(log_path, last_event - 1, last_event, log)[0]
+        return event.get("eventTimestamp") == entries.timestamps[-1]
+
+    def _extend(self, log_path, start, snapshot, n_events, log=None):
+        """Return the snapshots after `snapshot` up to the end of the log."""
+        n = snapshot["event"]
+        text, mask = snapshot["text"], snapshot["mask"]
+        snapshots = []
+        stop = n + self.interval - (n - start) % self.interval
+        while stop <= n_events:
+            events = self._read_events(log_path, n, stop, log)
+            text, mask = apply_events(text, mask, events)
+            n = stop
+            timestamp = events[-1].get("eventTimestamp")
+            snapshots.append({"event": n, "timestamp": timestamp, "text": text, "mask": mask})
+            stop += self.interval
+        return snapshots
+
+    def update(self, log_path, log=None):
+        """Append the snapshots of the events logged since the last update (or rebuild them).
+
+        `log` is the full log if it is already in memory; otherwise events are read from log_path.
+        Returns the positions of the snapshots, or None if snapshots are disabled or the log is empty.
+        """
+        if self.interval <= 0:
+            return None
+        snapshot_path = get_snapshot_path(log_path)
+        n_events = self._count_events(log_path, log)
+        if n_events == 0:
+            return None
+
+        with open(snapshot_path, "a+b") as f:
+            # Several server processes may update the same sidecar
+            fcntl.flock(f, fcntl.LOCK_EX)
+            entries = self._load_entries(snapshot_path)
+            if entries and self._is_current(log_path, entries, n_events, log):
+                start = entries.events[0]
+                last = self._read_snapshot(snapshot_path, entries, len(entries) - 1)
+                snapshots = self._extend(log_path, start, last, n_events, log)
+                if snapshots:
+                    data = "".join(json_codec.dumps(snapshot) + "\n" for snapshot in snapshots)
+                    f.write(data.encode("utf-8"))
+                    f.flush()
+            else:
+                start = self._find_start(log_path, n_events, log)
+                first = self._get_prompt(log_path, start, log)
+                snapshots = [first, *self._extend(log_path, start, first, n_events, log)]
+                # Replace the file, so that readers never see a mix of old and new snapshots
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(snapshot_path) or ".", suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w") as tmp:
+                        tmp.write("".join(json_codec.dumps(snapshot) + "\n" for snapshot in snapshots))
+                    os.replace(tmp_path, snapshot_path)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+                self.metrics.increment("snapshot_rebuilds")
+
+            self.metrics.increment("snapshots_written", len(snapshots))
+            return self._load_entries(snapshot_path)
+
+    def _load_current_entries(self, snapshot_path, log_path, n_events, log=None):
+        """Return the positions of the snapshots of a log, or None if its sidecar is missing or stale."""
+        if self.interval <= 0:
+            return None
+        try:
+            entries = self._load_entries(snapshot_path)
+            if entries and self._is_current(log_path, entries, n_events, log):
+                return entries
+        except (OSError, ValueError) as e:
+            print(f"# Failed to read the document snapshots {snapshot_path}: {e}")
+        return None
+
+    def _find_snapshot(self, snapshot_path, entries, event=None, timestamp=None):
+        """Return the nearest snapshot before an event or a timestamp, and the event of the next one."""
+        if event is not None:
+            i = bisect.bisect_right(entries.events, max(event + 1, entries.events[0])) - 1
+        else:
+            timestamps = [float("-inf")] + entries.timestamps[1:]
+            i = bisect.bisect_right(timestamps, timestamp) - 1
+        snapshot = self._read_snapshot(snapshot_path, entries, i)
+        if snapshot["event"] != entries.events[i]:
+            raise ValueError("The sidecar was replaced while it was read")
+        return snapshot, entries.events[i + 1] if i + 1 < len(entries) else None
+
+    def seek(self, log_path, event=None, timestamp=None, log=None, replay=True):
+        """Return the document after an event (index) or at a timestamp (ms), from the nearest snapshot.
+
+        Nothing is written: without an up-to-date sidecar, the document is replayed from the prompt
+        (or None is returned, without `replay`). Returns {"event": index of the last applied event,
+        "timestamp", "text", "mask"}, or None if the log is empty.
+        """
+        if event is None and timestamp is None:
+            raise ValueError("Either event or timestamp is required")
+        n_events = self._count_events(log_path, log)
+        if n_events == 0:
+            return None
+        snapshot_path = get_snapshot_path(log_path)
+        snapshot = next_event = None
+        entries = self._load_current_entries(snapshot_path, log_path, n_events, log)
+        if entries is not None:
+            try:
+                snapshot, next_event = self._find_snapshot(snapshot_path, entries, event, timestamp)
+            except (OSError, ValueError) as e:
+                print(f"# Failed to read the document snapshots {snapshot_path}: {e}")
+        if snapshot is None:
+            if not replay:
+                return None
+            self.metrics.increment("snapshot_replays")
+            snapshot = self._get_prompt(log_path, self._find_start(log_path, n_events, log), log)
+
+        if event is not None:
+            target = min(max(event + 1, snapshot["event"]), n_events)
+            events = self._read_events(log_path, snapshot["event"], target, log)
+        else:
+            stop = n_events if next_event is None else next_event
+            events = self._read_events(log_path, snapshot["event"], stop, log)
+            n_applied = 0
+            while n_applied < len(events) and events[n_applied].get("eventTimestamp", 0) <= timestamp:
+                n_applied += 1
+            events = events[:n_applied]
+
+        text, mask = apply_events(snapshot["text"], snapshot["mask"], events)
+        self.metrics.increment("snapshot_seeks")
+        return {
+            "event": snapshot["event"] + len(events) - 1,
+            "timestamp": events[-1].get("eventTimestamp") if events else snapshot["timestamp"],
+            "text": text,
+            "mask": mask,
+        }
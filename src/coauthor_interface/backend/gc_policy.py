@@ -0,0 +1,121 @@
+"""
+Garbage collection policy of the API server.
+
+A full collection stops every thread of the process, and its pause grows with
+the number of live objects (e.g., sessions and their parsed actions). The
+policy decides when full collections run:
+
+- "none": no forced collections; CPython's generational collector runs as usual.
+- "scheduled": a background thread runs a full collection every `interval` seconds.
+- "forced": a full collection after /api/start_session and /api/end_session
+  (the previous behavior of the server).
+
+Independently, `thresholds` tunes the generational thresholds (gc.set_threshold)
+and `freeze` moves every object alive after warmup (e.g., the spaCy model) to the
+permanent generation so that later collections do not scan it.
+
+Every collection is timed with gc.callbacks. The callback only appends to a
+deque, because a collection may start while the thread holds a lock of the
+metrics registry; the pauses are moved into METRICS by `flush_metrics`.
+"""
+
+import collections
+import gc
+import threading
+from time import perf_counter
+
+from coauthor_interface.backend.metrics import METRICS
+
+GC_MODES = ("none", "scheduled", "forced")
+
+
+class GCPolicy:
+    def __init__(self, mode="none", interval=60, thresholds=None, freeze=False, metrics=METRICS):
+        self.metrics = metrics
+        self._local = threading.local()
+        self._pauses = collections.deque(maxlen=10000)  # (generation, seconds, collected)
+        self._installed = False
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.configure(mode, interval, thresholds, freeze)
+
+    def configure(self, mode="none", interval=60, thresholds=None, freeze=False):
+        if mode not in GC_MODES:
+            raise ValueError(f"Unknown GC mode: {mode} (expected one of {', '.join(GC_MODES)})")
+        self.mode = mode
+        self.interval = interval
+        self.thresholds = thresholds
+        self.freeze = freeze
+
+    def install(self):
+        """Apply the thresholds and start recording GC pauses."""
+        if self.thresholds:
+            gc.set_threshold(*self.thresholds)
+        if not self._installed:
+            gc.callbacks.append(self._on_gc)
+            self._installed = True
+
+    def uninstall(self):
+        if self._installed:
+            gc.callbacks.remove(self._on_gc)
+            self._installed = False
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._local.start = perf_counter()
+        elif phase == "stop":
+            start = getattr(self._local, "start", None)
+            if start is not None:
+                self._local.start = None
+                self._pauses.append((info["generation"], perf_counter() - start, info["collected"]))
+
+    def flush_metrics(self):
+        """Move the recorded GC pauses into the metrics registry."""
+        while True:
+            try:
+                generation, seconds, collected = self._pauses.popleft()
+            except IndexError:
+                break
+            self.metrics.observe("gc_pause_seconds", seconds)
+            self.metrics.observe(f"gc_pause_seconds_gen{generation}", seconds)
+            self.metrics.increment("gc_collected_objects", collected)
+
+    def after_warmup(self):
+        """Freeze the objects alive after warmup if enabled."""
+        if self.freeze:
+            freeze_heap()
+
+    def collect_after_request(self):
+        """Called on the request path after sessions are created or removed."""
+        if self.mode == "forced":
+            gc.collect(generation=2)
+            self.metrics.increment("gc_forced_collections")
+            self.flush_metrics()
+
+    def start(self):
+        """Start the background collection thread of the "scheduled" mode."""
+        if self.mode != "scheduled" or self._thread is not None:
+            return
+
+        def collect_periodically():
+            while not self._stop_event.wait(self.interval):
+                gc.collect(generation=2)
+                self.metrics.increment("gc_scheduled_collections")
+                self.flush_metrics()
+
+        self._thread = threading.Thread(target=collect_periodically, name="gc-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stop_event.clear()
+
+
+def freeze_heap():
+    """Collect garbage, then move every remaining object to the permanent generation."""
+    gc.collect()
+    gc.freeze()
+    print(f" # Froze {gc.get_freeze_count()} objects")
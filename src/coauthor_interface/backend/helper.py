@@ -15,13 +15,18 @@ user sessions, processing logs, and handling document operations.
 
 from collections import defaultdict
 import collections
+import hashlib
 import json
 import os
+import tempfile
 import uuid
 from pathlib import Path
 from time import ctime, time
 
-from coauthor_interface.backend.reader import update_metadata
+from coauthor_interface import json_codec
+from coauthor_interface.backend.action_history import ActionHistory
+from coauthor_interface.backend.log_compression import open_log, split_log_suffix
+from coauthor_interface.backend.log_index import is_log_file
 
 
 def get_uuid():
@@ -29,6 +34,12 @@ def get_uuid():
     return uuid.uuid4().hex
 
 
+def shard_for_session(session_id, n_shards):
+    """Map a session ID to one of `n_shards` shards (stable across processes)."""
+    digest = hashlib.blake2b(session_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % n_shards
+
+
 def print_verbose(title, arg_dict, verbose, force=False):
     if verbose or force:
         print("=" * 40)
@@ -70,13 +81,21 @@ def retrieve_log_paths(all_log_dir):
     log_paths = dict()
     log_mtimes = dict()
 
-    json_paths = list(Path(all_log_dir).rglob("*.json"))
-    jsonl_paths = list(Path(all_log_dir).rglob("*.jsonl"))
-
-    # Prioritize jsonl version
+    json_paths = []
+    jsonl_paths = []
+    for path in Path(all_log_dir).rglob("*.json*"):
+        if not is_log_file(path.name):
+            continue  # Sidecar files of the logs and logs still being written
+        _, suffix, _ = split_log_suffix(path)
+        if suffix == ".json":
+            json_paths.append(path)
+        elif suffix == ".jsonl":
+            jsonl_paths.append(path)
+
+    # Prioritize jsonl version (plain or compressed)
     for path in jsonl_paths:
         path = str(path)
-        session_id = os.path.splitext(os.path.basename(path))[0]
+        session_id = os.path.basename(split_log_suffix(path)[0])
         mtime = os.path.getmtime(path)
 
         if session_id in log_mtimes:
@@ -90,17 +109,30 @@ def retrieve_log_paths(all_log_dir):
 
     for path in json_paths:
         path = str(path)
-        session_id = os.path.splitext(os.path.basename(path))[0]
+        session_id = os.path.basename(split_log_suffix(path)[0])
         if session_id not in log_paths:
             log_paths[session_id] = path
     return log_paths
 
 
-def append_session_to_file(session, session_id_history_path):
+def session_serializer(obj):
+    """Serialize runtime objects stored in a session (e.g., action history)."""
+    if isinstance(obj, ActionHistory):
+        return obj.to_json()
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def append_session_to_file(session, session_id_history_path, writer=None):
+    """Append a session to the metadata file, through a WriteBehindWriter if given."""
     try:
+        line = json.dumps(session, default=session_serializer) + "\n"
+        if writer is not None:
+            ticket = writer.append(session_id_history_path, line)
+            if ticket.done and ticket.error is not None:
+                raise ticket.error
+            return
         with open(session_id_history_path, "a") as f:
-            json.dump(session, f)
-            f.write("\n")
+            f.write(line)
     except Exception as e:
         print("Failed to write access code history")
         print(e)
@@ -112,10 +144,24 @@ def save_log_to_json(path, log):
 
 
 def save_log_to_jsonl(path, log):
-    with open(path, "w") as f:  # Overwrite existing file
-        for entry in log:
-            json.dump(entry, f)
-            f.write("\n")
+    """Overwrite a log; compressed for .jsonl.gz and .jsonl.zst.
+
+    The log is written to a hidden temporary file that replaces it, so readers that memory-map
+    the old file (see log_reader.MappedLog) keep reading it instead of seeing it truncated.
+    """
+    log_dir, name = os.path.split(str(path))
+    suffix = name[len(split_log_suffix(name)[0]) :]
+    fd, tmp_path = tempfile.mkstemp(dir=log_dir or ".", prefix=".save-", suffix=suffix)
+    os.close(fd)
+    try:
+        with open_log(tmp_path, "w") as f:
+            for entry in log:
+                f.write(json_codec.dumps(entry))
+                f.write("\n")
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
 
 
 def compute_stats(log):
@@ -224,22 +270,28 @@ def get_text_and_mask(events, event_id, remove_prompt=True):
     return text, mask
 
 
-def get_last_text_from_log(log):
+def get_last_document_from_log(log):
+    """Return the final text of a log and its mask (with the prompt)."""
+    if not log:
+        return "", ""
     for i, event in enumerate(log):
         if event["eventName"] == "system-initialize":
             break
     log = log[i:]
 
-    text, _ = get_text_and_mask(log, len(log), remove_prompt=False)
+    return get_text_and_mask(log, len(log), remove_prompt=False)
+
+
+def get_last_text_from_log(log):
+    text, _ = get_last_document_from_log(log)
     return text
 
 
-def get_config_for_log(session_id, metadata, metadata_path):
-    metadata = update_metadata(metadata, metadata_path)
-    if session_id not in metadata:
+def get_config_for_log(session_id, metadata_index):
+    config = metadata_index.get(session_id)
+    if config is None:
         print(f"Could not find session history for session ID: {session_id}")
         return ""
-    config = metadata[session_id]
     return config
 
 
@@ -0,0 +1,180 @@
+"""
+Append-only checkpoints of session logs.
+
+`save_log_to_jsonl` rewrites the whole log every time the frontend saves, so
+the cost of saving grows with the age of the session. With checkpoints, the
+frontend sends only the events after the last persisted sequence number (the
+number of events already in the file), and `LogCheckpointer.append` appends
+them to `<session_id>.jsonl`:
+
+- A checkpoint that starts before the end of the file (e.g., a retry after a
+  lost response) only appends the events that are not in the file yet.
+- A checkpoint that starts after the end of the file raises
+  `CheckpointGapError` with the persisted count, so the frontend can resend.
+- Appends are flushed to the page cache right away and fsynced in batches
+  every `fsync_interval` seconds by a background thread (immediately with 0).
+- The last checkpoint of a session seals the log: the file is fsynced and a
+  `<session_id>.seal` file records the number of events. Later checkpoints
+  raise `LogSealedError`.
+
+Appends hold an exclusive flock on the log, so several server processes can
+checkpoint the same session. A line left incomplete by a crash is truncated
+before the next append.
+"""
+
+import fcntl
+import json
+import os
+import threading
+from time import perf_counter, time
+
+from coauthor_interface import json_codec
+from coauthor_interface.backend.metrics import METRICS
+
+SEAL_FILE_SUFFIX = ".seal"
+
+
+class CheckpointGapError(Exception):
+    def __init__(self, seq, persisted):
+        super().__init__(f"Checkpoint starts at event {seq}, but only {persisted} events are saved")
+        self.persisted = persisted
+
+
+class LogSealedError(Exception):
+    pass
+
+
+def get_seal_path(log_path):
+    return os.path.splitext(log_path)[0] + SEAL_FILE_SUFFIX
+
+
+def fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class LogCheckpointer:
+    def __init__(self, fsync_interval=1.0, metrics=METRICS):
+        self._lock = threading.Lock()
+        self.metrics = metrics
+        self._sizes = dict()  # path -> (size, number of events) after the last append of this process
+        self._dirty = set()  # Paths with appends that are not fsynced yet
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.configure(fsync_interval)
+
+    def configure(self, fsync_interval=1.0):
+        self.fsync_interval = fsync_interval
+
+    def _count_events(self, path, f, size):
+        """Return the number of complete events in an open log, truncating a partial last line."""
+        with self._lock:
+            cached = self._sizes.get(path)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+
+        f.seek(0)
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            print(f"# Truncating an incomplete event at the end of {path}")
+            f.truncate(end)
+        return data.count(b"\n", 0, end)
+
+    def append(self, path, seq, events, seal=False):
+        """Append the events of a checkpoint that starts at event `seq`.
+
+        Returns the number of events in the log after the checkpoint.
+        """
+        if os.path.exists(get_seal_path(path)):
+            raise LogSealedError(f"The log of {path} is sealed")
+
+        with open(path, "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if os.path.exists(get_seal_path(path)):
+                raise LogSealedError(f"The log of {path} is sealed")  # Sealed by another process
+
+            persisted = self._count_events(path, f, os.fstat(f.fileno()).st_size)
+            if seq > persisted:
+                raise CheckpointGapError(seq, persisted)
+
+            new_events = events[persisted - seq :]
+            if new_events:
+                data = "".join(json_codec.dumps(event) + "\n" for event in new_events).encode("utf-8")
+                f.write(data)
+                f.flush()
+                persisted += len(new_events)
+                self.metrics.increment("checkpoint_events_appended", len(new_events))
+
+            size = os.fstat(f.fileno()).st_size
+            if seal:
+                self._fsync(f.fileno())
+                self._seal(path, persisted)
+                with self._lock:
+                    self._sizes.pop(path, None)
+                    self._dirty.discard(path)
+                return persisted
+
+            with self._lock:
+                self._sizes[path] = (size, persisted)
+            if new_events:
+                if self.fsync_interval <= 0:
+                    self._fsync(f.fileno())
+                else:
+                    with self._lock:
+                        self._dirty.add(path)
+        return persisted
+
+    def _seal(self, path, n_events):
+        seal_path = get_seal_path(path)
+        tmp_path = f"{seal_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"n_events": n_events, "sealed_at": time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, seal_path)
+        fsync_dir(os.path.dirname(os.path.abspath(path)))
+        self.metrics.increment("checkpoint_seals")
+
+    def _fsync(self, fd):
+        start = perf_counter()
+        os.fsync(fd)
+        self.metrics.observe("checkpoint_fsync_seconds", perf_counter() - start)
+
+    def flush(self):
+        """Fsync the logs appended to since the last flush."""
+        with self._lock:
+            paths = self._dirty
+            self._dirty = set()
+        for path in paths:
+            try:
+                # fsync through any descriptor writes back the pages of the file
+                with open(path, "rb") as f:
+                    self._fsync(f.fileno())
+            except OSError as e:
+                print(f"# Failed to fsync {path}: {e}")
+        if paths:
+            self.metrics.increment("checkpoint_fsync_batches")
+
+    def start(self):
+        """Start the background thread that fsyncs appended logs every `fsync_interval` seconds."""
+        if self.fsync_interval <= 0 or self._thread is not None:
+            return
+
+        def flush_periodically():
+            while not self._stop_event.wait(self.fsync_interval):
+                self.flush()
+
+        self._thread = threading.Thread(target=flush_periodically, name="checkpoint-fsync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stop_event.clear()
+        self.flush()
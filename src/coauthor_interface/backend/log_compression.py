@@ -0,0 +1,102 @@
+"""
+Compressed log files.
+
+Keystroke logs repeat the same keys on every event, so they compress well. A
+log can be stored as `<session_id>.jsonl.gz` (gzip) or `<session_id>.jsonl.zst`
+(zstd, requires the optional `zstandard` package), with the same content as
+the plain file. `open_log` opens plain and compressed logs alike, so readers
+only need to know the base format (.json or .jsonl) returned by
+`split_log_suffix`.
+"""
+
+import gzip
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+LOG_SUFFIXES = (".json", ".jsonl")
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 10}
+
+
+def split_log_suffix(path):
+    """Return (base, format, compression) of a log path, e.g., ("s", ".jsonl", "gzip") for s.jsonl.gz.
+
+    format is None if the path is not a log.
+    """
+    base, suffix = os.path.splitext(str(path))
+    compression = "none"
+    for name, compression_suffix in COMPRESSION_SUFFIXES.items():
+        if suffix == compression_suffix:
+            compression = name
+            base, suffix = os.path.splitext(base)
+            break
+    if suffix not in LOG_SUFFIXES:
+        return str(path), None, compression
+    return base, suffix, compression
+
+
+def is_log_path(path):
+    return split_log_suffix(path)[1] is not None
+
+
+def get_compressed_path(path, compression):
+    """Return the path of a log with the given compression (e.g., s.jsonl -> s.jsonl.gz)."""
+    base, suffix, _ = split_log_suffix(path)
+    return base + suffix + COMPRESSION_SUFFIXES.get(compression, "")
+
+
+def check_compression(compression):
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression} (expected one of {', '.join(COMPRESSIONS)})")
+    if compression == "zstd" and zstandard is None:
+        raise RuntimeError("zstd compression requires the zstandard package (pip install zstandard)")
+
+
+def open_log(path, mode="r", level=None):
+    """Open a plain or compressed log in text mode ("r" or "w")."""
+    compression = split_log_suffix(path)[2]
+    if compression == "none":
+        return open(path, mode)
+
+    check_compression(compression)
+    level = level or DEFAULT_LEVELS[compression]
+    if compression == "gzip":
+        return gzip.open(path, f"{mode}t", compresslevel=level)
+    if "w" in mode:
+        return zstandard.open(path, f"{mode}t", cctx=zstandard.ZstdCompressor(level=level))
+    return zstandard.open(path, f"{mode}t")
+
+
+def compress_log_file(path, compression, level=None, remove=True):
+    """Write a compressed copy of a plain log and return its path.
+
+    The copy is written to a temporary file first, so a crash never leaves a
+    truncated log behind; with `remove`, the plain log is removed afterwards.
+    """
+    check_compression(compression)
+    if compression == "none" or split_log_suffix(path)[2] != "none":
+        return path
+
+    compressed_path = get_compressed_path(path, compression)
+    tmp_path = compressed_path + ".tmp"
+    with open(path, "rb") as src:
+        if compression == "gzip":
+            # mtime=0 keeps the output identical for identical logs
+            with gzip.GzipFile(tmp_path, "wb", compresslevel=level or DEFAULT_LEVELS["gzip"], mtime=0) as dst:
+                while chunk := src.read(1 << 20):
+                    dst.write(chunk)
+        else:
+            compressor = zstandard.ZstdCompressor(level=level or DEFAULT_LEVELS["zstd"])
+            with open(tmp_path, "wb") as dst:
+                compressor.copy_stream(src, dst)
+    stat = os.stat(path)
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))  # Keep the "most recent" order of logs
+    os.replace(tmp_path, compressed_path)
+    if remove:
+        os.remove(path)
+    return compressed_path
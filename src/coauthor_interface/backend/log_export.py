@@ -0,0 +1,264 @@
+"""
+Streaming bulk export of sessions.
+
+Getting the data of a study out used to mean copying proj_dir and
+metadata.txt by hand and loading every log into the single JSON object that
+`run_post_session_analysis.process_logs` expects. `SessionExporter` writes the
+sessions returned by a session query (see session_query.py) as one stream,
+one session at a time, so memory does not grow with the size of the export:
+
+- "ndjson": one line per session, {"session_id", "metadata", "logs",
+  "n_events"} (and "actions" with `analyze`). Log lines are copied as they
+  are stored, without parsing them.
+- "tar": `logs/<session_id>.jsonl` (and `actions/<session_id>.json`) per
+  session, then `metadata.jsonl`. Tar headers hold the size of each member,
+  so members are spooled to a temporary file first (in memory up to
+  SPOOL_SIZE bytes).
+
+The stream is compressed with gzip or zstd (which requires the optional
+`zstandard` package), or not at all. With `analyze`, every session goes
+through all levels of the post-session analysis (`analyze_session`), in
+`workers` processes with at most 2 * workers sessions in flight.
+"""
+
+import collections
+import gzip
+import io
+import sys
+import tarfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+from coauthor_interface import json_codec
+from coauthor_interface.backend.log_compression import COMPRESSION_SUFFIXES, check_compression, zstandard
+from coauthor_interface.backend.metrics import METRICS
+
+EXPORT_FORMATS = ("ndjson", "tar")
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "tar": "application/x-tar"}
+COMPRESSION_MIMETYPES = {"gzip": "application/gzip", "zstd": "application/zstd"}
+PAGE_SIZE = 500  # Sessions per query
+SPOOL_SIZE = 1 << 22  # Bytes of a tar member kept in memory before it is spooled to disk
+
+
+def get_export_name(format, compression):
+    """Return the file name of an export, e.g., sessions.ndjson.gz."""
+    return f"sessions.{format}{COMPRESSION_SUFFIXES.get(compression, '')}"
+
+
+def get_export_mimetype(format, compression):
+    return COMPRESSION_MIMETYPES.get(compression, EXPORT_MIMETYPES[format])
+
+
+def iter_sessions(index, page_size=PAGE_SIZE, **filters):
+    """Yield the records of the sessions that match the filters (see find_sessions), a page at a time."""
+    offset = 0
+    while True:
+        page = index.find_sessions(offset=offset, limit=page_size, **filters)
+        yield from page
+        if len(page) < page_size:
+            return
+        offset += len(page)
+
+
+def analyze_events(events):
+    """Return the actions of a session (run in worker processes)."""
+    # Imported here, since importing the analysis loads the spaCy model
+    from coauthor_interface.thought_toolkit.run_post_session_analysis import analyze_session
+
+    return analyze_session(events)
+
+
+class ChunkBuffer(io.RawIOBase):
+    """A write-only file whose content is taken out in chunks."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class SessionExporter:
+    def __init__(
+        self,
+        storage,
+        format="ndjson",
+        compression="gzip",
+        level=None,
+        analyze=False,
+        workers=1,
+        metrics=METRICS,
+    ):
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {format} (expected one of {', '.join(EXPORT_FORMATS)})")
+        check_compression(compression)
+        self.storage = storage  # LogStorage the logs are read from (see log_storage.py)
+        self.format = format
+        self.compression = compression
+        self.level = level
+        self.analyze = analyze
+        self.workers = workers
+        self.metrics = metrics
+
+    def _open_compressor(self, buffer):
+        if self.compression == "gzip":
+            return gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=self.level or 6)
+        if self.compression == "zstd":
+            compressor = zstandard.ZstdCompressor(level=self.level or 10)
+            return compressor.stream_writer(buffer, closefd=False)
+        return buffer
+
+    def _analyze(self, sessions):
+        """Yield (session, actions) for the sessions whose log could be read; actions is None on failure."""
+
+        def read(session):
+            try:
+                return self.storage.read_log(session["session_id"])
+            except Exception as e:
+                print(f"# Skipping {session['session_id']}: failed to read its log: {e}", file=sys.stderr)
+                return None
+
+        def analysis_failed(session, e):
+            print(f"# Failed to analyze {session['session_id']}: {e}", file=sys.stderr)
+
+        if self.workers <= 1:
+            for session in sessions:
+                events = read(session)
+                if events is None:
+                    continue
+                try:
+                    actions = analyze_events(events)
+                except Exception as e:
+                    analysis_failed(session, e)
+                    actions = None
+                yield session, actions
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = collections.deque()
+            for session in sessions:
+                events = read(session)
+                if events is not None:
+                    pending.append((session, executor.submit(analyze_events, events)))
+                while pending and (len(pending) >= 2 * self.workers or pending[0][1].done()):
+                    session, future = pending.popleft()
+                    try:
+                        actions = future.result()
+                    except Exception as e:
+                        analysis_failed(session, e)
+                        actions = None
+                    yield session, actions
+            for session, future in pending:
+                try:
+                    actions = future.result()
+                except Exception as e:
+                    analysis_failed(session, e)
+                    actions = None
+                yield session, actions
+
+    def _write_ndjson(self, writer, buffer, session_id, metadata, actions):
+        """Write the line of a session as its log lines are read, and yield the output in chunks."""
+        header = json_codec.dumps({"session_id": session_id, "metadata": metadata})
+        writer.write(header[:-1].encode("utf-8") + b', "logs": [')
+        n_events = 0
+        separator = b""
+        for chunk in self.storage.iter_lines(session_id):
+            # Newline-terminated lines become comma-separated events; the last comma is held back
+            n_events += chunk.count(b"\n")
+            chunk = chunk.replace(b"\n", b",")
+            writer.write(separator + chunk[:-1])
+            separator = chunk[-1:]
+            yield buffer.take()
+        footer = f'], "n_events": {n_events}'
+        if self.analyze:
+            footer += f', "actions": {self._dumps(actions)}'
+        writer.write(footer.encode("utf-8") + b"}\n")
+
+    def _add_member(self, tar, name, f):
+        info = tarfile.TarInfo(name)
+        info.size = f.tell()
+        info.mtime = int(time())
+        f.seek(0)
+        tar.addfile(info, f)
+
+    def _write_tar(self, tar, session_id, actions):
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as f:
+            for chunk in self.storage.iter_lines(session_id):
+                f.write(chunk)
+            self._add_member(tar, f"logs/{session_id}.jsonl", f)
+        if self.analyze:
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as f:
+                f.write(self._dumps(actions).encode("utf-8"))
+                self._add_member(tar, f"actions/{session_id}.json", f)
+
+    @staticmethod
+    def _dumps(obj):
+        # Actions hold values (e.g., sets) that only the analysis serializer handles
+        from coauthor_interface.thought_toolkit.utils import custom_serializer
+
+        return json_codec.dumps(obj, default=custom_serializer)
+
+    def iter_export(self, sessions):
+        """Yield the compressed export of the sessions (metadata records) in chunks of bytes.
+
+        Sessions without a log are skipped. Returns once the stream is complete.
+        """
+        sessions = (session for session in sessions if session.get("n_events") is not None)
+        if self.analyze:
+            sessions = self._analyze(sessions)
+        else:
+            sessions = ((session, None) for session in sessions)
+        buffer = ChunkBuffer()
+        writer = self._open_compressor(buffer)
+        tar = tarfile.open(fileobj=writer, mode="w|") if self.format == "tar" else None
+        metadata_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) if tar else None
+        n_sessions = 0
+        n_bytes = 0
+        try:
+            for session, actions in sessions:
+                metadata = dict(session)
+                metadata.pop("n_events")
+                session_id = metadata["session_id"]
+                try:
+                    # Raises KeyError before anything of the session is written
+                    self.storage.count(session_id)
+                    if tar is None:
+                        for data in self._write_ndjson(writer, buffer, session_id, metadata, actions):
+                            n_bytes += len(data)
+                            yield data
+                    else:
+                        self._write_tar(tar, session_id, actions)
+                        metadata_file.write((json_codec.dumps(metadata) + "\n").encode("utf-8"))
+                except KeyError:
+                    # Removed since it was indexed
+                    print(f"# Skipping {session_id}: its log was not found", file=sys.stderr)
+                    continue
+                n_sessions += 1
+                data = buffer.take()
+                n_bytes += len(data)
+                yield data
+
+            if tar is not None:
+                self._add_member(tar, "metadata.jsonl", metadata_file)
+                tar.close()
+            if writer is not buffer:
+                writer.close()
+            data = buffer.take()
+            n_bytes += len(data)
+            yield data
+        finally:
+            if metadata_file is not None:
+                metadata_file.close()
+            self.metrics.increment("export_sessions_written", n_sessions)
+            self.metrics.increment("export_bytes_written", n_bytes)
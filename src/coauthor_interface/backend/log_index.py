@@ -0,0 +1,291 @@
+"""
+Cached index of the log files under the replay directory.
+
+`retrieve_log_paths` walks the whole replay directory to find one session's
+log. `LogPathIndex` keeps the listing of every directory together with the
+directory's modification time, which changes whenever a file is added to,
+removed from, or renamed in it. Every log the server writes (saved, appended
+to by a checkpoint, or moved into place after streaming) goes through
+`record`, which adds the file and marks its directory, so a refresh only
+stats the marked directories and lists the ones whose modification time
+changed. Directories are all stat'ed only by `scan`: on the first lookup,
+when a log is not found or no longer exists (e.g., it was written by another
+process), and when every log is listed. Lookups therefore cost about the
+same regardless of the number of logs. The listing is saved to `index_path`
+so that a restarted server only lists the directories that changed in the
+meantime.
+
+The selection rules are the ones of `retrieve_log_paths`: a .jsonl log
+(plain or compressed) is preferred over a .json log, and the most recently
+modified file wins.
+"""
+
+import json
+import os
+import threading
+from time import perf_counter, time, time_ns
+
+from coauthor_interface.backend.log_compression import is_log_path, split_log_suffix
+from coauthor_interface.backend.metrics import METRICS
+
+INDEX_VERSION = 1
+
+# Files written next to session logs that are not logs themselves (e.g., <session_id>.actions.jsonl)
+SIDECAR_STEMS = (".actions", ".snapshots", ".summary")
+
+# A directory modified this recently may still change within the same mtime tick,
+# so it is listed again on the next refresh
+RACY_WINDOW_NS = 2 * 10**9
+
+
+def is_log_file(name):
+    # Hidden files are logs still being written (e.g., .ingest-*.jsonl, see log_ingest.py)
+    return (
+        is_log_path(name)
+        and not name.startswith(".")
+        and not split_log_suffix(name)[0].endswith(SIDECAR_STEMS)
+    )
+
+
+def get_session_id_of_log(name):
+    return split_log_suffix(name)[0]
+
+
+class LogPathIndex:
+    def __init__(self, root=None, index_path=None, check_interval=5.0, save_interval=60.0, metrics=METRICS):
+        self._lock = threading.RLock()
+        self.metrics = metrics
+        self.configure(root, index_path, check_interval, save_interval)
+
+    def configure(self, root, index_path=None, check_interval=5.0, save_interval=60.0):
+        with self._lock:
+            self.root = os.path.normpath(root) if root else None
+            self.index_path = index_path
+            self.check_interval = check_interval
+            self.save_interval = save_interval
+            self._dirs = dict()  # dir -> {"mtime": ns or None, "files": {name: mtime_ns}, "subdirs": [names]}
+            self._sessions = dict()  # session_id -> set of (dir, name)
+            self._changed = set()  # Directories to check on the next refresh
+            self._last_refresh = None
+            self._last_scan = None
+            self._last_save = None
+            self._dirty = False
+            self._load()
+
+    def _load(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"# Ignoring the log path index {self.index_path}: {e}")
+            return
+        if data.get("version") != INDEX_VERSION or data.get("root") != os.path.abspath(self.root):
+            return
+
+        self._dirs = data["dirs"]
+        for path, listing in self._dirs.items():
+            for name in listing["files"]:
+                self._sessions.setdefault(get_session_id_of_log(name), set()).add((path, name))
+
+    def save(self):
+        """Write the listing to `index_path` (atomically)."""
+        with self._lock:
+            if not self.index_path:
+                return
+            data = {"version": INDEX_VERSION, "root": os.path.abspath(self.root), "dirs": self._dirs}
+            tmp_path = f"{self.index_path}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.index_path)
+            except OSError as e:
+                print(f"# Failed to save the log path index: {e}")
+                return
+            self._dirty = False
+            self._last_save = time()
+
+    def refresh(self):
+        """List the directories recorded since the last refresh if they changed (all of them the first time)."""
+        with self._lock:
+            if self.root is None:
+                return
+            if self._last_scan is None:
+                self.scan()
+                return
+            start = perf_counter()
+            changed, self._changed = self._changed, set()
+            for path in changed:
+                self._check_dir(path, recursive=False)
+            self._last_refresh = time()
+            self.metrics.observe("log_index_refresh_seconds", perf_counter() - start)
+            self._save_if_due()
+
+    def scan(self):
+        """Stat every directory and list the ones that changed, e.g., by another process."""
+        with self._lock:
+            if self.root is None:
+                return
+            start = perf_counter()
+            self._changed = set()
+            self._check_dir(self.root)
+            self._last_scan = self._last_refresh = time()
+            self.metrics.increment("log_index_scans")
+            self.metrics.observe("log_index_refresh_seconds", perf_counter() - start)
+            self._save_if_due()
+
+    def _save_if_due(self):
+        if self._dirty and (self._last_save is None or time() - self._last_save >= self.save_interval):
+            self.save()
+
+    def _check_dir(self, path, recursive=True):
+        """List a directory if its modification time changed, and check its subdirectories.
+
+        Without `recursive`, only the subdirectories that are not indexed yet are checked.
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._drop_dir(path)
+            return
+
+        listing = self._dirs.get(path)
+        if listing is None or listing["mtime"] is None or listing["mtime"] != mtime:
+            listing = self._list_dir(path, mtime)
+            if listing is None:
+                return
+        for name in listing["subdirs"]:
+            subdir = os.path.join(path, name)
+            if recursive or subdir not in self._dirs:
+                self._check_dir(subdir)
+
+    def _list_dir(self, path, mtime):
+        files = dict()
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif is_log_file(entry.name):
+                        files[entry.name] = entry.stat().st_mtime_ns
+        except OSError:
+            self._drop_dir(path)
+            return None
+
+        previous = self._dirs.get(path)
+        if previous is not None:
+            for name in previous["files"]:
+                self._remove_file(path, name)
+            for name in previous["subdirs"]:
+                if name not in subdirs:
+                    self._drop_dir(os.path.join(path, name))
+
+        if time_ns() - mtime < RACY_WINDOW_NS:
+            mtime = None
+            self._changed.add(path)
+        listing = {"mtime": mtime, "files": files, "subdirs": subdirs}
+        self._dirs[path] = listing
+        for name in files:
+            self._sessions.setdefault(get_session_id_of_log(name), set()).add((path, name))
+        self._dirty = True
+        self.metrics.increment("log_index_dirs_listed")
+        return listing
+
+    def _remove_file(self, path, name):
+        session_id = get_session_id_of_log(name)
+        entries = self._sessions.get(session_id)
+        if entries is not None:
+            entries.discard((path, name))
+            if not entries:
+                del self._sessions[session_id]
+
+    def _drop_dir(self, path):
+        listing = self._dirs.pop(path, None)
+        if listing is None:
+            return
+        for name in listing["files"]:
+            self._remove_file(path, name)
+        for name in listing["subdirs"]:
+            self._drop_dir(os.path.join(path, name))
+        self._dirty = True
+
+    def record(self, path):
+        """Record a log file that was just written; every writer of logs calls this (see api_server.py)."""
+        with self._lock:
+            if self.root is None:
+                return
+            directory, name = os.path.split(os.path.abspath(path))
+            relative_dir = os.path.relpath(directory, os.path.abspath(self.root))
+            if relative_dir.startswith(os.pardir) or not is_log_file(name):
+                return  # Outside of the replay directory
+            directory = os.path.normpath(os.path.join(self.root, relative_dir))
+
+            listing = self._record_dir(directory)
+            if listing is None:
+                return  # Listed by the next refresh
+            try:
+                listing["files"][name] = os.stat(path).st_mtime_ns
+            except OSError:
+                return
+            self._sessions.setdefault(get_session_id_of_log(name), set()).add((directory, name))
+            # The write may also have removed files (e.g., a plain log replaced by its compressed copy)
+            self._changed.add(directory)
+            self._dirty = True
+
+    def _record_dir(self, directory):
+        """Return the listing of a directory, listing it if it is new (e.g., a new log shard, see log_layout.py)."""
+        listing = self._dirs.get(directory)
+        if listing is not None or directory == self.root:
+            return listing
+        parent = self._record_dir(os.path.dirname(directory))
+        if parent is None:
+            return None
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        listing = self._list_dir(directory, mtime)
+        if listing is not None and os.path.basename(directory) not in parent["subdirs"]:
+            parent["subdirs"].append(os.path.basename(directory))
+        return listing
+
+    def _best_path(self, session_id):
+        best = None
+        best_key = None
+        for directory, name in self._sessions.get(session_id, ()):
+            # Prefer .jsonl, then the most recent version
+            key = (split_log_suffix(name)[1] == ".jsonl", self._dirs[directory]["files"][name])
+            if best_key is None or key > best_key:
+                best, best_key = os.path.join(directory, name), key
+        return best
+
+    def get(self, session_id):
+        """Return the path of the log of a session, or None."""
+        with self._lock:
+            if self._last_refresh is None or time() - self._last_refresh >= self.check_interval:
+                self.refresh()
+            path = self._best_path(session_id)
+            if path is None or not os.path.exists(path):
+                self.metrics.increment("log_index_misses")
+                self.scan()
+                path = self._best_path(session_id)
+            return path
+
+    def paths(self):
+        """Return {session_id: path} for every log, like `retrieve_log_paths`."""
+        with self._lock:
+            self.scan()
+            return {session_id: self._best_path(session_id) for session_id in self._sessions}
+
+    def entries(self):
+        """Return {session_id: (path, mtime_ns)} for every log."""
+        with self._lock:
+            self.scan()
+            entries = dict()
+            for session_id in self._sessions:
+                path = self._best_path(session_id)
+                directory, name = os.path.split(path)
+                entries[session_id] = (path, self._dirs[directory]["files"][name])
+            return entries
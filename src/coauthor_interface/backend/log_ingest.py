@@ -0,0 +1,245 @@
+"""
+Streaming ingestion of session logs from request bodies.
+
+`request.json` builds the whole `logs` array of an `/api/end_session` body in
+memory before the log is written. For large bodies, `parse_streaming_object`
+reads the body in chunks instead and passes the events of the array to a
+callback one at a time, keeping only the other (small) members of the body.
+
+`LogIngestor` is such a callback: it writes each event to a temporary log
+file as it arrives, and keeps only what the summary of the log needs (event
+counts, the first and last timestamps, and the current document), writing the
+document snapshots of the log (see doc_snapshots.py) along the way. `commit`
+moves the files into place, so memory does not grow with the length of the
+session.
+"""
+
+import codecs
+import collections
+import json
+import os
+import tempfile
+
+from coauthor_interface import json_codec
+from coauthor_interface.backend.doc_snapshots import apply_events, get_snapshot_path
+from coauthor_interface.backend.log_compression import COMPRESSION_SUFFIXES, open_log
+from coauthor_interface.backend.log_summary import SUMMARY_VERSION, get_authorship
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = " \t\n\r"
+DELIMITERS = ",:]}" + WHITESPACE
+
+
+class StreamingParseError(ValueError):
+    pass
+
+
+class _StreamBuffer:
+    """Text decoded from a binary stream, read on demand."""
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.position = 0
+        self.eof = False
+
+    def fill(self):
+        """Read another chunk. Returns False at the end of the stream."""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.text = self.text[self.position :] + self.decoder.decode(b"", final=True)
+        else:
+            self.text = self.text[self.position :] + self.decoder.decode(chunk)
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it."""
+        while True:
+            while self.position < len(self.text) and self.text[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if not self.fill():
+                raise StreamingParseError("Unexpected end of the request body")
+
+    def expect(self, characters):
+        character = self.peek()
+        if character not in characters:
+            raise StreamingParseError(f"Expected one of {characters!r} at {character!r}")
+        self.position += 1
+        return character
+
+    def decode_value(self, decoder):
+        """Decode the next JSON value, reading more of the stream until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.position)
+                # A value must be followed by a delimiter: a number (e.g., "1" of "1.5") may continue in the next chunk
+                if self.eof or (end < len(self.text) and self.text[end] in DELIMITERS):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise StreamingParseError(str(e)) from e
+            self.fill()
+
+
+def parse_streaming_object(stream, stream_key, on_item, chunk_size=CHUNK_SIZE):
+    """Parse the JSON object of a binary stream, passing each item of the array at `stream_key` to `on_item`.
+
+    Returns (the other members of the object, the number of streamed items or None if there is no
+    `stream_key`). Raises StreamingParseError if the stream is not a JSON object.
+    """
+    buffer = _StreamBuffer(stream, chunk_size)
+    decoder = json.JSONDecoder()
+    content = dict()
+    n_items = None
+
+    buffer.expect("{")
+    if buffer.peek() == "}":
+        buffer.position += 1
+        return content, n_items
+    while True:
+        if buffer.peek() != '"':
+            raise StreamingParseError("Expected a member name")
+        key = buffer.decode_value(decoder)
+        buffer.expect(":")
+        if key == stream_key and buffer.peek() == "[":
+            buffer.position += 1
+            n_items = 0
+            if buffer.peek() == "]":
+                buffer.position += 1
+            else:
+                while True:
+                    on_item(buffer.decode_value(decoder))
+                    n_items += 1
+                    if buffer.expect(",]") == "]":
+                        break
+        else:
+            content[key] = buffer.decode_value(decoder)
+        if buffer.expect(",}") == "}":
+            return content, n_items
+
+
+class LogIngestor:
+    """Write the events of a log one at a time, summarizing and snapshotting them on the fly."""
+
+    def __init__(self, log_dir, compression="none", level=None, snapshot_interval=100):
+        suffix = ".jsonl" + COMPRESSION_SUFFIXES.get(compression, "")
+        fd, self.tmp_path = tempfile.mkstemp(dir=log_dir, prefix=".ingest-", suffix=suffix)
+        os.close(fd)
+        self._file = open_log(self.tmp_path, "w", level=level)
+        self.snapshot_interval = snapshot_interval
+        self._snapshots_path = f"{self.tmp_path}.snapshots"
+        self._snapshots_file = None
+
+        self.n_events = 0
+        self.event_counter = collections.Counter()
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.start = None  # Index of the system-initialize event
+        self.text = None
+        self.mask = None
+        self.last_event = None
+
+    def _write_snapshot(self, event, timestamp):
+        if self._snapshots_file is None:
+            return
+        snapshot = {"event": event, "timestamp": timestamp, "text": self.text, "mask": self.mask}
+        self._snapshots_file.write(json_codec.dumps(snapshot) + "\n")
+
+    def add(self, event):
+        """Write an event to the log."""
+        if not isinstance(event, dict):
+            raise StreamingParseError(f"Event {self.n_events} is not a JSON object")
+        self._file.write(json_codec.dumps(event))
+        self._file.write("\n")
+
+        event_name = event.get("eventName")
+        if event_name:
+            self.event_counter[event_name] += 1
+        timestamp = event.get("eventTimestamp")
+        if timestamp is not None:
+            self.first_timestamp = (
+                timestamp if self.first_timestamp is None else min(self.first_timestamp, timestamp)
+            )
+            self.last_timestamp = (
+                timestamp if self.last_timestamp is None else max(self.last_timestamp, timestamp)
+            )
+
+        if self.start is None and event_name == "system-initialize":
+            self.start = self.n_events
+            prompt = event.get("currentDoc", "").strip()
+            self.text, self.mask = prompt, "P" * len(prompt)
+            if self.snapshot_interval > 0:
+                self._snapshots_file = open(self._snapshots_path, "w")
+            self._write_snapshot(self.start, None)
+        if self.start is not None:
+            self.text, self.mask = apply_events(self.text, self.mask, [event])
+        self.n_events += 1
+        self.last_event = event
+
+        if self.start is not None and (self.n_events - self.start) % max(self.snapshot_interval, 1) == 0:
+            self._write_snapshot(self.n_events, timestamp)
+
+    def close(self):
+        self._file.close()
+        if self._snapshots_file is not None:
+            self._snapshots_file.close()
+
+    def summarize(self, config=None):
+        """Return the summary of the log (see log_summary.py)."""
+        text, mask = self.text, self.mask
+        if self.start is None:
+            # Without a system-initialize event, the last event holds the document (see get_last_document_from_log)
+            text, mask = "", ""
+            if self.last_event is not None:
+                text = self.last_event.get("currentDoc", "").strip()
+                text, mask = apply_events(text, "P" * len(text), [self.last_event])
+        duration = None
+        if self.first_timestamp is not None:
+            duration = (self.last_timestamp - self.first_timestamp) / 1000
+        return {
+            "version": SUMMARY_VERSION,
+            "n_events": self.n_events,
+            "duration": duration,
+            "stats": {"eventCounter": dict(self.event_counter)},
+            "last_text": text,
+            "authorship": get_authorship(mask),
+            "config": config,
+        }
+
+    def commit(self, path):
+        """Move the log (and its document snapshots) to `path`."""
+        self.close()
+        if self._snapshots_file is not None:
+            os.replace(self._snapshots_path, get_snapshot_path(path))
+            self._snapshots_file = None
+        else:
+            # Snapshots of a log without a system-initialize event are made when it is first read
+            try:
+                os.remove(get_snapshot_path(path))
+            except FileNotFoundError:
+                pass
+        os.replace(self.tmp_path, path)
+
+    def events(self):
+        """Yield the events of the closed log, read back from the temporary file."""
+        with open_log(self.tmp_path) as f:
+            for line in f:
+                yield json_codec.loads(line)
+
+    def discard(self):
+        self.close()
+        for path in (self.tmp_path, self._snapshots_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,98 @@
+"""
+Sharded on-disk layout of session logs.
+
+Logs are stored directly in the project directory (the "flat" layout, shard
+depth 0) unless the operator opts into sharding with --log_shard_depth.
+A project directory with every log directly in it becomes slow to list (and
+to back up) once it holds hundreds of thousands of sessions. With a shard
+depth of 2, the log of session `abcdef...` is stored as
+`<proj_dir>/ab/cd/abcdef....jsonl`, together with its sidecar files (actions,
+snapshots, summary, and seal), so every directory stays small. Session ids
+are uuid hex strings, so their prefixes spread sessions evenly; other ids are
+sharded by a hash of the id.
+
+Logs saved before sharding was turned on stay where they are: the paths
+returned by `get_session_path` keep pointing to them, so their sessions can be
+checkpointed and read as before, until `migrate_to_sharded` (see
+scripts/migrate_log_layout.py) moves them into their shards. Once logs are
+moved, the server has to keep running with the same --log_shard_depth.
+"""
+
+import hashlib
+import os
+import re
+
+from coauthor_interface.backend.log_compression import COMPRESSION_SUFFIXES
+
+SHARD_WIDTH = 2  # Characters of the session id per directory level
+DEFAULT_SHARD_DEPTH = 0  # Flat; sharding is opt-in
+SHARDED_DEPTH = 2  # Levels of the sharded layout when no depth is given (e.g., by migrate_to_sharded)
+
+SESSION_ID_PATTERN = re.compile(r"[0-9a-f]+")
+
+
+def get_shard_dirs(session_id, depth=SHARDED_DEPTH):
+    """Return the directory names of the shard of a session, e.g., ["ab", "cd"]."""
+    key = session_id
+    if not SESSION_ID_PATTERN.fullmatch(session_id) or len(session_id) < depth * SHARD_WIDTH:
+        key = hashlib.blake2b(session_id.encode("utf-8"), digest_size=16).hexdigest()
+    return [key[i * SHARD_WIDTH : (i + 1) * SHARD_WIDTH] for i in range(depth)]
+
+
+def get_sharded_path(proj_dir, session_id, suffix=".jsonl", depth=SHARDED_DEPTH):
+    return os.path.join(proj_dir, *get_shard_dirs(session_id, depth), session_id + suffix)
+
+
+def get_flat_path(proj_dir, session_id, suffix=".jsonl"):
+    return os.path.join(proj_dir, session_id + suffix)
+
+
+def _exists(path):
+    """Return True if the file exists, plain or compressed."""
+    return any(os.path.exists(path + suffix) for suffix in ("", *COMPRESSION_SUFFIXES.values()))
+
+
+def get_session_path(proj_dir, session_id, suffix=".jsonl", depth=DEFAULT_SHARD_DEPTH, create=True):
+    """Return the path of a file of a session (its log by default) in `proj_dir`.
+
+    The file of a session saved in the flat layout is used if there is no sharded
+    one. Otherwise, the shard directory is created if `create` is set.
+    """
+    if depth <= 0:
+        return get_flat_path(proj_dir, session_id, suffix)
+    path = get_sharded_path(proj_dir, session_id, suffix, depth)
+    if not _exists(path):
+        flat_path = get_flat_path(proj_dir, session_id, suffix)
+        if _exists(flat_path):
+            return flat_path
+        if create:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def migrate_to_sharded(proj_dir, depth=SHARDED_DEPTH, dry_run=False):
+    """Move the files of flat sessions in `proj_dir` into their shards.
+
+    Every file named `<session_id>.<suffix>` (logs and their sidecars) is moved; hidden
+    files (logs still being written) are skipped, and so are files whose sharded
+    version already exists. Returns {"moved": n, "skipped": [names]}.
+    """
+    moved = 0
+    skipped = []
+    with os.scandir(proj_dir) as entries:
+        names = sorted(entry.name for entry in entries if entry.is_file(follow_symlinks=False))
+    for name in names:
+        session_id, dot, _ = name.partition(".")
+        if not session_id or not dot:
+            continue  # Hidden or not a session file
+        path = os.path.join(proj_dir, name)
+        new_path = os.path.join(proj_dir, *get_shard_dirs(session_id, depth), name)
+        if os.path.exists(new_path):
+            print(f"# Skipping {path}: {new_path} already exists")
+            skipped.append(name)
+            continue
+        if not dry_run:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(path, new_path)
+        moved += 1
+    return {"moved": moved, "skipped": skipped}
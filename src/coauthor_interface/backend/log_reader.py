@@ -0,0 +1,361 @@
+"""
+Random access to the events of a log.
+
+`read_log` parses a whole log even when replay only needs a slice of it.
+`LineOffsetIndex` records where each line (event) of a plain .jsonl log ends,
+so `LogReader` can read exactly the bytes of events [offset, offset + limit)
+and either parse them (`read_range`) or pass them through unparsed
+(`iter_lines`, for NDJSON streaming).
+
+The indexes of recently read logs are cached. Logs grow by appends (see
+log_checkpoint.py), so when a log has grown since it was indexed, only the new
+bytes are scanned, after checking that the last indexed line is unchanged;
+any other change rebuilds the index. Compressed and .json logs cannot be
+sliced by bytes; they are read sequentially, without parsing the skipped
+events of a compressed .jsonl log.
+
+The indexes of large logs (at least `persist_min_bytes`) are also saved next
+to the log, as `<session_id>.lines.idx`, so a log is scanned once rather than
+once per process or after every restart. A saved index is checked like a
+cached one before it is used.
+
+`MappedLog` is a sequence of the events of a plain .jsonl log backed by a
+memory map of the file: events are decoded when they are accessed, and slices
+are views, so stats and replay code written for lists of events (e.g.,
+`summarize_log`) works on huge logs without loading them.
+`LogReader.map_log` returns one (or the list of events of other logs).
+"""
+
+import collections
+import collections.abc
+import contextlib
+import copy
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+
+from coauthor_interface import json_codec
+from coauthor_interface.backend.log_compression import open_log, split_log_suffix
+from coauthor_interface.backend.metrics import METRICS
+from coauthor_interface.backend.reader import read_log
+
+CHUNK_SIZE = 1 << 20
+PERSIST_MIN_BYTES = 1 << 20  # Logs whose line index is saved next to them
+
+LINE_INDEX_FILE_SUFFIX = ".lines.idx"
+LINE_INDEX_MAGIC = b"LINEIDX1"
+# Magic, mtime_ns, bytes indexed, file size, CRC of the last line (-1 if none), number of lines
+LINE_INDEX_HEADER = struct.Struct("<8sqqqqq")
+
+
+def get_line_index_path(log_path):
+    return split_log_suffix(str(log_path))[0] + LINE_INDEX_FILE_SUFFIX
+
+
+class LineOffsetIndex:
+    """End offsets of the complete lines of a plain .jsonl file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.ends = array("q")  # ends[i] is the offset just after the newline of line i
+        self.mtime_ns = None
+        self.size = 0  # Bytes indexed (the end of the last complete line)
+        self.file_size = 0
+        self.last_line_crc = None
+
+    def __len__(self):
+        return len(self.ends)
+
+    def get_span(self, start, stop):
+        """Return the byte range of lines [start, stop)."""
+        return (self.ends[start - 1] if start > 0 else 0), (self.ends[stop - 1] if stop > 0 else 0)
+
+    def _read_last_line_crc(self, f):
+        if not self.ends:
+            return None
+        start, stop = self.get_span(len(self.ends) - 1, len(self.ends))
+        f.seek(start)
+        return zlib.crc32(f.read(stop - start))
+
+    def update(self):
+        """Index the lines appended since the last update. Returns the number of bytes scanned."""
+        stat = os.stat(self.path)
+        if stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.file_size:
+            return 0
+
+        with open(self.path, "rb") as f:
+            if stat.st_size < self.size or self._read_last_line_crc(f) != self.last_line_crc:
+                # Rewritten rather than appended to
+                self.ends = array("q")
+                self.size = 0
+
+            f.seek(self.size)
+            position = self.size
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                start = 0
+                while True:
+                    end = chunk.find(b"\n", start)
+                    if end < 0:
+                        break
+                    self.ends.append(position + end + 1)
+                    start = end + 1
+                position += len(chunk)
+
+            scanned = position - self.size
+            self.size = self.ends[-1] if self.ends else 0  # A line still being written is indexed next time
+            self.file_size = position
+            self.mtime_ns = stat.st_mtime_ns
+            self.last_line_crc = self._read_last_line_crc(f)
+        return scanned
+
+    def save(self, index_path=None):
+        """Write the index next to the log (or to index_path)."""
+        index_path = index_path or get_line_index_path(self.path)
+        ends = array("q", self.ends)
+        if sys.byteorder == "big":
+            ends.byteswap()  # Saved in little-endian order
+        crc = -1 if self.last_line_crc is None else self.last_line_crc
+        header = LINE_INDEX_HEADER.pack(
+            LINE_INDEX_MAGIC, self.mtime_ns, self.size, self.file_size, crc, len(ends)
+        )
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(ends.tobytes())
+        os.replace(tmp_path, index_path)
+        return index_path
+
+    @classmethod
+    def load(cls, path, index_path=None):
+        """Return the index of a log saved by `save`, or None if there is none or it is invalid.
+
+        The index may be out of date; `update` checks it against the log.
+        """
+        index_path = index_path or get_line_index_path(path)
+        try:
+            with open(index_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < LINE_INDEX_HEADER.size:
+            return None
+        magic, mtime_ns, size, file_size, crc, n_lines = LINE_INDEX_HEADER.unpack_from(data)
+        if magic != LINE_INDEX_MAGIC or len(data) != LINE_INDEX_HEADER.size + 8 * n_lines:
+            return None
+
+        index = cls(path)
+        index.ends.frombytes(data[LINE_INDEX_HEADER.size :])
+        if sys.byteorder == "big":
+            index.ends.byteswap()
+        if (index.ends[-1] if index.ends else 0) != size:
+            return None
+        index.mtime_ns = mtime_ns
+        index.size = size
+        index.file_size = file_size
+        index.last_line_crc = None if crc < 0 else crc
+        return index
+
+
+class MappedLog(collections.abc.Sequence):
+    """The events of a plain .jsonl log, decoded from a memory map of the file when they are accessed.
+
+    The events are those of the index (the complete lines when the log was opened). Slices
+    are views of the same map; `close` (or leaving a `with` block) unmaps the file. Logs grow
+    by appends (see log_checkpoint.py) or are replaced as a whole (see helper.save_log_to_jsonl), so a
+    mapped file is never truncated.
+    """
+
+    def __init__(self, path, index=None):
+        if index is None:
+            index = LineOffsetIndex(path)
+            index.update()
+        self.path = path
+        self._ends = index.ends
+        self._start = 0
+        self._stop = len(index.ends)
+        self._owner = True
+        self._file = open(path, "rb")
+        try:
+            if os.fstat(self._file.fileno()).st_size < index.size:
+                raise ValueError(f"{path} is shorter than its line index")
+            # Empty files cannot be mapped
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if index.size else b""
+        except BaseException:
+            self._file.close()
+            raise
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def get_line(self, i):
+        """Return the raw JSON line (bytes, newline-terminated) of event i."""
+        n = self._start + i
+        return self._map[(self._ends[n - 1] if n > 0 else 0) : self._ends[n]]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            view = copy.copy(self)
+            view._start = self._start + start
+            view._stop = self._start + max(start, stop)
+            view._owner = False
+            return view
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("event index out of range")
+        return json_codec.loads(self.get_line(i))
+
+    def __iter__(self):
+        start = self._ends[self._start - 1] if self._start > 0 else 0
+        for n in range(self._start, self._stop):
+            end = self._ends[n]
+            yield json_codec.loads(self._map[start:end])
+            start = end
+
+    def close(self):
+        if self._owner:
+            if isinstance(self._map, mmap.mmap):
+                self._map.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LogReader:
+    def __init__(self, max_indexes=256, persist_min_bytes=PERSIST_MIN_BYTES, metrics=METRICS):
+        self._lock = threading.Lock()
+        self.max_indexes = max_indexes
+        self.persist_min_bytes = persist_min_bytes  # None never saves indexes
+        self.metrics = metrics
+        self._indexes = collections.OrderedDict()  # path -> LineOffsetIndex, least recently used first
+
+    def get_index(self, path):
+        """Return the up-to-date line index of a plain .jsonl log."""
+        with self._lock:
+            index = self._indexes.pop(path, None)
+            if index is None and self.persist_min_bytes is not None:
+                index = LineOffsetIndex.load(path)
+                if index is not None:
+                    self.metrics.increment("log_offset_index_loads")
+            if index is None:
+                index = LineOffsetIndex(path)
+                self.metrics.increment("log_offset_index_builds")
+            self._indexes[path] = index
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+            scanned = index.update()
+            if scanned and self.persist_min_bytes is not None and index.size >= self.persist_min_bytes:
+                try:
+                    index.save()
+                    self.metrics.increment("log_offset_index_saves")
+                except OSError as e:
+                    print(f"# Failed to save the line index of {path}: {e}")
+        self.metrics.increment("log_bytes_indexed", scanned)
+        return index
+
+    @contextlib.contextmanager
+    def map_log(self, path):
+        """Yield the events of a log as a sequence: a MappedLog for plain .jsonl logs, a list otherwise."""
+        log = None
+        if self.is_seekable(path):
+            index = self.get_index(path)
+            try:
+                log = MappedLog(path, index)
+            except (OSError, ValueError) as e:
+                # E.g., file systems that do not support memory maps
+                print(f"# Failed to map {path}; reading it instead: {e}")
+        if log is None:
+            yield read_log(path)
+            return
+        try:
+            yield log
+        finally:
+            log.close()
+
+    @staticmethod
+    def is_seekable(path):
+        _, suffix, compression = split_log_suffix(path)
+        return suffix == ".jsonl" and compression == "none"
+
+    def count(self, path):
+        """Return the number of events in a log."""
+        if self.is_seekable(path):
+            return len(self.get_index(path))
+        return self.read_range(path, 0, 0)[1]
+
+    def _get_stop(self, total, offset, limit):
+        return total if limit is None else min(total, offset + limit)
+
+    def iter_lines(self, path, offset=0, limit=None):
+        """Yield the raw JSON lines (bytes, newline-terminated) of events [offset, offset + limit)."""
+        if self.is_seekable(path):
+            index = self.get_index(path)
+            stop = self._get_stop(len(index), offset, limit)
+            if offset >= stop:
+                return
+            start_byte, stop_byte = index.get_span(offset, stop)
+            self.metrics.increment("log_bytes_read", stop_byte - start_byte)
+            with open(path, "rb") as f:
+                f.seek(start_byte)
+                remaining = stop_byte - start_byte
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            return
+
+        if split_log_suffix(path)[1] == ".jsonl":
+            with open_log(path) as f:
+                n_events = 0
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if limit is not None and n_events >= offset + limit:
+                        break
+                    if n_events >= offset:
+                        yield (line if line.endswith("\n") else line + "\n").encode("utf-8")
+                    n_events += 1
+            return
+
+        log = read_log(path)
+        for event in log[offset : self._get_stop(len(log), offset, limit)]:
+            yield (json_codec.dumps(event) + "\n").encode("utf-8")
+
+    def read_range(self, path, offset=0, limit=None):
+        """Return (events [offset, offset + limit), total number of events)."""
+        if self.is_seekable(path):
+            data = b"".join(self.iter_lines(path, offset, limit))
+            events = [json_codec.loads(line) for line in data.splitlines()]
+            return events, len(self.get_index(path))
+
+        if split_log_suffix(path)[1] == ".jsonl":
+            # Compressed: decompress everything, but only parse the requested events
+            events = []
+            total = 0
+            with open_log(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if total >= offset and (limit is None or total < offset + limit):
+                        events.append(json_codec.loads(line))
+                    total += 1
+            return events, total
+
+        log = read_log(path)
+        return log[offset : self._get_stop(len(log), offset, limit)], len(log)
@@ -0,0 +1,587 @@
+"""
+Storage backends of session metadata and logs.
+
+`LogStorage` is the interface the server needs from a store: record the
+metadata of started sessions, save whole logs or append checkpoints, and read
+ranges of events. Two implementations are provided:
+
+- `FileLogStorage`: the metadata file and per-session .jsonl logs (the
+  default layout of the server, see log_layout.py), for tools that work on a
+  log archive.
+- `SQLiteLogStorage`: a single SQLite database (--log_storage sqlite). Events
+  are stored in rows of up to `batch_size` events, keyed by the session and
+  the index of their first event, so a page of a log reads a few rows.
+  Sessions are indexed by access code, domain, and start time, and logs and
+  event batches by their timestamps, so researchers can find sessions with
+  indexed queries instead of scanning files.
+
+Several server processes can share a database: each process creates or
+migrates the schema once and keeps a small pool of connections that its
+threads take in turn, the database uses write-ahead logging so that readers
+do not block writers, and each save or checkpoint is a single transaction.
+"""
+
+import contextlib
+from abc import ABC, abstractmethod
+import json
+import os
+import sqlite3
+import threading
+
+from coauthor_interface import json_codec
+from coauthor_interface.backend.helper import append_session_to_file, save_log_to_jsonl, session_serializer
+from coauthor_interface.backend.log_checkpoint import CheckpointGapError, LogCheckpointer, LogSealedError
+from coauthor_interface.backend.log_compression import get_compressed_path
+from coauthor_interface.backend.log_index import LogPathIndex
+from coauthor_interface.backend.log_layout import DEFAULT_SHARD_DEPTH, get_session_path
+from coauthor_interface.backend.log_reader import LogReader
+from coauthor_interface.backend.metadata_index import MetadataIndex
+from coauthor_interface.backend.metrics import METRICS
+from coauthor_interface.backend.reader import update_metadata
+
+STORAGES = ("files", "sqlite")
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_POOL_SIZE = 8  # Idle connections kept per process; busier threads open and close extra ones
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    access_code TEXT,
+    domain TEXT,
+    engine TEXT,
+    show_interventions INTEGER,
+    start_timestamp REAL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_access_code ON sessions (access_code, start_timestamp);
+CREATE INDEX IF NOT EXISTS sessions_domain ON sessions (domain, start_timestamp);
+CREATE INDEX IF NOT EXISTS sessions_engine ON sessions (engine, start_timestamp);
+CREATE INDEX IF NOT EXISTS sessions_start_timestamp ON sessions (start_timestamp);
+
+CREATE TABLE IF NOT EXISTS logs (
+    session_id TEXT PRIMARY KEY,
+    n_events INTEGER NOT NULL,
+    first_timestamp INTEGER,
+    last_timestamp INTEGER,
+    sealed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS logs_n_events ON logs (n_events);
+CREATE INDEX IF NOT EXISTS logs_first_timestamp ON logs (first_timestamp);
+CREATE INDEX IF NOT EXISTS logs_last_timestamp ON logs (last_timestamp);
+
+CREATE TABLE IF NOT EXISTS event_batches (
+    session_id TEXT NOT NULL,
+    first_event INTEGER NOT NULL,
+    n_events INTEGER NOT NULL,
+    first_timestamp INTEGER,
+    last_timestamp INTEGER,
+    events TEXT NOT NULL,
+    PRIMARY KEY (session_id, first_event)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS event_batches_last_timestamp ON event_batches (session_id, last_timestamp);
+"""
+
+# Conditions of the filters of session queries (see SQLiteDatabase.find_sessions)
+QUERY_FILTERS = {
+    "access_code": "sessions.access_code = ?",
+    "domain": "sessions.domain = ?",
+    "engine": "sessions.engine = ?",
+    "show_interventions": "sessions.show_interventions = ?",
+    "start": "sessions.start_timestamp >= ?",
+    "end": "sessions.start_timestamp < ?",
+    "min_events": "logs.n_events >= ?",
+    "max_events": "logs.n_events <= ?",
+}
+
+
+class LogStorage(ABC):
+    """Interface of the stores of session metadata and logs."""
+
+    name = None
+
+    @abstractmethod
+    def record_session(self, session):
+        """Store the metadata record of a started session (the latest record of a session wins)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, session_id):
+        """Return the metadata record of a session, or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def records(self):
+        """Yield the metadata record of every session."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def sessions(self):
+        """Return the IDs of the sessions that have a log."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_log(self, session_id, events):
+        """Replace the log of a session with an iterable of events; returns the number of events."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_events(self, session_id, seq, events, seal=False):
+        """Append the events of a checkpoint that starts at event `seq` (see log_checkpoint.py).
+
+        Returns the number of events in the log after the checkpoint.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self, session_id):
+        """Return the number of events in the log of a session; raises KeyError if there is none."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_range(self, session_id, offset=0, limit=None):
+        """Return (events [offset, offset + limit), total number of events); raises KeyError."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_lines(self, session_id, offset=0, limit=None):
+        """Yield the events [offset, offset + limit) as newline-terminated JSON lines (bytes)."""
+        raise NotImplementedError
+
+    def read_log(self, session_id):
+        return self.read_range(session_id)[0]
+
+    @abstractmethod
+    def close(self):
+        """Release the resources of the store (e.g., database connections)."""
+        raise NotImplementedError
+
+
+class FileLogStorage(LogStorage):
+    """Metadata in <log_dir>/metadata.txt; logs saved in <log_dir>/<proj_name> and read from replay_dir."""
+
+    name = "files"
+
+    def __init__(
+        self,
+        log_dir,
+        proj_name="",
+        replay_dir=None,
+        compression="none",
+        shard_depth=DEFAULT_SHARD_DEPTH,
+        path_index=None,
+        reader=None,
+        metrics=METRICS,
+    ):
+        self.metadata_path = os.path.join(log_dir, "metadata.txt")
+        self.proj_dir = os.path.join(log_dir, proj_name) if proj_name else log_dir
+        self.compression = compression
+        self.shard_depth = shard_depth
+        self.metadata_index = MetadataIndex(self.metadata_path, metrics=metrics)
+        # The server passes its own index and reader (LOG_PATH_INDEX and LOG_READER)
+        self.path_index = path_index or LogPathIndex(replay_dir or log_dir, check_interval=0, metrics=metrics)
+        self.reader = reader or LogReader(metrics=metrics)
+        self.checkpoints = LogCheckpointer(fsync_interval=0, metrics=metrics)
+
+    def _get_path(self, session_id):
+        path = self.path_index.get(session_id)
+        if path is None:
+            raise KeyError(session_id)
+        return path
+
+    def record_session(self, session):
+        append_session_to_file(session, self.metadata_path)
+
+    def get(self, session_id):
+        if not os.path.exists(self.metadata_path):
+            return None
+        return self.metadata_index.get(session_id)
+
+    def records(self):
+        if not os.path.exists(self.metadata_path):
+            return iter(())
+        return iter(update_metadata(dict(), self.metadata_path).values())
+
+    def sessions(self):
+        return list(self.path_index.paths())
+
+    def save_log(self, session_id, events):
+        events = list(events)
+        path = get_session_path(self.proj_dir, session_id, depth=self.shard_depth)
+        path = get_compressed_path(path, self.compression)
+        save_log_to_jsonl(path, events)
+        self.path_index.record(path)
+        return len(events)
+
+    def append_events(self, session_id, seq, events, seal=False):
+        path = get_session_path(self.proj_dir, session_id, depth=self.shard_depth)
+        persisted = self.checkpoints.append(path, seq, events, seal=seal)
+        self.path_index.record(path)
+        return persisted
+
+    def count(self, session_id):
+        return self.reader.count(self._get_path(session_id))
+
+    def read_range(self, session_id, offset=0, limit=None):
+        return self.reader.read_range(self._get_path(session_id), offset, limit)
+
+    def iter_lines(self, session_id, offset=0, limit=None):
+        return self.reader.iter_lines(self._get_path(session_id), offset, limit)
+
+    def close(self):
+        self.checkpoints.flush()
+
+
+def _encode_events(events):
+    return "".join(json_codec.dumps(event) + "\n" for event in events)
+
+
+def _get_timestamps(events, first=None, last=None):
+    """Return the (first, last) eventTimestamp of events, extending an earlier (first, last)."""
+    for event in events:
+        timestamp = event.get("eventTimestamp")
+        if timestamp is not None:
+            first = timestamp if first is None else min(first, timestamp)
+            last = timestamp if last is None else max(last, timestamp)
+    return first, last
+
+
+class SQLiteDatabase:
+    """A pool of connections to a database with the sessions and logs tables, and session queries."""
+
+    def __init__(self, path=None, timeout=30.0, pool_size=DEFAULT_POOL_SIZE):
+        self.path = path
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pool_lock = threading.Lock()
+        self._idle = []  # Connections of this process that no thread is using
+        self._pid = None  # Process that created the schema and the connections in _idle
+
+    def _open(self):
+        # Connections move between threads, but only one thread uses a connection at a time
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False
+        )
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """Take a connection from the pool for the duration of the block.
+
+        The first connection of a process creates or migrates the schema. Connections are
+        not shared across forks: a forked process leaves the parent's connections alone.
+        """
+        with self._pool_lock:
+            if self._pid != os.getpid():
+                connection = self._open()
+                connection.execute("PRAGMA journal_mode=WAL")
+                self._create_tables(connection)
+                self._idle = []
+                self._pid = os.getpid()
+            else:
+                connection = self._idle.pop() if self._idle else None
+            idle = self._idle
+        if connection is None:
+            connection = self._open()
+        try:
+            yield connection
+        finally:
+            with self._pool_lock:
+                # Connections taken before close() or a fork are not returned to the new pool
+                if idle is self._idle and len(idle) < self.pool_size and not connection.in_transaction:
+                    idle.append(connection)
+                    connection = None
+            if connection is not None:
+                connection.close()
+
+    def _create_tables(self, connection):
+        connection.executescript(SCHEMA)
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(sessions)")}
+        if "show_interventions" in columns:
+            return
+        # Databases created before sessions could be queried by show_interventions
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(sessions)")}
+            if "show_interventions" not in columns:
+                connection.execute("ALTER TABLE sessions ADD COLUMN show_interventions INTEGER")
+                rows = connection.execute("SELECT session_id, record FROM sessions").fetchall()
+                connection.executemany(
+                    "UPDATE sessions SET show_interventions = ? WHERE session_id = ?",
+                    [
+                        (json.loads(record).get("show_interventions"), session_id)
+                        for session_id, record in rows
+                    ],
+                )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def _transaction(self, write=True):
+        with self._connection() as connection:
+            # IMMEDIATE takes the write lock up front, so concurrent writers wait instead of failing
+            connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def close(self):
+        """Close the idle connections; connections in use are closed when they are given back."""
+        with self._pool_lock:
+            idle = self._idle if self._pid == os.getpid() else []
+            self._idle = []
+            self._pid = None
+        for connection in idle:
+            connection.close()
+
+    @staticmethod
+    def _insert_records(connection, records):
+        """Insert or replace the rows of metadata records (dicts, or JSON lines stored as they are)."""
+        rows = []
+        for record in records:
+            if isinstance(record, bytes):
+                record = record.decode("utf-8")
+            if isinstance(record, str):
+                session = json.loads(record)
+            else:
+                session, record = record, json.dumps(record, default=session_serializer)
+            rows.append(
+                (
+                    session["session_id"],
+                    session.get("access_code"),
+                    session.get("domain"),
+                    session.get("engine"),
+                    session.get("show_interventions"),
+                    session.get("start_timestamp"),
+                    record,
+                )
+            )
+        connection.executemany(
+            "INSERT OR REPLACE INTO sessions"
+            " (session_id, access_code, domain, engine, show_interventions, start_timestamp, record)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        return len(rows)
+
+    @staticmethod
+    def _get_conditions(filters):
+        """Return the WHERE clause and parameters of the filters of a session query (see find_sessions)."""
+        conditions = []
+        parameters = []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name not in QUERY_FILTERS:
+                raise ValueError(f"Unknown filter: {name}")
+            conditions.append(QUERY_FILTERS[name])
+            parameters.append(int(value) if name == "show_interventions" else value)
+        return (f" WHERE {' AND '.join(conditions)}" if conditions else ""), parameters
+
+    def find_sessions(self, offset=0, limit=100, **filters):
+        """Return the metadata records (with "n_events" of their logs) of the matching sessions, oldest first.
+
+        Filters: access_code, domain, engine, show_interventions, start and end (start time in
+        seconds, in [start, end)), and min_events and max_events (number of events of the log).
+        """
+        where, parameters = self._get_conditions(filters)
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "SELECT sessions.record, logs.n_events FROM sessions LEFT JOIN logs USING (session_id)"
+                f"{where} ORDER BY sessions.start_timestamp, sessions.session_id LIMIT ? OFFSET ?",
+                (*parameters, -1 if limit is None else limit, offset),
+            )
+            return [dict(json.loads(record), n_events=n_events) for record, n_events in cursor]
+
+    def count_sessions(self, **filters):
+        """Return the number of sessions that match the filters of find_sessions."""
+        where, parameters = self._get_conditions(filters)
+        with self._connection() as connection:
+            cursor = connection.execute(
+                f"SELECT COUNT(*) FROM sessions LEFT JOIN logs USING (session_id){where}", parameters
+            )
+            return cursor.fetchone()[0]
+
+
+class SQLiteLogStorage(SQLiteDatabase, LogStorage):
+    name = "sqlite"
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, timeout=30.0, metrics=METRICS):
+        super().__init__(path, timeout)
+        self.batch_size = batch_size
+        self.metrics = metrics
+
+    def record_session(self, session):
+        with self._transaction() as connection:
+            self._insert_records(connection, [session])
+
+    def get(self, session_id):
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT record FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def records(self):
+        with self._connection() as connection:
+            for (record,) in connection.execute("SELECT record FROM sessions ORDER BY start_timestamp"):
+                yield json.loads(record)
+
+    def sessions(self):
+        with self._connection() as connection:
+            return [session_id for (session_id,) in connection.execute("SELECT session_id FROM logs")]
+
+    def _insert_events(self, connection, session_id, first_event, events):
+        """Insert events in batches; returns (number of events, first and last timestamps)."""
+        n_events = 0
+        first = last = None
+        batch = []
+        for event in events:
+            batch.append(event)
+            if len(batch) >= self.batch_size:
+                first, last = self._insert_batch(
+                    connection, session_id, first_event + n_events, batch, first, last
+                )
+                n_events += len(batch)
+                batch = []
+        if batch:
+            first, last = self._insert_batch(
+                connection, session_id, first_event + n_events, batch, first, last
+            )
+            n_events += len(batch)
+        return n_events, first, last
+
+    def _insert_batch(self, connection, session_id, first_event, batch, first, last):
+        batch_first, batch_last = _get_timestamps(batch)
+        connection.execute(
+            "INSERT INTO event_batches"
+            " (session_id, first_event, n_events, first_timestamp, last_timestamp, events)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, first_event, len(batch), batch_first, batch_last, _encode_events(batch)),
+        )
+        self.metrics.increment("log_db_batches_written")
+        return _get_timestamps(batch, first, last)
+
+    def save_log(self, session_id, events):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM event_batches WHERE session_id = ?", (session_id,))
+            n_events, first, last = self._insert_events(connection, session_id, 0, events)
+            connection.execute(
+                "INSERT OR REPLACE INTO logs (session_id, n_events, first_timestamp, last_timestamp, sealed)"
+                " VALUES (?, ?, ?, ?, 0)",
+                (session_id, n_events, first, last),
+            )
+        self.metrics.increment("log_db_events_written", n_events)
+        return n_events
+
+    def append_events(self, session_id, seq, events, seal=False):
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT n_events, first_timestamp, last_timestamp, sealed FROM logs WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            persisted, first, last, sealed = row or (0, None, None, 0)
+            if sealed:
+                raise LogSealedError(f"The log of {session_id} is sealed")
+            if seq > persisted:
+                raise CheckpointGapError(seq, persisted)
+            # A retried checkpoint may start before the end of the log
+            events = events[persisted - seq :]
+            first, last = _get_timestamps(events, first, last)
+
+            # Fill up the last batch first, so that small checkpoints do not make small rows
+            last_batch = connection.execute(
+                "SELECT first_event, n_events, first_timestamp, last_timestamp, events FROM event_batches"
+                " WHERE session_id = ? ORDER BY first_event DESC LIMIT 1",
+                (session_id,),
+            ).fetchone()
+            n_filled = 0
+            if events and last_batch is not None and last_batch[1] < self.batch_size:
+                batch_event, batch_size, batch_first, batch_last, data = last_batch
+                filling = events[: self.batch_size - batch_size]
+                batch_first, batch_last = _get_timestamps(filling, batch_first, batch_last)
+                connection.execute(
+                    "UPDATE event_batches SET n_events = ?, first_timestamp = ?, last_timestamp = ?,"
+                    " events = ? WHERE session_id = ? AND first_event = ?",
+                    (
+                        batch_size + len(filling),
+                        batch_first,
+                        batch_last,
+                        data + _encode_events(filling),
+                        session_id,
+                        batch_event,
+                    ),
+                )
+                n_filled = len(filling)
+            self._insert_events(connection, session_id, persisted + n_filled, events[n_filled:])
+            persisted += len(events)
+            connection.execute(
+                "INSERT OR REPLACE INTO logs (session_id, n_events, first_timestamp, last_timestamp, sealed)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (session_id, persisted, first, last, int(seal)),
+            )
+        self.metrics.increment("log_db_events_written", len(events))
+        return persisted
+
+    def _count(self, connection, session_id):
+        row = connection.execute("SELECT n_events FROM logs WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        return row[0]
+
+    def count(self, session_id):
+        with self._connection() as connection:
+            return self._count(connection, session_id)
+
+    def _select_batches(self, connection, session_id, offset, stop):
+        """Return a cursor over the (first_event, events) of the batches that hold events [offset, stop)."""
+        return connection.execute(
+            "SELECT first_event, events FROM event_batches WHERE session_id = ? AND first_event < ?"
+            " AND first_event >= (SELECT COALESCE(MAX(first_event), 0) FROM event_batches"
+            " WHERE session_id = ? AND first_event <= ?) ORDER BY first_event",
+            (session_id, stop, session_id, offset),
+        )
+
+    @staticmethod
+    def _get_stop(total, offset, limit):
+        return total if limit is None else min(total, offset + limit)
+
+    def _iter_batch_lines(self, cursor, offset, stop):
+        for first_event, data in cursor:
+            # Only "\n" ends an event: str.splitlines also splits on characters such as U+2028
+            # and U+0085, which JSON strings may hold unescaped
+            lines = [line + "\n" for line in data.split("\n")[:-1]]
+            start = max(offset - first_event, 0)
+            end = min(stop - first_event, len(lines))
+            self.metrics.increment("log_db_batches_read")
+            yield lines[start:end]
+
+    def read_range(self, session_id, offset=0, limit=None):
+        # A read transaction sees the count and the batches of the same version of the log
+        with self._transaction(write=False) as connection:
+            total = self._count(connection, session_id)
+            stop = self._get_stop(total, offset, limit)
+            if offset >= stop:
+                return [], total
+            events = []
+            cursor = self._select_batches(connection, session_id, offset, stop)
+            for lines in self._iter_batch_lines(cursor, offset, stop):
+                events.extend(json_codec.loads(line) for line in lines)
+        return events, total
+
+    def iter_lines(self, session_id, offset=0, limit=None):
+        with self._connection() as connection:
+            stop = self._get_stop(self._count(connection, session_id), offset, limit)
+            if offset >= stop:
+                return
+            cursor = self._select_batches(connection, session_id, offset, stop)
+            try:
+                for lines in self._iter_batch_lines(cursor, offset, stop):
+                    yield "".join(lines).encode("utf-8")
+            finally:
+                cursor.close()
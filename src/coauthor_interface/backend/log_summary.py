@@ -0,0 +1,108 @@
+"""
+Per-session summaries of saved logs.
+
+The stats, final text and config of a session do not change once its log is
+saved, so they are computed when the log is saved and stored in a sidecar next
+to the log, `<session_id>.summary.json`:
+
+    {
+        "version": 1,
+        "n_events": ...,             # Number of events in the log
+        "duration": ...,             # Seconds between the first and the last event
+        "stats": {"eventCounter": ...},
+        "last_text": ...,            # Final document (with the prompt)
+        "authorship": {"prompt": ..., "user": ..., "api": ...},  # Fractions of the final document
+        "config": ...,               # Session metadata (None if unknown)
+    }
+
+`/api/get_log` and offline tools read the sidecar instead of replaying the log.
+A summary is only used if its number of events matches the log it summarizes;
+appending to a log (see log_checkpoint.py) removes its summary.
+"""
+
+import os
+
+from coauthor_interface import json_codec
+from coauthor_interface.backend.helper import compute_stats, get_last_document_from_log
+from coauthor_interface.backend.log_compression import split_log_suffix
+from coauthor_interface.backend.log_reader import LogReader
+
+SUMMARY_FILE_SUFFIX = ".summary.json"
+SUMMARY_VERSION = 1
+
+MASK_AUTHORS = {"P": "prompt", "U": "user", "A": "api"}
+
+
+def get_summary_path(log_path):
+    return split_log_suffix(str(log_path))[0] + SUMMARY_FILE_SUFFIX
+
+
+def get_authorship(mask):
+    """Return the fraction of the characters of a document written by each author."""
+    return {author: (mask.count(char) / len(mask) if mask else 0.0) for char, author in MASK_AUTHORS.items()}
+
+
+def get_duration(log):
+    timestamps = [event["eventTimestamp"] for event in log if "eventTimestamp" in event]
+    if not timestamps:
+        return None
+    return (max(timestamps) - min(timestamps)) / 1000
+
+
+def summarize_log(log, text=None, mask=None, config=None):
+    """Summarize a log; text and mask are the final document if it is already known."""
+    if text is None or mask is None:
+        text, mask = get_last_document_from_log(log)
+    return {
+        "version": SUMMARY_VERSION,
+        "n_events": len(log),
+        "duration": get_duration(log),
+        "stats": compute_stats(log),
+        "last_text": text,
+        "authorship": get_authorship(mask),
+        "config": config,
+    }
+
+
+def write_summary(log_path, summary):
+    summary_path = get_summary_path(log_path)
+    tmp_path = f"{summary_path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json_codec.dumps(summary))
+    os.replace(tmp_path, summary_path)
+    return summary_path
+
+
+def read_summary(log_path, n_events=None):
+    """Return the summary of a log, or None if there is none or it does not match n_events."""
+    try:
+        with open(get_summary_path(log_path), "rb") as f:
+            summary = json_codec.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(summary, dict) or summary.get("version") != SUMMARY_VERSION:
+        return None
+    if n_events is not None and summary.get("n_events") != n_events:
+        return None
+    return summary
+
+
+def remove_summary(log_path):
+    try:
+        os.remove(get_summary_path(log_path))
+    except FileNotFoundError:
+        pass
+
+
+def load_summary(log_path, config=None, save=True, reader=None):
+    """Return the summary of a log, summarizing (and saving) it if it has none.
+
+    The log is memory-mapped (see log_reader.py), so events are decoded as they are summarized.
+    """
+    summary = read_summary(log_path)
+    if summary is None:
+        with (reader or LogReader()).map_log(log_path) as log:
+            summary = summarize_log(log, config=config)
+        if save:
+            write_summary(log_path, summary)
+    return summary
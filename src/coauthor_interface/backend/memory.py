@@ -0,0 +1,68 @@
+"""
+Memory usage of server processes.
+
+On Linux, /proc/<pid>/smaps_rollup splits the resident memory of a process into
+pages shared with other processes (e.g., the spaCy model inherited copy-on-write
+from the parent of prefork workers) and private pages, and reports the
+proportional set size (PSS), which adds up to the real memory used by a group of
+processes. /proc/<pid>/statm is used as a fallback on older kernels.
+"""
+
+import os
+
+SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def read_smaps_rollup(pid="self"):
+    usage = dict()
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].rstrip(":") in SMAPS_FIELDS:
+                usage[SMAPS_FIELDS[parts[0].rstrip(":")]] = int(parts[1]) * 1024  # Values are in kB
+    return {
+        "rss": usage.get("rss", 0),
+        "pss": usage.get("pss", 0),
+        "shared": usage.get("shared_clean", 0) + usage.get("shared_dirty", 0),
+        "private": usage.get("private_clean", 0) + usage.get("private_dirty", 0),
+    }
+
+
+def read_statm(pid="self"):
+    with open(f"/proc/{pid}/statm") as f:
+        _, resident, shared = (int(value) for value in f.read().split()[:3])
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    return {
+        "rss": resident * page_size,
+        "pss": None,
+        "shared": shared * page_size,
+        "private": (resident - shared) * page_size,
+    }
+
+
+def read_memory_usage(pid="self"):
+    """Return the rss, pss, shared, and private memory of a process in bytes (None if unavailable)."""
+    for read_fcn in (read_smaps_rollup, read_statm):
+        try:
+            return read_fcn(pid)
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def format_memory_usage(label, usage):
+    if usage is None:
+        return f"{label}: memory usage unavailable"
+    mib = 1024 * 1024
+    pss = f"{usage['pss'] / mib:.1f} MiB" if usage["pss"] is not None else "n/a"
+    return (
+        f"{label}: rss={usage['rss'] / mib:.1f} MiB shared={usage['shared'] / mib:.1f} MiB "
+        f"private={usage['private'] / mib:.1f} MiB pss={pss}"
+    )
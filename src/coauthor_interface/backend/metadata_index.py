@@ -0,0 +1,176 @@
+"""
+Incremental index of the session metadata file.
+
+`metadata.txt` gets one JSON line per started session and is never rewritten.
+`MetadataIndex` maps each session ID to the byte offset and length of its most
+recent line, so a lookup reads and decodes a single record. New lines are
+consumed from the last read position, and the index is appended to a sidecar
+file (`metadata.txt.idx` by default) so that a restarted server does not scan
+the metadata file again.
+
+Sidecar format: one "<session_id> <offset> <length>" line per record, in the
+order of the records in the metadata file.
+"""
+
+import fcntl
+import json
+import os
+import re
+import threading
+
+from coauthor_interface.backend.metrics import METRICS
+
+INDEX_FILE_SUFFIX = ".idx"
+
+# The session ID is a top-level string field; a match inside another string value is impossible
+# because quotes are escaped there.
+SESSION_ID_PATTERN = re.compile(rb'"session_id":\s*"([^"\\]+)"')
+
+
+def get_session_id_of_line(line):
+    match = SESSION_ID_PATTERN.search(line)
+    if match:
+        return match.group(1).decode("utf-8")
+    try:
+        return json.loads(line)["session_id"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class MetadataIndex:
+    def __init__(self, metadata_path=None, index_path=None, metrics=METRICS):
+        self._lock = threading.Lock()
+        self.metrics = metrics
+        self.configure(metadata_path, index_path)
+
+    def configure(self, metadata_path, index_path=None):
+        with self._lock:
+            self.metadata_path = metadata_path
+            self.index_path = index_path or (f"{metadata_path}{INDEX_FILE_SUFFIX}" if metadata_path else None)
+            self.offsets = dict()  # session_id -> (offset, length)
+            self.position = 0  # End of the last indexed line
+            self._loaded = False
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _load_index_file(self):
+        """Load the sidecar index if it matches the metadata file; otherwise start from scratch."""
+        self._loaded = True
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+
+        offsets = dict()
+        position = 0
+        last_entry = None
+        try:
+            with open(self.index_path) as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 3:
+                        continue  # Partially written line
+                    session_id, offset, length = parts[0], int(parts[1]), int(parts[2])
+                    offsets[session_id] = (offset, length)
+                    position = max(position, offset + length + 1)
+                    last_entry = (session_id, offset, length)
+        except (OSError, ValueError) as e:
+            print(f"# Ignoring the metadata index {self.index_path}: {e}")
+            return
+
+        if last_entry is not None and not self._matches(*last_entry):
+            print(
+                f"# The metadata index {self.index_path} does not match {self.metadata_path}; rebuilding it"
+            )
+            os.remove(self.index_path)
+            return
+        self.offsets = offsets
+        self.position = position
+
+    def _matches(self, session_id, offset, length):
+        try:
+            with open(self.metadata_path, "rb") as f:
+                f.seek(offset)
+                line = f.read(length + 1)
+        except OSError:
+            return False
+        return line.endswith(b"\n") and get_session_id_of_line(line[:-1]) == session_id
+
+    def update(self):
+        """Index the lines appended since the last update."""
+        with self._lock:
+            if not self._loaded:
+                self._load_index_file()
+            if not self.metadata_path or not os.path.exists(self.metadata_path):
+                raise FileNotFoundError(f"Metadata file not found: {self.metadata_path}")
+
+            if os.path.getsize(self.metadata_path) < self.position:
+                print(f"# {self.metadata_path} was truncated; rebuilding the metadata index")
+                self.offsets = dict()
+                self.position = 0
+                if self.index_path and os.path.exists(self.index_path):
+                    os.remove(self.index_path)
+
+            new_entries = []
+            with open(self.metadata_path, "rb") as f:
+                f.seek(self.position)
+                data = f.read()
+
+            start = 0
+            while True:
+                end = data.find(b"\n", start)
+                if end < 0:
+                    break  # A line that is still being written is indexed next time
+                line = data[start:end]
+                offset = self.position + start
+                if line.strip():
+                    session_id = get_session_id_of_line(line)
+                    if session_id is not None:
+                        self.offsets[session_id] = (offset, len(line))
+                        new_entries.append((session_id, offset, len(line)))
+                start = end + 1
+            self.position += start
+
+            if new_entries:
+                self.metrics.increment("metadata_lines_indexed", len(new_entries))
+                self._append_to_index_file(new_entries)
+
+    def _append_to_index_file(self, entries):
+        if not self.index_path:
+            return
+        try:
+            with open(self.index_path, "a+") as f:
+                # Several server processes may share the index; skip entries another one has written
+                fcntl.flock(f, fcntl.LOCK_EX)
+                indexed_until = self._read_indexed_until(f)
+                lines = [
+                    f"{session_id} {offset} {length}\n"
+                    for session_id, offset, length in entries
+                    if offset >= indexed_until
+                ]
+                f.write("".join(lines))
+        except OSError as e:
+            print(f"# Failed to write the metadata index: {e}")
+
+    @staticmethod
+    def _read_indexed_until(f):
+        """Return the end of the last record in an index file opened with a+."""
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 4096))
+        lines = f.read().splitlines()
+        for line in reversed(lines):
+            parts = line.split()
+            if len(parts) == 3:
+                return int(parts[1]) + int(parts[2]) + 1
+        return 0
+
+    def get(self, session_id):
+        """Return the most recent metadata record of a session, or None."""
+        self.update()
+        entry = self.offsets.get(session_id)
+        if entry is None:
+            return None
+        offset, length = entry
+        with open(self.metadata_path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
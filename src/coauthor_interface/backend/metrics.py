@@ -0,0 +1,69 @@
+"""
+Lightweight in-process metrics for the backend.
+
+Counters, gauges, and timings are kept in a single thread-safe registry
+(`METRICS`) that the API server exposes through the /api/metrics route.
+"""
+
+import collections
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = collections.defaultdict(int)
+        self.gauges = dict()
+        self.timings = dict()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Record a duration (in seconds) for the timing `name`."""
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = {"count": 0, "total": 0.0, "max": 0.0}
+                self.timings[name] = timing
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            timings = dict()
+            for name, timing in self.timings.items():
+                timings[name] = {
+                    **timing,
+                    "mean": timing["total"] / timing["count"] if timing["count"] else 0.0,
+                }
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timings": timings,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.timings.clear()
+
+
+METRICS = Metrics()
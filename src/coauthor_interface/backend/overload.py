@@ -0,0 +1,128 @@
+"""
+Load monitoring and graceful degradation for the API server.
+
+`LoadMonitor` tracks the number of requests in flight (the queue depth of the
+threaded server), the number of in-flight upstream (OpenAI) calls, and the CPU
+load, and compares them against configurable thresholds:
+
+- NORMAL: every signal is below its threshold; all routes do full work.
+- DEGRADED: a signal reached its threshold; expensive work is skipped or
+  deferred (level 3 analysis, checks for config changes) and cached suggestions are served.
+- SHEDDING: a signal reached `shed_ratio` times its threshold; new sessions are
+  rejected with a Retry-After header.
+
+A threshold of None disables the corresponding signal.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from time import time
+
+from coauthor_interface.backend.metrics import METRICS
+
+NORMAL = 0
+DEGRADED = 1
+SHEDDING = 2
+
+LEVEL_NAMES = {NORMAL: "normal", DEGRADED: "degraded", SHEDDING: "shedding"}
+
+
+def get_cpu_load():
+    """Return the 1-minute load average per CPU, or None if unavailable."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+class LoadMonitor:
+    def __init__(
+        self,
+        max_queue_depth=None,
+        max_cpu_load=None,
+        max_upstream_calls=None,
+        shed_ratio=1.5,
+        retry_after=30,
+        cpu_sample_interval=1.0,
+        cpu_load_fcn=get_cpu_load,
+        metrics=METRICS,
+    ):
+        self._lock = threading.Lock()
+        self.in_flight_requests = 0
+        self.in_flight_upstream_calls = 0
+        self.metrics = metrics
+        self.cpu_load_fcn = cpu_load_fcn
+        self.cpu_sample_interval = cpu_sample_interval
+        self._cpu_load = None
+        self._cpu_sampled_at = None
+        self.configure(max_queue_depth, max_cpu_load, max_upstream_calls, shed_ratio, retry_after)
+
+    def configure(
+        self,
+        max_queue_depth=None,
+        max_cpu_load=None,
+        max_upstream_calls=None,
+        shed_ratio=1.5,
+        retry_after=30,
+    ):
+        self.max_queue_depth = max_queue_depth
+        self.max_cpu_load = max_cpu_load
+        self.max_upstream_calls = max_upstream_calls
+        self.shed_ratio = shed_ratio
+        self.retry_after = retry_after
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight_requests += 1
+            self.metrics.set_gauge("in_flight_requests", self.in_flight_requests)
+
+    def request_finished(self):
+        with self._lock:
+            self.in_flight_requests = max(0, self.in_flight_requests - 1)
+            self.metrics.set_gauge("in_flight_requests", self.in_flight_requests)
+
+    @contextmanager
+    def upstream_call(self):
+        with self._lock:
+            self.in_flight_upstream_calls += 1
+            self.metrics.set_gauge("in_flight_upstream_calls", self.in_flight_upstream_calls)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight_upstream_calls -= 1
+                self.metrics.set_gauge("in_flight_upstream_calls", self.in_flight_upstream_calls)
+
+    def cpu_load(self):
+        now = time()
+        if self._cpu_sampled_at is None or now - self._cpu_sampled_at >= self.cpu_sample_interval:
+            self._cpu_load = self.cpu_load_fcn()
+            self._cpu_sampled_at = now
+        return self._cpu_load
+
+    def load_ratios(self):
+        """Return the ratio of each enabled signal to its threshold."""
+        ratios = dict()
+        if self.max_queue_depth:
+            ratios["queue_depth"] = self.in_flight_requests / self.max_queue_depth
+        if self.max_upstream_calls:
+            ratios["upstream_calls"] = self.in_flight_upstream_calls / self.max_upstream_calls
+        if self.max_cpu_load:
+            cpu_load = self.cpu_load()
+            if cpu_load is not None:
+                ratios["cpu_load"] = cpu_load / self.max_cpu_load
+        return ratios
+
+    def level(self):
+        """Compute the current degradation level and export it as a metric."""
+        ratios = self.load_ratios()
+        highest = max(ratios.values(), default=0.0)
+        if highest >= self.shed_ratio:
+            level = SHEDDING
+        elif highest >= 1.0:
+            level = DEGRADED
+        else:
+            level = NORMAL
+        self.metrics.set_gauge("degradation_level", level)
+        return level
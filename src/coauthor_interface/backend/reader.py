@@ -2,7 +2,9 @@ import csv
 import json
 from pathlib import Path
 
+from coauthor_interface import json_codec
 from coauthor_interface.backend.access_code import AccessCodeConfig
+from coauthor_interface.backend.log_compression import open_log, split_log_suffix
 
 
 def read_api_keys(config_dir):
@@ -24,20 +26,21 @@ def read_api_keys(config_dir):
 
 
 def read_log(log_path):
-    """Read a log file."""
+    """Read a log file (plain or compressed, see log_compression.py)."""
     log = []
     path = Path(log_path)
 
     if not path.exists():
         raise FileNotFoundError(f"Log file not found: {path}")
 
-    if path.suffix == ".json":
-        with open(path) as f:
-            log = json.load(f)
-    elif path.suffix == ".jsonl":
-        with open(path) as f:
+    _, suffix, _ = split_log_suffix(path)
+    if suffix == ".json":
+        with open_log(path) as f:
+            log = json_codec.loads(f.read())
+    elif suffix == ".jsonl":
+        with open_log(path) as f:
             for line in f:
-                log.append(json.loads(line))
+                log.append(json_codec.loads(line))
     else:
         print("# Unknown file extension:", log_path)
     return log
@@ -58,14 +61,18 @@ def read_examples(config_dir):
             paths.append(file_path)
 
     for file_path in paths:
-        name = file_path.stem
-        with open(file_path) as f:
-            text = f.read().replace("\\n", "\n")
-            text = text + " "
-        examples[name] = text
+        examples[file_path.stem] = read_example_file(file_path)
     return examples
 
 
+def read_example_file(file_path):
+    """Read the text of an example file."""
+    with open(file_path) as f:
+        text = f.read().replace("\\n", "\n")
+        text = text + " "
+    return text
+
+
 def read_prompts(config_dir):
     """Read all prompts from config_dir."""
     path = Path(config_dir) / "prompts.tsv"
@@ -105,17 +112,24 @@ def read_access_codes(config_dir):
 
     # Read access codes with configs
     for file_path in paths:
-        with open(file_path) as f:
-            input_file = csv.DictReader(f)
+        access_codes.update(read_access_code_file(file_path))
+    return access_codes
+
 
-            for row in input_file:
-                if "access_code" not in row:
-                    print(f"# Could not find access_code in {file_path}:\n{row}")
-                    continue
+def read_access_code_file(file_path):
+    """Read the access codes and their configs from a CSV file."""
+    access_codes = dict()
+    with open(file_path) as f:
+        input_file = csv.DictReader(f)
+
+        for row in input_file:
+            if "access_code" not in row:
+                print(f"# Could not find access_code in {file_path}:\n{row}")
+                continue
 
-                access_code = row["access_code"]
-                config = AccessCodeConfig(row)
-                access_codes[access_code] = config
+            access_code = row["access_code"]
+            config = AccessCodeConfig(row)
+            access_codes[access_code] = config
     return access_codes
 
 
@@ -0,0 +1,277 @@
+"""
+Session-affinity router for sharding sessions across local worker processes.
+
+    python -m coauthor_interface.backend.router --config_dir ../config --log_dir ../logs \
+        --port 5555 --proj_name demo --workers 4 --threads 8
+
+The parent process loads the server like serve.py and forks `--workers`
+workers, each listening on a Unix socket in `--socket_dir`, plus a router
+process listening on `--port`. The router forwards every request to the worker
+that owns its session, picked by hashing the session ID, so each worker keeps
+its shard of SESSIONS in memory and no session state is serialized between
+requests. Requests without a session ID (e.g., /api/start_session) are spread
+over the workers in turn; a worker only issues session IDs that hash to its
+own shard, so the following requests of the session come back to it.
+
+Bodies are streamed in CHUNK_SIZE pieces in both directions (e.g., bulk
+exports). Only the start of a request body is held in memory, up to its
+session ID, which is needed to pick the worker.
+"""
+
+import http.client
+import itertools
+import os
+import re
+import socket
+import tempfile
+import threading
+from urllib.parse import parse_qs, quote
+
+from coauthor_interface.backend import api_server
+from coauthor_interface.backend.helper import shard_for_session
+from coauthor_interface.backend.serve import (
+    BoundedThreadedWSGIServer,
+    build_arg_parser as build_serve_arg_parser,
+    preload,
+    serve_until_stopped,
+    start_worker_server,
+    supervise,
+)
+
+# The frontend sends the session ID as a top-level "session_id" or "sessionId" field. A match
+# inside a string value is impossible because quotes are escaped there.
+SESSION_ID_PATTERN = re.compile(rb'"(?:session_id|sessionId)"\s*:\s*"([^"\\]+)"')
+
+CHUNK_SIZE = 1 << 16  # Bytes read from the client or a worker at a time
+SESSION_ID_OVERLAP = 256  # Bytes searched again when more of a body is read, for IDs split between chunks
+
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def get_worker_socket_path(socket_dir, index):
+    return os.path.join(socket_dir, f"worker-{index}.sock")
+
+
+class SessionRouter:
+    """WSGI application that forwards each request to the worker that owns its session."""
+
+    def __init__(self, socket_paths, timeout=300):
+        self.socket_paths = socket_paths
+        self.timeout = timeout
+        self._turn = itertools.count()
+        self._local = threading.local()  # Keep-alive connections of each router thread
+
+    def select_worker(self, body, query_string=""):
+        """Return the index of the worker for a request.
+
+        Requests are routed by session ID; requests without one go to the worker
+        given by the `worker` query parameter (e.g., /api/metrics?worker=1) or to
+        the workers in turn.
+        """
+        match = SESSION_ID_PATTERN.search(body)
+        if match:
+            return shard_for_session(match.group(1).decode("utf-8"), len(self.socket_paths))
+
+        worker = parse_qs(query_string).get("worker")
+        if worker and worker[0].isdigit() and int(worker[0]) < len(self.socket_paths):
+            return int(worker[0])
+        return next(self._turn) % len(self.socket_paths)
+
+    def _get_connection(self, index):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = dict()
+        if index not in connections:
+            connections[index] = UnixHTTPConnection(self.socket_paths[index], timeout=self.timeout)
+        return connections[index]
+
+    def _drop_connection(self, index):
+        connection = getattr(self._local, "connections", dict()).pop(index, None)
+        if connection is not None:
+            connection.close()
+
+    def forward(self, index, method, url, body, headers):
+        """Send a request to a worker and return its response, whose body is not read yet.
+
+        `body` is bytes, None or an iterable of bytes. An iterable can only be sent
+        once, so it goes over a new connection instead of being retried.
+        """
+        retry = body is None or isinstance(body, bytes)
+        if not retry:
+            self._drop_connection(index)
+        # Retry once: the worker may have closed an idle keep-alive connection
+        for attempt in range(2):
+            connection = self._get_connection(index)
+            try:
+                connection.request(method, url, body=body, headers=headers)
+                return connection.getresponse()
+            except (OSError, http.client.HTTPException):
+                self._drop_connection(index)
+                if attempt == 1 or not retry:
+                    raise
+
+    def iter_response(self, index, response):
+        """Yield the body of a worker response in chunks.
+
+        The connection is kept for the next request only if the body is read to the
+        end, i.e., not if the client goes away in between.
+        """
+        complete = False
+        try:
+            while True:
+                # read1 returns what has arrived, read waits for CHUNK_SIZE bytes
+                data = response.read1(CHUNK_SIZE)
+                if not data:
+                    break
+                yield data
+            complete = True
+        finally:
+            if not complete or response.will_close:
+                self._drop_connection(index)
+
+    def check_workers(self):
+        """Return True if every worker is ready."""
+        for index in range(len(self.socket_paths)):
+            try:
+                response = self.forward(index, "GET", "/healthz/ready", None, dict())
+                for _ in self.iter_response(index, response):
+                    pass
+            except (OSError, http.client.HTTPException):
+                return False
+            if response.status != 200:
+                return False
+        return True
+
+    @staticmethod
+    def read_head(stream, length):
+        """Read a request body up to its session ID (or to its end) and return (head, bytes left)."""
+        head = bytearray()
+        while length > 0:
+            data = stream.read(min(CHUNK_SIZE, length))
+            if not data:
+                # The client sent less than its Content-Length
+                return bytes(head), 0
+            searched = max(0, len(head) - SESSION_ID_OVERLAP)
+            head += data
+            length -= len(data)
+            if SESSION_ID_PATTERN.search(head, searched):
+                break
+        return bytes(head), length
+
+    @staticmethod
+    def iter_body(stream, head, length):
+        """Yield the head of a request body, then the rest of it as it is read from the client."""
+        yield head
+        while length > 0:
+            data = stream.read(min(CHUNK_SIZE, length))
+            if not data:
+                raise ConnectionError("The client closed the connection before sending the whole body")
+            length -= len(data)
+            yield data
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == "/healthz/live":
+            start_response("200 OK", [("Content-Type", "application/json")])
+            return [b'{"status": true}']
+        if path == "/healthz/ready":
+            ready = self.check_workers()
+            start_response(
+                "200 OK" if ready else "503 Service Unavailable", [("Content-Type", "application/json")]
+            )
+            return [b'{"status": true}' if ready else b'{"status": false}']
+
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        head, length = self.read_head(environ["wsgi.input"], length)
+        query_string = environ.get("QUERY_STRING", "")
+        index = self.select_worker(head, query_string)
+
+        url = quote(path)
+        if query_string:
+            url = f"{url}?{query_string}"
+        headers = {
+            key[5:].replace("_", "-").title(): value
+            for key, value in environ.items()
+            if key.startswith("HTTP_") and key[5:].replace("_", "-").lower() not in HOP_BY_HOP_HEADERS
+        }
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        headers["Content-Length"] = str(len(head) + length)
+        body = self.iter_body(environ["wsgi.input"], head, length) if length > 0 else head
+
+        try:
+            response = self.forward(index, environ["REQUEST_METHOD"], url, body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            print(f"# Could not forward {path} to worker {index}: {e}")
+            start_response("502 Bad Gateway", [("Content-Type", "text/plain")])
+            return [b"Worker unavailable"]
+
+        # Content-Length is passed on; without it, the body is sent in chunks again
+        response_headers = [
+            (key, value) for key, value in response.getheaders() if key.lower() not in HOP_BY_HOP_HEADERS
+        ]
+        start_response(f"{response.status} {response.reason}", response_headers)
+        return self.iter_response(index, response)
+
+
+def build_arg_parser():
+    parser = build_serve_arg_parser()
+    # Every session is forwarded to its own worker, so any number of workers is safe
+    parser.set_defaults(workers=os.cpu_count() or 1)
+    parser.add_argument("--socket_dir", type=str, default=None)
+    parser.add_argument("--router_threads", type=int, default=64)
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    api_server.configure(args)
+    preload()
+
+    socket_dir = args.socket_dir or tempfile.mkdtemp(prefix="coauthor-workers-")
+    os.makedirs(socket_dir, exist_ok=True)
+    socket_paths = [get_worker_socket_path(socket_dir, index) for index in range(args.workers)]
+
+    def make_worker(index):
+        def run():
+            # Only issue session IDs that the router sends back to this worker
+            api_server.session_shard = (index, args.workers)
+            server = start_worker_server(index, args, f"unix://{socket_paths[index]}", 0)
+            serve_until_stopped(server)
+
+        return run
+
+    def run_router():
+        server = BoundedThreadedWSGIServer(
+            args.host, args.port, SessionRouter(socket_paths), max_threads=args.router_threads
+        )
+        print(f" # Router (pid {os.getpid()}) forwarding to {args.workers} workers in {socket_dir}")
+        server.serve_forever()
+
+    targets = {f"worker {index}": make_worker(index) for index in range(args.workers)}
+    targets["router"] = run_router
+    supervise(targets, memory_report_interval=args.memory_report_interval)
+
+
+if __name__ == "__main__":
+    main()
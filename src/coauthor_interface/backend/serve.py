@@ -0,0 +1,209 @@
+"""
+Production entrypoint for the API server.
+
+    python -m coauthor_interface.backend.serve --config_dir ../config --log_dir ../logs \
+        --port 5555 --proj_name demo --workers 4 --threads 8
+
+The parent process imports the server, which loads the spaCy model and its
+vector tables, warms them up, and freezes the garbage collector so that these
+objects stay in memory pages shared copy-on-write with the workers. It then
+binds the listening socket and forks `--workers` worker processes that serve
+requests on up to `--threads` threads each. Workers that exit are restarted,
+and the memory usage of every worker is printed every
+`--memory_report_interval` seconds.
+
+Sessions are kept in the memory of the worker that started them, and all
+workers accept connections from the same socket, so more than one worker
+requires `--stateless_sessions` (or the session-affinity router, see
+router.py, which forwards each session to its own worker).
+"""
+
+import os
+import signal
+import socket
+import threading
+from time import sleep, time
+
+from werkzeug.serving import ThreadedWSGIServer
+
+from coauthor_interface.backend import api_server
+from coauthor_interface.backend.gc_policy import freeze_heap
+from coauthor_interface.backend.memory import format_memory_usage, read_memory_usage
+from coauthor_interface.thought_toolkit.utils import get_spacy_similarity
+
+
+class BoundedThreadedWSGIServer(ThreadedWSGIServer):
+    """Threaded WSGI server that handles at most `max_threads` requests at a time.
+
+    Further connections wait in the listening socket's backlog.
+    """
+
+    def __init__(self, host, port, app, max_threads=8, fd=None):
+        super().__init__(host, port, app, fd=fd)
+        self._slots = threading.BoundedSemaphore(max_threads)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+
+def build_arg_parser():
+    parser = api_server.build_arg_parser()
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--workers", type=int, default=1)  # More than 1 needs --stateless_sessions
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--backlog", type=int, default=128)
+    parser.add_argument("--memory_report_interval", type=float, default=300)
+    return parser
+
+
+def parse_args(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.workers > 1 and not args.stateless_sessions:
+        # Any worker may accept the next request of a session that lives in another one
+        parser.error(
+            "--workers > 1 requires --stateless_sessions; to keep sessions in memory, run "
+            "coauthor_interface.backend.router instead"
+        )
+    return args
+
+
+def preload():
+    """Warm up the models in the parent and freeze the heap so workers share it copy-on-write."""
+    get_spacy_similarity("Warm up the language model.", "Warm up the word vectors.")
+    freeze_heap()
+
+
+def start_worker_server(index, args, host, port, fd=None):
+    """Set up a forked worker and create its server (on the inherited socket `fd` if given)."""
+    # Each worker keeps its own spilled sessions, so a restarted worker picks up its own
+    if args.session_spill_dir and args.workers > 1:
+        api_server.SESSIONS.configure(
+            spill_dir=os.path.join(args.session_spill_dir, f"worker-{index}"),
+            idle_timeout=args.session_idle_timeout,
+        )
+    api_server.start_background_tasks()
+
+    server = BoundedThreadedWSGIServer(host, port, api_server.app, max_threads=args.threads, fd=fd)
+    api_server.ready = True
+    print(f" # Worker {index} (pid {os.getpid()}) serving with {args.threads} threads")
+    return server
+
+
+def spawn_process(name, target):
+    """Fork a process that runs `target()` and exits."""
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            target()
+        except Exception as e:
+            print(f"# {name} failed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    return pid
+
+
+def stop_worker(signum, frame):
+    raise SystemExit(0)
+
+
+def serve_until_stopped(server):
+    """Serve requests until SIGTERM, then write out queued metadata and logs.
+
+    end_session acknowledges logs before the write-behind thread writes them, and forked
+    processes exit with os._exit, which skips atexit handlers, so the queue is flushed here.
+    """
+    signal.signal(signal.SIGTERM, stop_worker)
+    try:
+        server.serve_forever()
+    finally:
+        api_server.stop_background_tasks()
+
+
+def print_memory_report(processes):
+    print(format_memory_usage(f"parent (pid {os.getpid()})", read_memory_usage()))
+    total_pss = 0
+    for pid, name in sorted(processes.items(), key=lambda item: item[1]):
+        usage = read_memory_usage(pid)
+        print(format_memory_usage(f"{name} (pid {pid})", usage))
+        if usage is not None and usage["pss"] is not None:
+            total_pss += usage["pss"]
+    print(f" # Total PSS of workers: {total_pss / (1024 * 1024):.1f} MiB")
+
+
+def supervise(targets, memory_report_interval=None):
+    """Run each target of `targets` (name -> callable) in a forked process until SIGTERM or SIGINT.
+
+    Processes that exit are restarted.
+    """
+    processes = {spawn_process(name, target): name for name, target in targets.items()}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in processes:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    last_report = time()
+    while processes:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            name = processes.pop(pid, None)
+            if name is not None and not stopping:
+                print(f"# {name} (pid {pid}) exited with status {status}; restarting")
+                processes[spawn_process(name, targets[name])] = name
+            continue
+
+        if memory_report_interval and time() - last_report >= memory_report_interval:
+            print_memory_report(processes)
+            last_report = time()
+        sleep(1)
+
+
+def main():
+    args = parse_args()
+    api_server.configure(args)
+
+    preload()
+
+    sock = socket.create_server((args.host, args.port), backlog=args.backlog)
+    sock.set_inheritable(True)
+
+    def make_target(index):
+        def run():
+            server = start_worker_server(index, args, args.host, args.port, fd=sock.fileno())
+            serve_until_stopped(server)
+
+        return run
+
+    supervise(
+        {f"worker {index}": make_target(index) for index in range(args.workers)},
+        memory_report_interval=args.memory_report_interval,
+    )
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Indexed queries of the sessions of a log archive.
+
+Without an index, finding sessions means grepping metadata.txt and scanning
+the log folders. `SessionQueryIndex` maintains an SQLite database
+(`<log_dir>/sessions.db` by default) with the sessions and logs tables of the
+log database (see log_storage.py), so `find_sessions` filters sessions by
+access code, domain, engine, show_interventions, start time, and number of
+events with indexed lookups:
+
+- Sessions come from the metadata records appended to metadata.txt by
+  `append_session_to_file`. An update reads the records appended since the
+  byte offset where the last update stopped, as metadata_index.py does.
+- The number of events of a log is counted when the log is first seen and
+  whenever it is modified; the logs and their modification times come from
+  the log path index (see log_index.py), so unchanged logs are not read.
+
+Queries update the index at most every `check_interval` seconds. Several
+processes can share the index: updates are transactions, and the offset in
+metadata.txt is stored in the database.
+"""
+
+import json
+import os
+import threading
+from time import monotonic
+
+from coauthor_interface.backend.log_reader import LogReader
+from coauthor_interface.backend.log_storage import SQLiteDatabase
+from coauthor_interface.backend.metrics import METRICS
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_files (
+    session_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS index_state (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def parse_metadata_lines(data):
+    """Return the metadata records (JSON lines, as str) of complete lines in data."""
+    records = []
+    for line in data.splitlines():
+        try:
+            session = json.loads(line)
+        except ValueError:
+            continue  # Empty or corrupt line
+        if isinstance(session, dict) and "session_id" in session:
+            records.append(line.decode("utf-8"))
+    return records
+
+
+class SessionQueryIndex(SQLiteDatabase):
+    def __init__(
+        self, path=None, metadata_path=None, path_index=None, reader=None, check_interval=5.0, metrics=METRICS
+    ):
+        super().__init__(path)
+        self._lock = threading.Lock()
+        self.metrics = metrics
+        self.configure(path, metadata_path, path_index, reader, check_interval)
+
+    def configure(self, path, metadata_path=None, path_index=None, reader=None, check_interval=5.0):
+        with self._lock:
+            self.close()
+            self.path = path
+            self.metadata_path = metadata_path
+            self.path_index = path_index
+            self.reader = reader or LogReader(metrics=self.metrics)
+            self.check_interval = check_interval
+            self._last_update = None
+
+    def _create_tables(self, connection):
+        super()._create_tables(connection)
+        connection.executescript(INDEX_SCHEMA)
+
+    @staticmethod
+    def _get_state(connection, name):
+        row = connection.execute("SELECT value FROM index_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def update(self):
+        """Index the metadata records and the logs that are new or changed since the last update."""
+        with self._lock:
+            self._update_sessions()
+            self._update_logs()
+            self._last_update = monotonic()
+
+    def _update_sessions(self):
+        if not self.metadata_path or not os.path.exists(self.metadata_path):
+            return
+        with self._transaction() as connection:
+            position = self._get_state(connection, "metadata_position")
+            if os.path.getsize(self.metadata_path) < position:
+                print(f"# {self.metadata_path} was truncated; rebuilding the session index")
+                connection.execute("DELETE FROM sessions")
+                position = 0
+            with open(self.metadata_path, "rb") as f:
+                f.seek(position)
+                data = f.read()
+            end = data.rfind(b"\n") + 1  # A line that is still being written is indexed next time
+            if end == 0:
+                return
+            n_records = self._insert_records(connection, parse_metadata_lines(data[:end]))
+            connection.execute(
+                "INSERT OR REPLACE INTO index_state (name, value) VALUES ('metadata_position', ?)",
+                (position + end,),
+            )
+        self.metrics.increment("session_index_records", n_records)
+
+    def _update_logs(self):
+        if self.path_index is None:
+            return
+        entries = self.path_index.entries()
+        with self._connection() as connection:
+            cursor = connection.execute("SELECT session_id, path, mtime_ns FROM log_files")
+            indexed = {session_id: (path, mtime_ns) for session_id, path, mtime_ns in cursor}
+
+        counted = []
+        for session_id, (path, mtime_ns) in entries.items():
+            if indexed.get(session_id) == (path, mtime_ns):
+                continue
+            try:
+                counted.append((session_id, path, mtime_ns, self.reader.count(path)))
+            except Exception as e:
+                print(f"# Failed to count the events of {path}: {e}")
+        removed = [(session_id,) for session_id in indexed if session_id not in entries]
+        if not counted and not removed:
+            return
+
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO logs (session_id, n_events) VALUES (?, ?)",
+                [(session_id, n_events) for session_id, _, _, n_events in counted],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO log_files (session_id, path, mtime_ns) VALUES (?, ?, ?)",
+                [(session_id, path, mtime_ns) for session_id, path, mtime_ns, _ in counted],
+            )
+            connection.executemany("DELETE FROM logs WHERE session_id = ?", removed)
+            connection.executemany("DELETE FROM log_files WHERE session_id = ?", removed)
+        self.metrics.increment("session_index_logs_counted", len(counted))
+
+    def _update_if_stale(self):
+        if self._last_update is None or monotonic() - self._last_update >= self.check_interval:
+            self.update()
+
+    def find_sessions(self, offset=0, limit=100, **filters):
+        self._update_if_stale()
+        return super().find_sessions(offset, limit, **filters)
+
+    def count_sessions(self, **filters):
+        self._update_if_stale()
+        return super().count_sessions(**filters)
@@ -0,0 +1,236 @@
+"""
+Two-tier storage for live sessions.
+
+`SessionStore` behaves like the plain `SESSIONS` dictionary, but sessions that
+have not been accessed for `idle_timeout` seconds can be spilled to a local
+directory (pickled together with their analyzer state and actions) and dropped
+from memory. A spilled session is paged back in transparently the next time
+it is accessed. Spilling is disabled unless a spill directory is configured.
+
+Requests that read or modify the state of a session should hold
+`SESSIONS.lock(session_id)`, which serializes requests for the same session
+while requests for different sessions still run in parallel.
+"""
+
+import os
+import pickle
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter, sleep, time
+
+from coauthor_interface.backend.metrics import METRICS
+
+SPILL_FILE_SUFFIX = ".session"
+
+
+class SessionStore(MutableMapping):
+    def __init__(self, spill_dir=None, idle_timeout=None, metrics=METRICS):
+        self._lock = threading.RLock()
+        self._hot = dict()
+        self._cold = set()
+        self._last_access = dict()
+        self._locks = dict()
+        self.metrics = metrics
+
+        self.spill_dir = None
+        self.idle_timeout = None
+        self.configure(spill_dir, idle_timeout)
+
+    def configure(self, spill_dir=None, idle_timeout=None):
+        """Enable spilling of idle sessions into `spill_dir`.
+
+        Sessions spilled by a previous server process are picked up again.
+        """
+        with self._lock:
+            self.spill_dir = Path(spill_dir) if spill_dir else None
+            self.idle_timeout = idle_timeout
+            if self.spill_dir is not None:
+                self.spill_dir.mkdir(parents=True, exist_ok=True)
+                for path in self.spill_dir.glob(f"*{SPILL_FILE_SUFFIX}"):
+                    if path.stem not in self._hot:
+                        self._cold.add(path.stem)
+            self._update_gauges()
+
+    def _spill_path(self, session_id):
+        return self.spill_dir / f"{session_id}{SPILL_FILE_SUFFIX}"
+
+    def _update_gauges(self):
+        self.metrics.set_gauge("sessions_resident", len(self._hot))
+        self.metrics.set_gauge("sessions_spilled", len(self._cold))
+
+    def __getitem__(self, session_id):
+        with self._lock:
+            if session_id in self._hot:
+                self.metrics.increment("session_cache_hits")
+            elif session_id in self._cold:
+                self._page_in(session_id)
+            else:
+                raise KeyError(session_id)
+            self._last_access[session_id] = time()
+            return self._hot[session_id]
+
+    def __setitem__(self, session_id, session):
+        with self._lock:
+            if session_id in self._cold:
+                self._remove_spill_file(session_id)
+            self._hot[session_id] = session
+            self._last_access[session_id] = time()
+            self._update_gauges()
+
+    def __delitem__(self, session_id):
+        with self._lock:
+            if session_id in self._hot:
+                del self._hot[session_id]
+            elif session_id in self._cold:
+                self._remove_spill_file(session_id)
+            else:
+                raise KeyError(session_id)
+            self._last_access.pop(session_id, None)
+            self._locks.pop(session_id, None)
+            self._update_gauges()
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._hot or session_id in self._cold
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._hot) + list(self._cold))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._hot) + len(self._cold)
+
+    def clear(self):
+        with self._lock:
+            for session_id in list(self._cold):
+                self._remove_spill_file(session_id)
+            self._hot.clear()
+            self._last_access.clear()
+            self._locks.clear()
+            self._update_gauges()
+
+    @contextmanager
+    def lock(self, session_id):
+        """Hold the lock of a single session, recording contention metrics.
+
+        Raises KeyError if the session does not exist.
+        """
+        with self._lock:
+            if session_id not in self._hot and session_id not in self._cold:
+                raise KeyError(session_id)
+            session_lock = self._locks.get(session_id)
+            if session_lock is None:
+                session_lock = threading.Lock()
+                self._locks[session_id] = session_lock
+
+        self.metrics.increment("session_lock_acquisitions")
+        if not session_lock.acquire(blocking=False):
+            self.metrics.increment("session_lock_contended")
+            start = perf_counter()
+            session_lock.acquire()
+            self.metrics.observe("session_lock_wait_seconds", perf_counter() - start)
+        try:
+            yield
+        finally:
+            session_lock.release()
+
+    def is_locked(self, session_id):
+        with self._lock:
+            session_lock = self._locks.get(session_id)
+            return session_lock is not None and session_lock.locked()
+
+    def resident(self):
+        """Return a snapshot of the sessions currently held in memory (without paging in)."""
+        with self._lock:
+            return dict(self._hot)
+
+    def _page_in(self, session_id):
+        start = perf_counter()
+        path = self._spill_path(session_id)
+        with open(path, "rb") as f:
+            session = pickle.load(f)
+        os.remove(path)
+
+        self._cold.discard(session_id)
+        self._hot[session_id] = session
+        self.metrics.increment("session_cache_page_ins")
+        self.metrics.observe("session_page_in_seconds", perf_counter() - start)
+        self._update_gauges()
+
+    def _remove_spill_file(self, session_id):
+        self._cold.discard(session_id)
+        try:
+            os.remove(self._spill_path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def spill(self, session_id):
+        """Serialize a resident session to disk and drop it from memory."""
+        with self._lock:
+            if self.spill_dir is None or session_id not in self._hot:
+                return False
+
+            start = perf_counter()
+            path = self._spill_path(session_id)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self._hot[session_id], f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+
+            del self._hot[session_id]
+            self._cold.add(session_id)
+            self.metrics.increment("session_cache_spills")
+            self.metrics.observe("session_spill_seconds", perf_counter() - start)
+            self._update_gauges()
+            return True
+
+    def spill_idle_sessions(self, now=None):
+        """Spill every resident session that has not been accessed for `idle_timeout` seconds."""
+        if self.spill_dir is None or self.idle_timeout is None:
+            return []
+
+        now = time() if now is None else now
+        with self._lock:
+            # Sessions that are in use by a request are never spilled
+            idle_session_ids = [
+                session_id
+                for session_id in self._hot
+                if now - self._last_access.get(session_id, now) >= self.idle_timeout
+                and not self.is_locked(session_id)
+            ]
+            spilled = []
+            for session_id in idle_session_ids:
+                try:
+                    if self.spill(session_id):
+                        spilled.append(session_id)
+                except Exception as e:
+                    print(f"# Failed to spill session {session_id}: {e}")
+            return spilled
+
+    def start_sweeper(self, interval):
+        """Periodically spill idle sessions from a daemon thread."""
+
+        def sweep():
+            while True:
+                sleep(interval)
+                spilled = self.spill_idle_sessions()
+                if spilled:
+                    print(f"# Spilled {len(spilled)} idle session(s) to {self.spill_dir}")
+
+        thread = threading.Thread(target=sweep, name="session-sweeper", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        """Return tier sizes and the fraction of accesses served from memory."""
+        with self._lock:
+            hits = self.metrics.counters.get("session_cache_hits", 0)
+            page_ins = self.metrics.counters.get("session_cache_page_ins", 0)
+            return {
+                "resident": len(self._hot),
+                "spilled": len(self._cold),
+                "hit_rate": hits / (hits + page_ins) if hits + page_ins else None,
+            }
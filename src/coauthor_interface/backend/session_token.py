@@ -0,0 +1,202 @@
+"""
+Signed session tokens for stateless session mode.
+
+In stateless mode, the compact per-session analyzer state (the action in
+progress, a few recent actions, and the rolling aggregates of the action
+history) is serialized, compressed, and HMAC-signed into a token that is
+returned to the client. The client sends the token back with its next
+request, so any worker behind a round-robin load balancer can handle any
+request without a shared session store.
+
+Token format: "v1.<base64url(zlib(json))>.<base64url(hmac-sha256)>"
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import zlib
+from time import perf_counter, time
+
+from coauthor_interface.backend.action_history import ActionHistory
+from coauthor_interface.backend.metrics import METRICS
+
+TOKEN_VERSION = "v1"
+DEFAULT_MAX_TOKEN_SIZE = 64 * 1024  # Bytes of the encoded token
+DEFAULT_MAX_STATE_SIZE = 1024 * 1024  # Bytes of the decompressed state
+DEFAULT_TOKEN_ACTIONS = 5  # Recent actions carried in a token
+
+# Session fields carried in a token; everything else is re-derived per request
+TOKEN_SESSION_FIELDS = (
+    "session_id",
+    "access_code",
+    "verification_code",
+    "start_timestamp",
+    "last_query_timestamp",
+    "show_interventions",
+    "current_action_in_progress",
+)
+
+# Fields of the action in progress read back by the analysis: the action parser continues from the
+# sentences seen so far, and convert_last_action_to_complete_action reads the state at save and the
+# timestamp of the last event
+IN_PROGRESS_ACTION_FIELDS = (
+    "action_type",
+    "action_source",
+    "action_start_log_id",
+    "action_start_time",
+    "action_end_writing",
+    "action_end_mask",
+    "writing_at_save",
+    "mask_at_save",
+    "delta_at_save",
+    "sentences_seen_so_far",
+)
+
+
+class SessionTokenError(Exception):
+    pass
+
+
+def _json_default(obj):
+    # Similarity scores may be numpy scalars
+    if hasattr(obj, "item"):
+        return obj.item()
+    return str(obj)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SessionTokenCodec:
+    def __init__(
+        self,
+        secret,
+        max_token_size=DEFAULT_MAX_TOKEN_SIZE,
+        max_state_size=DEFAULT_MAX_STATE_SIZE,
+        max_age=None,
+        compression_level=6,
+        metrics=METRICS,
+    ):
+        if not secret:
+            raise ValueError("A secret is required to sign session tokens")
+        self.secret = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self.max_token_size = max_token_size
+        self.max_state_size = max_state_size
+        self.max_age = max_age
+        self.compression_level = compression_level
+        self.metrics = metrics
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).digest()
+
+    def encode(self, state):
+        """Serialize, compress, and sign `state`. Raises SessionTokenError if the token is too large."""
+        start = perf_counter()
+        state = {**state, "issued_at": time()}
+        data = json.dumps(state, separators=(",", ":"), default=_json_default).encode("utf-8")
+        payload = f"{TOKEN_VERSION}.{_b64encode(zlib.compress(data, self.compression_level))}"
+        token = f"{payload}.{_b64encode(self._sign(payload))}"
+        self.metrics.observe("session_token_encode_seconds", perf_counter() - start)
+
+        if len(token) > self.max_token_size:
+            self.metrics.increment("session_token_oversized")
+            raise SessionTokenError(
+                f"Session token is too large ({len(token)} > {self.max_token_size} bytes)"
+            )
+        self.metrics.observe("session_token_bytes", len(token))
+        return token
+
+    def decode(self, token):
+        """Verify and decode a token. Raises SessionTokenError if it is invalid."""
+        start = perf_counter()
+        if not isinstance(token, str) or len(token) > self.max_token_size:
+            raise SessionTokenError("Session token is missing or too large")
+
+        try:
+            version, body, signature = token.split(".")
+        except ValueError:
+            raise SessionTokenError("Malformed session token") from None
+        if version != TOKEN_VERSION:
+            raise SessionTokenError(f"Unsupported session token version: {version}")
+
+        try:
+            expected = self._sign(f"{version}.{body}")
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                raise SessionTokenError("Invalid session token signature")
+
+            decompressor = zlib.decompressobj()
+            data = decompressor.decompress(_b64decode(body), self.max_state_size)
+            if decompressor.unconsumed_tail:
+                raise SessionTokenError("Session state is too large")
+            state = json.loads(data)
+        except SessionTokenError:
+            raise
+        except Exception as e:
+            raise SessionTokenError(f"Malformed session token: {e}") from None
+
+        if self.max_age is not None and time() - state.get("issued_at", 0) > self.max_age:
+            raise SessionTokenError("Session token has expired")
+
+        self.metrics.observe("session_token_decode_seconds", perf_counter() - start)
+        return state
+
+
+def session_to_token_state(session, n_actions=DEFAULT_TOKEN_ACTIONS):
+    """Extract the compact state of a session that is carried in its token."""
+    state = {field: session.get(field) for field in TOKEN_SESSION_FIELDS}
+    parsed_actions = session.get("parsed_actions")
+    if isinstance(parsed_actions, ActionHistory):
+        state["parsed_actions"] = parsed_actions.to_state(n_actions)
+    return state
+
+
+def session_from_token_state(state, window_size=None, history_path=None):
+    """Rebuild a request-local session from the state decoded from a token."""
+    session = {field: state.get(field) for field in TOKEN_SESSION_FIELDS}
+    session["parsed_actions"] = ActionHistory.from_state(
+        state.get("parsed_actions"), window_size=window_size, history_path=history_path
+    )
+    session["stateless"] = True
+    return session
+
+
+def summarize_action_in_progress(action):
+    """Keep only the fields of an action in progress that the analysis reads back.
+
+    Its raw logs are reduced to the timestamp of the last event, and the document at its start is dropped.
+    """
+    if not action:
+        return action
+    summary = {field: action[field] for field in IN_PROGRESS_ACTION_FIELDS if field in action}
+    if action.get("action_logs"):
+        summary["action_logs"] = [{"eventTimestamp": action["action_logs"][-1].get("eventTimestamp")}]
+    return summary
+
+
+def encode_session(codec, session, n_actions=DEFAULT_TOKEN_ACTIONS):
+    """Encode a session into a token, shrinking its state if the token would be too large.
+
+    The recent actions are dropped first, then the action in progress is summarized.
+    """
+    state = session_to_token_state(session, n_actions)
+    try:
+        return codec.encode(state)
+    except SessionTokenError:
+        if n_actions == 0 and not state.get("current_action_in_progress"):
+            raise
+    state = session_to_token_state(session, 0)
+    if n_actions > 0:
+        try:
+            return codec.encode(state)
+        except SessionTokenError:
+            if not state.get("current_action_in_progress"):
+                raise
+    state["current_action_in_progress"] = summarize_action_in_progress(state["current_action_in_progress"])
+    codec.metrics.increment("session_token_summarized")
+    return codec.encode(state)
@@ -0,0 +1,238 @@
+"""
+Write-behind persistence of session metadata and logs.
+
+`start_session` appends a line to `metadata.txt` and `end_session` serializes
+and writes the whole log. `WriteBehindWriter` moves this file I/O off the
+request threads: requests queue writes and get a `WriteTicket` back, and a
+background thread performs them in batches.
+
+- Lines appended to the same file (e.g., metadata records of concurrent
+  sessions) are written together with a single write.
+- A queued write of a file replaces an earlier queued write of the same file
+  (e.g., repeated saves of a session log), so only the latest one is done;
+  the `on_superseded` callback of the replaced write is called instead.
+- Written files are fsynced every `fsync_interval` seconds (after every batch
+  with 0), and the tickets of the writes are set once their files are fsynced,
+  so a request can wait for durability or return without it.
+- At most `max_queue` writes are queued; further requests wait for room.
+- `stop` writes and fsyncs everything that is queued.
+
+Until `start` is called (or with `max_queue` 0), writes are performed right
+away on the calling thread, as before.
+"""
+
+import collections
+import os
+import threading
+from time import monotonic, perf_counter
+
+from coauthor_interface.backend.metrics import METRICS
+
+
+class WriteTicket:
+    """Completion of a queued write: `wait` returns True once it is written (and fsynced)."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.error = None
+
+    def _set(self, error=None):
+        self.error = error
+        self._event.set()
+
+    @property
+    def done(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout) and self.error is None
+
+
+class WriteBehindWriter:
+    def __init__(self, max_queue=1024, fsync_interval=1.0, metrics=METRICS):
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.metrics = metrics
+        self._appends = collections.OrderedDict()  # path -> [(data, ticket)]
+        self._writes = collections.OrderedDict()  # path -> (function, [tickets], on_superseded)
+        self._barriers = []  # Tickets of flush requests
+        self.configure(max_queue, fsync_interval)
+
+    def configure(self, max_queue=1024, fsync_interval=1.0):
+        self.max_queue = max_queue
+        self.fsync_interval = fsync_interval
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _queue_size(self):
+        return sum(len(items) for items in self._appends.values()) + len(self._writes)
+
+    def _wait_for_room(self):
+        if self._queue_size() >= self.max_queue:
+            self.metrics.increment("write_behind_queue_full")
+            while self._queue_size() >= self.max_queue and self._thread is not None:
+                self._cond.wait()
+
+    def append(self, path, data):
+        """Append a string to a file."""
+        ticket = WriteTicket()
+        with self._cond:
+            if self.running and self.max_queue > 0:
+                self._wait_for_room()
+            if self.running and self.max_queue > 0:
+                self._appends.setdefault(path, []).append((data, ticket))
+                self.metrics.set_gauge("write_behind_queue_depth", self._queue_size())
+                self._cond.notify_all()
+                return ticket
+
+        try:
+            with open(path, "a") as f:
+                f.write(data)
+            ticket._set()
+        except Exception as e:
+            ticket._set(e)
+        return ticket
+
+    def write(self, path, function, on_superseded=None):
+        """Write a file by calling `function()`; a queued write of the same path is replaced."""
+        ticket = WriteTicket()
+        superseded = None
+        queued = False
+        with self._cond:
+            if self.running and self.max_queue > 0:
+                if path not in self._writes:
+                    self._wait_for_room()
+            if self.running and self.max_queue > 0:
+                tickets = []
+                if path in self._writes:
+                    _, tickets, superseded = self._writes.pop(path)
+                    self.metrics.increment("write_behind_coalesced")
+                self._writes[path] = (function, [*tickets, ticket], on_superseded)
+                self.metrics.set_gauge("write_behind_queue_depth", self._queue_size())
+                self._cond.notify_all()
+                queued = True
+        if superseded is not None:
+            superseded()
+        if queued:
+            return ticket
+
+        try:
+            function()
+            ticket._set()
+        except Exception as e:
+            ticket._set(e)
+        return ticket
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is written and fsynced. Returns False on timeout."""
+        ticket = WriteTicket()
+        with self._cond:
+            if not self.running:
+                return True
+            self._barriers.append(ticket)
+            self._cond.notify_all()
+        return ticket.wait(timeout)
+
+    def _write_batch(self, appends, writes):
+        """Perform the writes of a batch; returns {path: [tickets]} of the written files."""
+        written = collections.defaultdict(list)
+        for path, items in appends.items():
+            tickets = [ticket for _, ticket in items]
+            try:
+                with open(path, "a") as f:
+                    f.write("".join(data for data, _ in items))
+                written[path].extend(tickets)
+            except Exception as e:
+                print(f"# Failed to append to {path}: {e}")
+                self.metrics.increment("write_behind_failures")
+                for ticket in tickets:
+                    ticket._set(e)
+        for path, (function, tickets, _) in writes.items():
+            try:
+                function()
+                written[path].extend(tickets)
+            except Exception as e:
+                print(f"# Failed to write {path}: {e}")
+                self.metrics.increment("write_behind_failures")
+                for ticket in tickets:
+                    ticket._set(e)
+        self.metrics.increment("write_behind_batches")
+        self.metrics.increment(
+            "write_behind_writes", sum(len(items) for items in appends.values()) + len(writes)
+        )
+        return written
+
+    def _fsync(self, unsynced):
+        start = perf_counter()
+        for path, tickets in unsynced.items():
+            error = None
+            try:
+                # fsync through any descriptor writes back the pages of the file
+                with open(path, "rb") as f:
+                    os.fsync(f.fileno())
+            except OSError as e:
+                print(f"# Failed to fsync {path}: {e}")
+                error = e
+            for ticket in tickets:
+                ticket._set(error)
+        if unsynced:
+            self.metrics.observe("write_behind_fsync_seconds", perf_counter() - start)
+
+    def _run(self):
+        unsynced = collections.defaultdict(list)  # path -> tickets written but not fsynced
+        last_fsync = monotonic()
+        while True:
+            with self._cond:
+                while not (self._appends or self._writes or self._barriers or self._stopping):
+                    timeout = None
+                    if unsynced:
+                        timeout = max(0.0, last_fsync + self.fsync_interval - monotonic())
+                        if timeout == 0:
+                            break
+                    self._cond.wait(timeout)
+                appends, self._appends = self._appends, collections.OrderedDict()
+                writes, self._writes = self._writes, collections.OrderedDict()
+                barriers, self._barriers = self._barriers, []
+                stopping = self._stopping
+                self.metrics.set_gauge("write_behind_queue_depth", 0)
+                self._cond.notify_all()
+
+            if appends or writes:
+                for path, tickets in self._write_batch(appends, writes).items():
+                    unsynced[path].extend(tickets)
+            if barriers or stopping or monotonic() - last_fsync >= self.fsync_interval:
+                self._fsync(unsynced)
+                unsynced = collections.defaultdict(list)
+                last_fsync = monotonic()
+            for ticket in barriers:
+                ticket._set()
+            if stopping:
+                with self._cond:
+                    if not (self._appends or self._writes or self._barriers):
+                        return
+
+    def start(self):
+        """Start the background writer thread."""
+        with self._cond:
+            if self._thread is not None or self.max_queue <= 0:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Write and fsync everything that is queued, then stop the background thread."""
+        with self._cond:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        thread.join()
+        with self._cond:
+            self._thread = None
+            self._stopping = False
+            self._cond.notify_all()
@@ -1,6 +1,7 @@
 async function startSession(accessCode) {
   session = {};
   logs = [];
+  persistedLogCount = 0;
   sessionEnded = false;  // Reset session ended flag for new session
   try {
     session = await wwai.api.startSession(domain, accessCode);
@@ -11,6 +12,7 @@ async function startSession(accessCode) {
       alert(session['message']);
     } else {
       sessionId = session.session_id;
+      sessionToken = session.session_token || null;
       example = session.example;
       exampleActualText = session.example_text;
       promptText = session.prompt_text;
@@ -34,6 +36,10 @@ async function startSession(accessCode) {
 
       stop = session.stop;
       engine = session.engine;
+
+      if (checkpointLogs) {
+        startCheckpoints();
+      }
     }
   } catch (e) {
     alert('Start sesion error:' + e);
@@ -48,6 +54,21 @@ async function startSession(accessCode) {
   }
 }
 
+function startCheckpoints() {
+  clearInterval(checkpointTimer);
+  checkpointTimer = setInterval(async function () {
+    if (sessionEnded) {
+      clearInterval(checkpointTimer);
+    } else if (logs.length > persistedLogCount) {
+      try {
+        await wwai.api.checkpointLog(sessionId, logs);
+      } catch (e) {
+        console.log(e);  // Retried with the next checkpoint
+      }
+    }
+  }, checkpointInterval);
+}
+
 async function saveWork() {
   const results = await wwai.api.endSession(sessionId, logs, false); // Don't remove session
   const verificationCode = results['verification_code'];
@@ -98,7 +119,7 @@ async function endSessionWithReplay() {
 const delay = ms => new Promise(res => setTimeout(res, ms));
 var prevEventName = '';
 
-async function replay(replayLogs, start) {
+async function replay(replayLogs, start, startText = null) {
   emptyDropdownMenu();
   quill.setText('');
 
@@ -158,9 +179,9 @@ async function replay(replayLogs, start) {
 
   $timeTotal.html(minutes + ':' + seconds);
 
-  // If start is specified, initialize with currentDoc of the start log
+  // If start is specified, initialize with the document before the start log
   if (logCurrent > 0) {
-    setText(replayLogs[0].currentDoc);
+    setText(startText !== null ? startText : replayLogs[0].currentDoc);
     setCursor(replayLogs[0].currentCursor);
   }
 
@@ -213,16 +234,23 @@ async function replay(replayLogs, start) {
 
 async function replayLogsWithSessionId(sessionId, range) {
   try {
-    results = await wwai.api.getLog(sessionId);
-
     let start = parseInt(range['start']);
     let end = parseInt(range['end']);
-    if (end < 0) {
-      end = results['logs'].length;
+
+    // Only fetch the events in [start, end]
+    results = await wwai.api.getLog(sessionId, start, end < 0 ? null : Math.max(0, end - start + 1));
+    replayLogs = results['logs'];
+
+    // Only events from start on are replayed, so get the document before them from the server
+    let startText = null;
+    if (start > 0) {
+      const document = await wwai.api.seekLog(sessionId, start - 1);
+      if (document['status']) {
+        startText = document['text'];
+      }
     }
-    replayLogs = results['logs'].slice(start, end + 1);
 
-    await replay(replayLogs, start);
+    await replay(replayLogs, start, startText);
 
   } catch (e) {
     const message = 'We could not get the requested writing session (' + sessionId + ') '
@@ -288,6 +316,7 @@ async function loadLogsWithSessionId(newSessionId) {
     // Overwrite the current logs with loaded logs
     loadedLogs = results['logs'];
     logs = loadedLogs;
+    persistedLogCount = loadedLogs.length;  // The loaded events are already saved on the server
 
     // Set the text editor to be the last state in the log
     const lastText = results['last_text'];
@@ -334,6 +363,7 @@ async function saveLogs() {
 function getDataForQuery(doc, exampleText) {
   const data = {
     'session_id': sessionId,
+    'session_token': sessionToken,
     'domain': domain,
     'example': example,
     'example_text': exampleText, // $('#exampleTextarea').val()
@@ -372,6 +402,9 @@ function queryGPT3() {
     contentType: 'application/json; charset=utf-8',
     success: function (data) {
       hideLoadingSignal();
+      if (data.session_token) {
+        sessionToken = data.session_token;
+      }
       if (data.status == SUCCESS) {
         if (data.original_suggestions.length > 0) {
           originalSuggestions = data.original_suggestions;
@@ -420,6 +453,7 @@ function parse_logs() {
 
   const data = {
     'session_id': sessionId,
+    'session_token': sessionToken,
     'domain': domain,
     'logs': logs
   }
@@ -438,6 +472,9 @@ function parse_logs() {
     success: function (data) {
       console.log('parse_logs success:', data);
       hideLoadingSignal();
+      if (data.session_token) {
+        sessionToken = data.session_token;
+      }
       if (data.status != SUCCESS) {
         console.log('parse_logs error:', data.message);
         alert(data.message);
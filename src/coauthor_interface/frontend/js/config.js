@@ -13,7 +13,12 @@ var sortSuggestions = true;
 /***************************************************************/
 var session = null;  // Changed when refreshed
 var sessionId = '';  // Changed when refreshed
+var sessionToken = null;  // Signed session state in stateless mode
 var sessionEnded = false;  // Track if session has been ended
+var checkpointLogs = false;  // Opt-in: append new events to the server log instead of sending the whole log
+var checkpointInterval = 30 * 1000;  // Milliseconds between checkpoints
+var checkpointTimer = null;
+var persistedLogCount = 0;  // Number of events saved on the server
 var example = '';
 var exampleActualText = '';
 var stop = new Array();
@@ -39,11 +39,30 @@ window.wwai = window.wwai || {};
 
   wwai.api.endSession = async function (sessionId, logs, removeSession = true) {
     try {
-      const results = await serverFetch("end_session", {
+      const args = {
         'sessionId': sessionId,
-        'logs': logs,
+        'session_token': sessionToken,
         'remove_session': removeSession,
-      });
+      };
+      if (!checkpointLogs) {
+        args['logs'] = logs;
+        return await serverFetch("end_session", args);
+      }
+
+      // Send only the events after the last checkpoint; resend from the saved count after a gap
+      let results;
+      for (let attempt = 0; attempt < 2; attempt++) {
+        args['seq'] = persistedLogCount;
+        args['events'] = logs.slice(persistedLogCount);
+        results = await serverFetch("end_session", args);
+        if (results['persisted'] === undefined || results['persisted'] == persistedLogCount) {
+          break;
+        }
+        persistedLogCount = results['persisted'];
+        if (results['status'] == SUCCESS) {
+          break;
+        }
+      }
       return results;
     } catch (e) {
       alert('Oops, we had an error saving your writing session! Please share a screenshot of this message with ' + contactEmail + ' to help us fix the problem. Our sincere apologies for the inconvenience!\n\n' + e);
@@ -51,6 +70,19 @@ window.wwai = window.wwai || {};
     }
   };
 
+  wwai.api.checkpointLog = async function (sessionId, logs) {
+    const results = await serverFetch("checkpoint_log", {
+      'sessionId': sessionId,
+      'session_token': sessionToken,
+      'seq': persistedLogCount,
+      'events': logs.slice(persistedLogCount),
+    });
+    if (results['persisted'] !== undefined) {
+      persistedLogCount = results['persisted'];
+    }
+    return results;
+  };
+
   wwai.api.saveLog = async function () {
     console.log('[wwai.api.saveLog] sessionId:' + sessionId);
     console.log('[wwai.api.saveLog] logs.length:' + logs.length);
@@ -62,10 +94,27 @@ window.wwai = window.wwai || {};
     return results;
   };
 
-  wwai.api.getLog = async function (replaySessionId) {
-    const results = await serverFetch("get_log", {
+  wwai.api.getLog = async function (replaySessionId, offset = null, limit = null) {
+    const args = {
       'sessionId': replaySessionId,
       'domain': domain,
+    };
+    // Request only the events [offset, offset + limit); the whole log without them
+    if (offset !== null) {
+      args['offset'] = offset;
+    }
+    if (limit !== null) {
+      args['limit'] = limit;
+    }
+    const results = await serverFetch("get_log", args);
+    return results;
+  };
+
+  wwai.api.seekLog = async function (replaySessionId, event) {
+    // Document (text and mask) after the event at index `event`
+    const results = await serverFetch("seek_log", {
+      'sessionId': replaySessionId,
+      'event': event,
     });
     return results;
   };
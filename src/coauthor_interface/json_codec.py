@@ -0,0 +1,89 @@
+"""
+JSON codec for API payloads and logs.
+
+Encoding and decoding keystroke logs is the largest CPU cost of most requests.
+`dumps` and `loads` use orjson when it is installed (the optional `fast_json`
+extra) and the standard library otherwise; `set_codec` selects a codec
+explicitly. Values that orjson does not support (e.g., integers above 64 bits,
+NaN in the input) are handled by the standard library, so both codecs accept
+the same documents.
+
+The output of the codecs differs only in whitespace: orjson writes compact
+JSON, while the standard library keeps its default separators so that files
+written without orjson stay byte-identical to the previous ones.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CODECS = ("auto", "orjson", "stdlib")
+
+
+class StdlibCodec:
+    name = "stdlib"
+
+    def dumps(self, obj, default=None, sort_keys=False):
+        return json.dumps(obj, default=default, sort_keys=sort_keys)
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def __init__(self):
+        self._stdlib = StdlibCodec()
+
+    def dumps(self, obj, default=None, sort_keys=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode("utf-8")
+        except orjson.JSONEncodeError:
+            return self._stdlib.dumps(obj, default=default, sort_keys=sort_keys)
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return self._stdlib.loads(data)  # Raises json.JSONDecodeError for invalid documents
+
+
+def get_codec(name="auto"):
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec: {name} (expected one of {', '.join(CODECS)})")
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("The orjson codec requires the orjson package (pip install orjson)")
+    if name == "stdlib" or orjson is None:
+        return StdlibCodec()
+    return OrjsonCodec()
+
+
+_codec = get_codec()
+
+
+def set_codec(name):
+    """Select the codec used by `dumps` and `loads` ("auto" prefers orjson)."""
+    global _codec
+    _codec = get_codec(name)
+    return _codec
+
+
+def current_codec():
+    return _codec
+
+
+def dumps(obj, default=None, sort_keys=False):
+    """Serialize obj to a JSON string."""
+    return _codec.dumps(obj, default=default, sort_keys=sort_keys)
+
+
+def loads(data):
+    """Deserialize a JSON document (str or bytes)."""
+    return _codec.loads(data)
@@ -1,8 +1,8 @@
-import json
 from pathlib import Path
 from typing import Any
 from tqdm import tqdm
 
+from coauthor_interface import json_codec
 from coauthor_interface.thought_toolkit.utils import (
     custom_serializer,
     get_spacy_similarity,
@@ -17,6 +17,19 @@ from coauthor_interface.thought_toolkit.parser_all_levels import (
 from coauthor_interface.thought_toolkit.active_plugins import ACTIVE_PLUGINS
 
 
+def parse_session_level_1_actions(logs: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Parse level 1 actions from the raw logs of one session."""
+    actions_analyzer = SameSentenceMergeAnalyzer(last_action=None, raw_logs=logs)
+
+    actions_lst, last_action = actions_analyzer.parse_actions_from_logs(all_logs=logs, last_action=None)
+
+    # Add level_1_action_type to each action
+    for action in actions_lst:
+        action["level_1_action_type"] = action["action_type"]
+
+    return actions_lst
+
+
 def parse_level_1_actions(
     coauthor_logs_by_session: dict[str, list[dict[str, Any]]],
 ) -> dict[str, list[dict[str, Any]]]:
@@ -24,21 +37,10 @@ def parse_level_1_actions(
     level_1_actions_per_session = {}
 
     for session in tqdm(coauthor_logs_by_session):
-        actions_analyzer = SameSentenceMergeAnalyzer(
-            last_action=None, raw_logs=coauthor_logs_by_session[session]
-        )
-
-        actions_lst, last_action = actions_analyzer.parse_actions_from_logs(
-            all_logs=coauthor_logs_by_session[session], last_action=None
+        level_1_actions_per_session[session] = parse_session_level_1_actions(
+            coauthor_logs_by_session[session]
         )
 
-        level_1_actions_per_session[session] = actions_lst
-
-    # Add level_1_action_type to each action
-    for session_key, actions in level_1_actions_per_session.items():
-        for action in actions:
-            action["level_1_action_type"] = action["action_type"]
-
     return level_1_actions_per_session
 
 
@@ -84,14 +86,28 @@ def action_type_priority_sort(
     return actions_dict
 
 
+def analyze_session(logs: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Process the logs of one session through all levels of analysis and return its priority-based actions.
+
+    Sessions are analyzed independently, so sessions can be analyzed in parallel and
+    without loading the logs of the others (see backend/log_export.py).
+    """
+    level_1_actions = {"session": parse_session_level_1_actions(logs)}
+    level_2_actions = parse_level_2_actions_from_level_1(level_1_actions)
+    level_3_actions = parse_level_3_actions_from_level_2(level_2_actions)
+
+    custom_priority_list = [plugin.get_plugin_name() for plugin in ACTIVE_PLUGINS]
+    return action_type_priority_sort(custom_priority_list, level_3_actions)["session"]
+
+
 def process_logs(input_file: Path, output_dir: Path) -> None:
     """Process logs through all levels of analysis and save results."""
     # Create output directory if it doesn't exist
     output_dir.mkdir(parents=True, exist_ok=True)
 
     # Load input logs
-    with open(input_file) as f:
-        coauthor_logs_by_session = json.load(f)
+    with open(input_file, "rb") as f:
+        coauthor_logs_by_session = json_codec.loads(f.read())
 
     # Process through all levels
     level_1_actions = parse_level_1_actions(coauthor_logs_by_session)
@@ -113,7 +129,7 @@ def process_logs(input_file: Path, output_dir: Path) -> None:
     for filename, data in output_files.items():
         output_path = output_dir / filename
         with open(output_path, "w") as f:
-            json.dump(data, f, default=custom_serializer)
+            f.write(json_codec.dumps(data, default=custom_serializer))
 
 
 # After running the entire Python file, you will generate four different JSON files:
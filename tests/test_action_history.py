@@ -0,0 +1,125 @@
+import json
+from pathlib import Path
+
+from coauthor_interface.backend.action_history import ActionHistory
+
+
+def make_action(level_1, level_3=None, delta=None, end_time="2025/06/20 12:00:00"):
+    action = {
+        "level_1_action_type": level_1,
+        "action_end_time": end_time,
+    }
+    if level_3:
+        action["level_3_action_type"] = level_3
+    if delta:
+        action["action_delta"] = delta
+    return action
+
+
+def test_window_is_bounded():
+    history = ActionHistory(window_size=3)
+    history.extend([make_action("insert_text") for _ in range(10)])
+
+    assert len(history) == 3
+    assert history.total_count == 10
+    assert history.count("insert_text", level="level_1_action_type") == 10
+
+
+def test_recent_returns_last_actions_in_order():
+    history = ActionHistory(window_size=5)
+    actions = [make_action("insert_text", end_time=str(i)) for i in range(4)]
+    history.extend(actions)
+
+    assert history.recent(2) == actions[-2:]
+    assert history.recent() == actions
+    assert history.recent(10) == actions
+    assert history.recent(0) == []
+
+
+def test_aggregates_cover_actions_outside_the_window():
+    history = ActionHistory(window_size=1)
+    history.extend(
+        [
+            make_action("insert_text", level_3="any_insert", delta=("INSERT", "hello", 5, 1)),
+            make_action("delete_text", delta=("DELETE", "lo", 2, 1)),
+            make_action("insert_text", level_3="any_insert", delta=("INSERT", "p", 1, 1), end_time="last"),
+        ]
+    )
+
+    summary = history.summarize()
+    assert summary["total_count"] == 3
+    assert summary["window_count"] == 1
+    assert summary["inserted_chars"] == 6
+    assert summary["deleted_chars"] == 2
+    assert summary["last_action_end_time"] == "last"
+    assert history.count("any_insert") == 2
+    assert summary["type_counts"]["level_1_action_type"] == {"insert_text": 2, "delete_text": 1}
+
+
+def test_aggregates_survive_state_round_trip():
+    history = ActionHistory(window_size=2)
+    history.extend([make_action("insert_text", delta=("INSERT", "abc", 3, 1)) for _ in range(3)])
+
+    restored = ActionHistory.from_state(history.to_state(n_actions=1))
+
+    assert len(restored) == 1
+    assert restored.summarize() == {**history.summarize(), "window_count": 1}
+
+
+def test_full_history_is_appended_to_disk(fs):
+    path = Path("/logs/session.actions.jsonl")
+    fs.create_dir("/logs")
+
+    history = ActionHistory(window_size=1, history_path=str(path))
+    history.extend([make_action("insert_text"), make_action("delete_text")])
+    history.extend([make_action("insert_text")])
+
+    lines = path.read_text().strip().split("\n")
+    assert [json.loads(line)["level_1_action_type"] for line in lines] == [
+        "insert_text",
+        "delete_text",
+        "insert_text",
+    ]
+    assert len(history) == 1
+
+
+def test_history_is_appended_once_per_extend():
+    class Writer:
+        def __init__(self):
+            self.appends = []
+
+        def append(self, path, data):
+            self.appends.append((path, data))
+
+    writer = Writer()
+    history = ActionHistory(window_size=1, history_path="/logs/session.actions.jsonl")
+    history.extend([make_action("insert_text"), make_action("delete_text")], writer=writer)
+
+    assert len(writer.appends) == 1
+    assert history.total_count == 2
+    assert history.count("delete_text", level="level_1_action_type") == 1
+    path, data = writer.appends[0]
+    assert path == "/logs/session.actions.jsonl"
+    assert [json.loads(line)["level_1_action_type"] for line in data.splitlines()] == [
+        "insert_text",
+        "delete_text",
+    ]
+
+
+def test_extend_with_no_actions_does_not_write(fs):
+    path = Path("/logs/session.actions.jsonl")
+    fs.create_dir("/logs")
+
+    history = ActionHistory(history_path=str(path))
+    history.extend([])
+
+    assert not path.exists()
+    assert history.total_count == 0
+
+
+def test_to_json_returns_window():
+    history = ActionHistory(window_size=2)
+    assert history.to_json() == []
+
+    history.extend([make_action("insert_text")])
+    assert json.loads(json.dumps(history.to_json())) == [make_action("insert_text")]
@@ -1,10 +1,19 @@
+import gzip
 import importlib
+import json
+import os
 from unittest.mock import MagicMock, call, patch
 
 import pytest
 
 import coauthor_interface.backend.api_server as srv
 from coauthor_interface.backend.api_server import app
+from coauthor_interface.backend.config_cache import ConfigSnapshot
+from coauthor_interface.backend.helper import save_log_to_jsonl
+from coauthor_interface.backend.log_index import LogPathIndex
+from coauthor_interface.backend.log_storage import FileLogStorage, SQLiteLogStorage
+from coauthor_interface.backend.log_summary import read_summary
+from coauthor_interface.backend.session_query import SessionQueryIndex
 
 
 @pytest.fixture
@@ -13,6 +22,12 @@ def client():
     return app.test_client()
 
 
+def set_config(monkeypatch, examples=None, prompts=None, access_codes=None):
+    """Serve a fixed configuration instead of reading config_dir."""
+    snapshot = ConfigSnapshot(1, examples or {}, prompts or {}, access_codes or {})
+    monkeypatch.setattr(srv.CONFIG_CACHE, "get", lambda check=True: snapshot)
+
+
 def test_query_dev_mode_returns_empty(client, monkeypatch):
     """When DEV_MODE=true, /api/query should return empty suggestions."""
     # Enable DEV_MODE
@@ -31,7 +46,7 @@ def test_query_dev_mode_returns_empty(client, monkeypatch):
         "parsed_actions": [],
         "show_interventions": True,
     }
-    srv.examples = {0: ""}
+    set_config(monkeypatch, examples={0: ""})
     srv.blocklist = []
 
     logs = [
@@ -99,36 +114,33 @@ def test_query_dev_mode_returns_empty(client, monkeypatch):
     assert data["suggestions_with_probabilities"] == []
 
 
-@patch("coauthor_interface.backend.api_server.read_access_codes")
-@patch("coauthor_interface.backend.api_server.read_prompts")
-@patch("coauthor_interface.backend.api_server.read_examples")
 @patch("coauthor_interface.backend.api_server.append_session_to_file")  # Patch to prevent file writes
 @patch("coauthor_interface.backend.api_server.print_current_sessions")
 @patch("coauthor_interface.backend.api_server.print_verbose")
-@patch("coauthor_interface.backend.api_server.gc.collect")  # Patch to avoid running garbage collection
+@patch("coauthor_interface.backend.gc_policy.gc.collect")  # Patch to avoid running garbage collection
 def test_start_session_success(
     mock_gc,
     mock_print_verbose,
     mock_print_current_sessions,
     mock_append_session_to_file,
-    mock_read_examples,
-    mock_read_prompts,
-    mock_read_access_codes,
     client,
+    monkeypatch,
 ):
     """Test that the start_session route returns the appropriate response"""
 
     # Arrange: Mock data
-    mock_read_examples.return_value = {"example_1": "This is an example text."}
-    mock_read_prompts.return_value = {"prompt_1": "This is a prompt text."}
     MockConfig = MagicMock()
     MockConfig.example = "example_1"
     MockConfig.prompt = "prompt_1"
     MockConfig.convert_to_dict.return_value = {"engine": "gpt-4", "domain": "general"}
-    mock_read_access_codes.return_value = {"valid_access_code": MockConfig}
+    set_config(
+        monkeypatch,
+        examples={"example_1": "This is an example text."},
+        prompts={"prompt_1": "This is a prompt text."},
+        access_codes={"valid_access_code": MockConfig},
+    )
 
     srv.config_dir = "some_dir"
-    srv.prompts = ["some prompt"]
     srv.metadata_path = "some_path"
 
     payload = {"domain": "general", "accessCode": "valid_access_code"}
@@ -149,19 +161,39 @@ def test_start_session_success(
     assert "prompt_text" in data
 
 
-@patch("coauthor_interface.backend.api_server.read_access_codes")
-@patch("coauthor_interface.backend.api_server.read_prompts")
-@patch("coauthor_interface.backend.api_server.read_examples")
+@patch("coauthor_interface.backend.api_server.append_session_to_file")
+def test_start_session_token_too_large(mock_append_session_to_file, client, monkeypatch):
+    """In stateless mode, a session whose token cannot be created is not started."""
+    config = MagicMock()
+    config.example = "example_1"
+    config.prompt = "prompt_1"
+    config.convert_to_dict.return_value = {"engine": "gpt-4", "domain": "general"}
+    set_config(
+        monkeypatch,
+        examples={"example_1": ""},
+        prompts={"prompt_1": ""},
+        access_codes={"valid_access_code": config},
+    )
+    monkeypatch.setattr(srv, "session_tokens", srv.SessionTokenCodec("secret", max_token_size=10))
+
+    response = client.post("/api/start_session", json={"accessCode": "valid_access_code"})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["status"] is False
+    assert "too large" in data["message"]
+    assert "session_token" not in data
+    mock_append_session_to_file.assert_not_called()
+
+
 @patch("coauthor_interface.backend.api_server.print_current_sessions")
 def test_start_session_no_access_code_provided(
     mock_print_current_sessions,
-    mock_read_examples,
-    mock_read_prompts,
-    mock_read_access_codes,
     client,
+    monkeypatch,
 ):
     # Arrange: mock data
-    mock_read_access_codes.return_value = {"valid_access_code": MagicMock()}
+    set_config(monkeypatch, access_codes={"valid_access_code": MagicMock()})
 
     payload = {"accessCode": ""}  # Simulate missing or empty access code
 
@@ -176,7 +208,7 @@ def test_start_session_no_access_code_provided(
 @patch("coauthor_interface.backend.api_server.save_log_to_jsonl")
 @patch("coauthor_interface.backend.api_server.print_verbose")
 @patch("coauthor_interface.backend.api_server.print_current_sessions")
-@patch("coauthor_interface.backend.api_server.gc.collect")
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
 def test_end_session_success(
     mock_gc,
     mock_print_current_sessions,
@@ -209,10 +241,59 @@ def test_end_session_success(
     assert data["verification_code"] == "abc123"
 
 
+@patch("coauthor_interface.backend.api_server.print_current_sessions")
+def test_checkpoints_and_sealed_end_session(mock_print_current_sessions, client, fs):
+    """Checkpoints append events; end_session with events appends the rest and seals the log."""
+    fs.create_dir("/logs/demo")
+    srv.proj_dir = "/logs/demo"
+    srv.verbose = False
+    session_id = "checkpointed"
+    srv.SESSIONS.clear()
+    srv.SESSIONS[session_id] = {"verification_code": "code"}
+    logs = [{"eventName": "text-insert", "n": i} for i in range(4)]
+
+    response = client.post(
+        "/api/checkpoint_log", json={"sessionId": session_id, "seq": 0, "events": logs[:2]}
+    )
+    assert response.get_json() == {"status": True, "persisted": 2}
+
+    # A checkpoint past the saved events is rejected with the persisted count
+    response = client.post(
+        "/api/checkpoint_log", json={"sessionId": session_id, "seq": 3, "events": logs[3:]}
+    )
+    data = response.get_json()
+    assert data["status"] is False
+    assert data["persisted"] == 2
+
+    response = client.post("/api/end_session", json={"sessionId": session_id, "seq": 2, "events": logs[2:]})
+    data = response.get_json()
+    assert data["status"] is True
+    assert data["persisted"] == 4
+    assert data["verification_code"] == "code"
+    assert srv.read_log("/logs/demo/checkpointed.jsonl") == logs
+
+    response = client.post("/api/checkpoint_log", json={"sessionId": session_id, "seq": 4, "events": []})
+    assert response.get_json()["status"] is False
+
+
+def test_checkpoint_of_unknown_session_is_rejected(client, fs):
+    """A checkpoint of a session that was not started writes nothing."""
+    fs.create_dir("/logs/demo")
+    srv.proj_dir = "/logs/demo"
+    srv.verbose = False
+    srv.SESSIONS.clear()
+
+    response = client.post(
+        "/api/checkpoint_log", json={"sessionId": "unknown", "seq": 0, "events": [{"n": 0}]}
+    )
+    assert response.get_json() == {"status": False, "message": "Invalid session."}
+    assert not fs.exists("/logs/demo/unknown.jsonl")
+
+
 @patch("coauthor_interface.backend.api_server.save_log_to_jsonl")
 @patch("coauthor_interface.backend.api_server.print_verbose")
 @patch("coauthor_interface.backend.api_server.print_current_sessions")
-@patch("coauthor_interface.backend.api_server.gc.collect")
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
 def test_end_session_save_log_failure(
     mock_gc,
     mock_print_current_sessions,
@@ -249,7 +330,7 @@ def test_end_session_save_log_failure(
 @patch("coauthor_interface.backend.api_server.save_log_to_jsonl")
 @patch("coauthor_interface.backend.api_server.print_verbose")
 @patch("coauthor_interface.backend.api_server.print_current_sessions")
-@patch("coauthor_interface.backend.api_server.gc.collect")
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
 def test_end_session_missing_session(
     mock_gc,
     mock_print_current_sessions,
@@ -276,30 +357,23 @@ def test_end_session_missing_session(
 
 
 @patch("coauthor_interface.backend.api_server.append_session_to_file")  # Patch to prevent file writes
-@patch("coauthor_interface.backend.api_server.read_access_codes")
-@patch("coauthor_interface.backend.api_server.read_prompts")
-@patch("coauthor_interface.backend.api_server.read_examples")
 @patch("coauthor_interface.backend.api_server.get_uuid")
 @patch("coauthor_interface.backend.api_server.save_log_to_jsonl")
 @patch("coauthor_interface.backend.api_server.print_current_sessions")
 @patch("coauthor_interface.backend.api_server.print_verbose")
-@patch("coauthor_interface.backend.api_server.gc.collect")
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
 def test_multiple_sessions_do_not_mix_logs(
     mock_gc,
     mock_print_verbose,
     mock_print_current_sessions,
     mock_save_log_to_jsonl,
     mock_get_uuid,
-    mock_read_examples,
-    mock_read_prompts,
-    mock_read_access_codes,
     mock_append_session_to_file,
     client,
+    monkeypatch,
 ):
     # Set up mocks for start_session
     mock_get_uuid.side_effect = ["sessionA", "sessionB"]
-    mock_read_examples.return_value = {"example1": "Example A", "example2": "Example B"}
-    mock_read_prompts.return_value = {"prompt1": "Prompt A", "prompt2": "Prompt B"}
 
     class DummyConfig:
         def __init__(self, prompt, example):
@@ -311,10 +385,15 @@ def test_multiple_sessions_do_not_mix_logs(
         def convert_to_dict(self):
             return {"engine": self.engine, "domain": self.domain}
 
-    mock_read_access_codes.return_value = {
-        "codeA": DummyConfig("prompt1", "example1"),
-        "codeB": DummyConfig("prompt2", "example2"),
-    }
+    set_config(
+        monkeypatch,
+        examples={"example1": "Example A", "example2": "Example B"},
+        prompts={"prompt1": "Prompt A", "prompt2": "Prompt B"},
+        access_codes={
+            "codeA": DummyConfig("prompt1", "example1"),
+            "codeB": DummyConfig("prompt2", "example2"),
+        },
+    )
 
     # ----- Start two sessions -----
     response1 = client.post("/api/start_session", json={"accessCode": "codeA"})
@@ -378,12 +457,10 @@ def test_query_invalid_session(client):
     assert "not been established" in data["message"]
 
 
-@patch("coauthor_interface.backend.api_server.retrieve_log_paths")
-def test_get_log_invalid_session(mock_retrieve_paths, client):
+@patch("coauthor_interface.backend.api_server.LOG_PATH_INDEX")
+def test_get_log_invalid_session(mock_log_index, client):
     """POST /api/get_log with unknown session_id returns failure."""
-    mock_retrieve_paths.return_value = {}
-    # Ensure args.replay_dir exists for retrieve_log_paths
-    srv.args = type("A", (), {"replay_dir": "ignored"})()
+    mock_log_index.get.return_value = None
 
     response = client.post("/api/get_log", json={"sessionId": "unknown"})
     assert response.status_code == 200
@@ -404,6 +481,7 @@ def test_query_success(
     mock_sugg,
     mock_openai_class,
     client,
+    monkeypatch,
 ):
     """POST /api/query returns parsed and filtered suggestions on success."""
     from types import SimpleNamespace
@@ -424,7 +502,7 @@ def test_query_success(
         "parsed_actions": [],
         "show_interventions": True,
     }
-    srv.examples = {0: "ex"}
+    set_config(monkeypatch, examples={0: "ex"})
     srv.blocklist = []
 
     # Set up the mock OpenAI client
@@ -530,7 +608,7 @@ def test_query_success(
     assert data["ctrl"]["max_tokens"] == 5
 
 
-@patch("coauthor_interface.backend.api_server.retrieve_log_paths")
+@patch("coauthor_interface.backend.api_server.LOG_PATH_INDEX")
 @patch("coauthor_interface.backend.api_server.read_log")
 @patch("coauthor_interface.backend.api_server.compute_stats")
 @patch("coauthor_interface.backend.api_server.get_last_text_from_log")
@@ -540,7 +618,7 @@ def test_get_log_success(
     mock_last_text,
     mock_stats,
     mock_read_log,
-    mock_retrieve,
+    mock_log_index,
     client,
 ):
     """POST /api/get_log returns logs and metadata on success."""
@@ -551,14 +629,13 @@ def test_get_log_success(
     fake_last = "end"
     fake_conf = {"k": "v"}
 
-    mock_retrieve.return_value = {session_id: fake_path}
+    mock_log_index.get.side_effect = lambda sid: fake_path if sid == session_id else None
     mock_read_log.return_value = fake_logs
     mock_stats.return_value = fake_stats
     mock_last_text.return_value = fake_last
     mock_get_config.return_value = fake_conf
 
-    # Provide args and metadata for get_log
-    srv.args = type("A", (), {"replay_dir": "ignored"})()
+    # Provide metadata for get_log
     srv.metadata = {}
     srv.metadata_path = "meta"
 
@@ -717,10 +794,245 @@ def test_parse_logs_invalid_session(client):
     assert data["alert_author"] is False
 
 
+def test_start_session_is_shed_under_overload(client, monkeypatch):
+    """POST /api/start_session returns 503 with Retry-After when the server is shedding load."""
+    monkeypatch.setattr(srv.LOAD_MONITOR, "level", lambda: srv.SHEDDING)
+
+    response = client.post("/api/start_session", json={"accessCode": "demo"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(srv.LOAD_MONITOR.retry_after)
+    assert response.get_json()["status"] is False
+
+
+@patch("coauthor_interface.backend.api_server.analyze_and_update_actions")
+def test_parse_logs_is_deferred_under_overload(mock_analyze, client, monkeypatch):
+    """POST /api/parse_logs defers the analysis when the server sheds load."""
+    monkeypatch.setattr(srv.LOAD_MONITOR, "level", lambda: srv.SHEDDING)
+    srv.SESSIONS.clear()
+    srv.SESSIONS["busy-session"] = {"show_interventions": True}
+
+    response = client.post("/api/parse_logs", json={"session_id": "busy-session", "logs": []})
+    data = response.get_json()
+    assert data["status"] is True
+    assert data["alert_author"] is False
+    assert data["deferred"] is True
+    mock_analyze.assert_not_called()
+
+
+@patch("coauthor_interface.backend.api_server.SameSentenceMergeAnalyzer")
+@patch("coauthor_interface.backend.api_server.convert_last_action_to_complete_action")
+@patch("coauthor_interface.backend.api_server.parse_level_3_actions")
+@patch("coauthor_interface.backend.api_server.check_for_level_3_actions")
+def test_parse_logs_skips_only_level_3_when_degraded(
+    mock_check_plugins,
+    mock_parse_level_3,
+    mock_convert_action,
+    mock_analyzer_class,
+    client,
+    monkeypatch,
+):
+    """POST /api/parse_logs still parses and records level 1 and 2 actions when the server is degraded."""
+    monkeypatch.setattr(srv.LOAD_MONITOR, "level", lambda: srv.DEGRADED)
+    srv.SESSIONS.clear()
+    srv.SESSIONS["degraded-session"] = {
+        "current_action_in_progress": None,
+        "parsed_actions": srv.ActionHistory(window_size=5),
+        "show_interventions": True,
+    }
+    mock_analyzer = MagicMock()
+    mock_analyzer.last_action = {"action_type": "insert_text"}
+    mock_analyzer.actions_lst = [{"action_type": "insert_text"} for _ in range(3)]
+    mock_analyzer_class.return_value = mock_analyzer
+
+    response = client.post("/api/parse_logs", json={"session_id": "degraded-session", "logs": [{"n": 0}]})
+    data = response.get_json()
+    assert data == {"status": True, "alert_author": False}
+
+    session = srv.SESSIONS["degraded-session"]
+    assert session["current_action_in_progress"] == {"action_type": "insert_text"}
+    assert session["parsed_actions"].count("insert_text", level="level_1_action_type") == 2
+    mock_parse_level_3.assert_not_called()
+    mock_check_plugins.assert_not_called()
+
+
+def test_get_metrics_reports_session_cache(client):
+    """GET /api/metrics returns counters, timings, and session cache statistics."""
+    srv.SESSIONS.clear()
+    srv.SESSIONS["metrics-session"] = {"verification_code": "x"}
+    srv.SESSIONS["metrics-session"]
+
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["sessions"]["resident"] == 1
+    assert data["sessions"]["spilled"] == 0
+    assert data["counters"]["session_cache_hits"] >= 1
+
+
+def test_query_updates_session_spilled_during_request(client, tmp_path, monkeypatch):
+    """Fields set by /api/query are not lost if the sweeper spills the session in between."""
+    session_id = "spilled-session"
+    srv.SESSIONS.clear()
+    srv.SESSIONS.configure(spill_dir=tmp_path, idle_timeout=0)
+    srv.SESSIONS[session_id] = {"current_action_in_progress": None, "show_interventions": False}
+    monkeypatch.setattr(srv, "DEV_MODE", True)
+    monkeypatch.setattr(srv, "blocklist", [], raising=False)
+    monkeypatch.setattr(srv, "verbose", False, raising=False)
+    monkeypatch.setattr(srv, "analyze_and_update_actions", lambda session_id, logs, level_3=True: [])
+    set_config(monkeypatch, examples={0: ""})
+    parse_prompt = srv.parse_prompt
+
+    def parse_prompt_and_spill(*args):
+        assert srv.SESSIONS.spill_idle_sessions() == [session_id]
+        return parse_prompt(*args)
+
+    monkeypatch.setattr(srv, "parse_prompt", parse_prompt_and_spill)
+    payload = {
+        "session_id": session_id,
+        "example": 0,
+        "doc": "",
+        "logs": [],
+        "n": 1,
+        "max_tokens": 5,
+        "temperature": 0.5,
+        "top_p": 0.9,
+        "presence_penalty": 0,
+        "frequency_penalty": 0,
+        "stop": [],
+        "engine": "gpt-3.5-turbo",
+        "suggestions": [],
+    }
+    try:
+        response = client.post("/api/query", json=payload)
+        assert response.get_json()["status"] == srv.SUCCESS
+
+        session = srv.SESSIONS[session_id]
+        assert session["last_query_timestamp"] > 0
+        assert session["cached_suggestions"]["results"]["status"] == srv.SUCCESS
+    finally:
+        srv.SESSIONS.clear()
+        srv.SESSIONS.configure()
+
+
+@patch("coauthor_interface.backend.api_server.get_uuid")
+def test_new_session_id_matches_worker_shard(mock_get_uuid, monkeypatch):
+    candidates = [f"{i:032x}" for i in range(50)]
+    mock_get_uuid.side_effect = candidates
+    monkeypatch.setattr(srv, "session_shard", (2, 3))
+
+    session_id = srv.new_session_id()
+
+    assert srv.shard_for_session(session_id, 3) == 2
+    assert session_id == next(c for c in candidates if srv.shard_for_session(c, 3) == 2)
+
+
+def test_healthz_live(client):
+    response = client.get("/healthz/live")
+    assert response.status_code == 200
+    assert response.get_json()["status"] is True
+
+
+def test_healthz_ready(client, monkeypatch):
+    monkeypatch.setattr(srv, "ready", False)
+    assert client.get("/healthz/ready").status_code == 503
+
+    monkeypatch.setattr(srv, "ready", True)
+    assert client.get("/healthz/ready").status_code == 200
+
+    monkeypatch.setattr(srv.LOAD_MONITOR, "level", lambda: srv.SHEDDING)
+    assert client.get("/healthz/ready").status_code == 503
+
+
+@patch("coauthor_interface.backend.api_server.SameSentenceMergeAnalyzer")
+@patch("coauthor_interface.backend.api_server.convert_last_action_to_complete_action")
+@patch("coauthor_interface.backend.api_server.parse_level_3_actions")
+@patch("coauthor_interface.backend.api_server.check_for_level_3_actions")
+def test_parse_logs_keeps_bounded_action_window(
+    mock_check_plugins,
+    mock_parse_level_3,
+    mock_convert_action,
+    mock_analyzer_class,
+    client,
+):
+    """Parsed actions are kept in a bounded window while aggregates cover the whole session."""
+    session_id = "window-session"
+
+    srv.SESSIONS.clear()
+    srv.SESSIONS[session_id] = {
+        "current_action_in_progress": None,
+        "parsed_actions": srv.ActionHistory(window_size=2),
+        "show_interventions": False,
+    }
+
+    mock_analyzer = MagicMock()
+    mock_analyzer.last_action = None
+    mock_analyzer.actions_lst = []
+    mock_analyzer_class.return_value = mock_analyzer
+    mock_check_plugins.return_value = []
+
+    new_actions = [{"level_1_action_type": "insert_text"} for _ in range(5)]
+    mock_parse_level_3.return_value = {"current_session": new_actions}
+
+    payload = {"session_id": session_id, "logs": [{"event": "test"}]}
+    response = client.post("/api/parse_logs", json=payload)
+    assert response.get_json()["status"] is True
+
+    history = srv.SESSIONS[session_id]["parsed_actions"]
+    assert len(history) == 2
+    assert history.total_count == 4  # The last action is still in progress
+    assert history.count("insert_text", level="level_1_action_type") == 4
+
+
+@patch("coauthor_interface.backend.api_server.SameSentenceMergeAnalyzer")
+@patch("coauthor_interface.backend.api_server.convert_last_action_to_complete_action")
+@patch("coauthor_interface.backend.api_server.parse_level_3_actions")
+@patch("coauthor_interface.backend.api_server.check_for_level_3_actions")
+def test_parse_logs_stateless_session_token(
+    mock_check_plugins,
+    mock_parse_level_3,
+    mock_convert_action,
+    mock_analyzer_class,
+    client,
+    monkeypatch,
+):
+    """In stateless mode, the session state travels in the token instead of SESSIONS."""
+    session_id = "stateless-session"
+    codec = srv.SessionTokenCodec("secret")
+    monkeypatch.setattr(srv, "session_tokens", codec)
+    srv.SESSIONS.clear()
+
+    session = {
+        "session_id": session_id,
+        "current_action_in_progress": None,
+        "parsed_actions": srv.ActionHistory(),
+        "show_interventions": False,
+    }
+    token = srv.encode_session(codec, session)
+
+    mock_analyzer = MagicMock()
+    mock_analyzer.last_action = None
+    mock_analyzer.actions_lst = []
+    mock_analyzer_class.return_value = mock_analyzer
+    mock_check_plugins.return_value = []
+    mock_parse_level_3.return_value = {"current_session": [{"level_1_action_type": "insert_text"}] * 3}
+
+    payload = {"session_id": session_id, "session_token": token, "logs": [{"event": "test"}]}
+    data = client.post("/api/parse_logs", json=payload).get_json()
+
+    assert data["status"] is True
+    assert session_id not in srv.SESSIONS
+    state = codec.decode(data["session_token"])
+    assert state["parsed_actions"]["total_count"] == 2
+
+    # A token for another session is rejected
+    payload["session_id"] = "other-session"
+    assert client.post("/api/parse_logs", json=payload).get_json()["status"] is False
+
+
 @patch("coauthor_interface.backend.api_server.save_log_to_jsonl")
 @patch("coauthor_interface.backend.api_server.print_verbose")
 @patch("coauthor_interface.backend.api_server.print_current_sessions")
-@patch("coauthor_interface.backend.api_server.gc.collect")
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
 def test_end_session_keep_session(
     mock_gc,
     mock_print_current_sessions,
@@ -761,7 +1073,7 @@ def test_end_session_keep_session(
 @patch("coauthor_interface.backend.api_server.save_log_to_jsonl")
 @patch("coauthor_interface.backend.api_server.print_verbose")
 @patch("coauthor_interface.backend.api_server.print_current_sessions")
-@patch("coauthor_interface.backend.api_server.gc.collect")
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
 def test_end_session_remove_session(
     mock_gc,
     mock_print_current_sessions,
@@ -801,7 +1113,7 @@ def test_end_session_remove_session(
 @patch("coauthor_interface.backend.api_server.save_log_to_jsonl")
 @patch("coauthor_interface.backend.api_server.print_verbose")
 @patch("coauthor_interface.backend.api_server.print_current_sessions")
-@patch("coauthor_interface.backend.api_server.gc.collect")
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
 def test_end_session_default_behavior(
     mock_gc,
     mock_print_current_sessions,
@@ -836,3 +1148,344 @@ def test_end_session_default_behavior(
 
     # Verify that the session is removed from SESSIONS (default behavior)
     assert session_id not in srv.SESSIONS
+
+
+def test_json_provider_uses_codec():
+    """Request and response bodies go through json_codec; indented output falls back to Flask."""
+    # api_server may have been reloaded by an earlier test
+    assert isinstance(srv.app.json, srv.CodecJSONProvider)
+    body = srv.app.json.dumps({"b": 1, "a": [1, "é"]})
+    assert srv.app.json.loads(body) == {"a": [1, "é"], "b": 1}
+    assert srv.app.json.loads(body.encode("utf-8")) == {"a": [1, "é"], "b": 1}
+    assert "\n" in srv.app.json.dumps({"a": 1}, indent=2)
+
+
+@patch("coauthor_interface.backend.api_server.LOG_PATH_INDEX")
+@patch("coauthor_interface.backend.api_server.get_config_for_log")
+def test_get_log_page_and_stream(mock_get_config, mock_log_index, client, fs):
+    """get_log with offset/limit returns one page; stream_log sends the same events as NDJSON."""
+    fs.create_dir("/logs")
+    logs = [{"eventName": "text-insert", "n": i} for i in range(20)]
+    srv.save_log_to_jsonl("/logs/paged.jsonl", logs)
+    mock_log_index.get.side_effect = lambda sid: "/logs/paged.jsonl" if sid == "paged" else None
+    mock_get_config.return_value = {"k": "v"}
+    srv.verbose = False
+
+    data = client.post("/api/get_log", json={"sessionId": "paged", "offset": 5, "limit": 3}).get_json()
+    assert data["status"] is True
+    assert data["logs"] == logs[5:8]
+    assert data["total"] == 20
+    assert data["stats"] is None
+    assert data["config"] == {"k": "v"}
+
+    response = client.post("/api/stream_log", json={"sessionId": "paged", "offset": 18})
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line) for line in response.get_data().splitlines()] == logs[18:]
+
+    response = client.post("/api/stream_log", json={"sessionId": "unknown"})
+    assert response.status_code == 404
+    data = client.post("/api/get_log", json={"sessionId": "paged", "offset": -1}).get_json()
+    assert data["status"] is False
+
+
+@patch("coauthor_interface.backend.api_server.LOG_PATH_INDEX")
+def test_seek_log(mock_log_index, client, fs):
+    """seek_log returns the document after an event, rebuilt from the document snapshots."""
+    fs.create_dir("/logs")
+    logs = [{"eventName": "system-initialize", "eventSource": "api", "eventTimestamp": 0, "currentDoc": "Hi"}]
+    logs += [
+        {
+            "eventName": "text-insert",
+            "eventSource": "user",
+            "eventTimestamp": i,
+            "textDelta": {"ops": [{"insert": "a"}]},
+        }
+        for i in range(1, 250)
+    ]
+    srv.save_log_to_jsonl("/logs/seek.jsonl", logs)
+    mock_log_index.get.side_effect = lambda sid: "/logs/seek.jsonl" if sid == "seek" else None
+
+    data = client.post("/api/seek_log", json={"sessionId": "seek", "event": 120}).get_json()
+    assert data["status"] is True
+    assert data["text"] == "a" * 120 + "Hi"
+    assert data["mask"] == "U" * 120 + "PP"
+    assert srv.LOG_SNAPSHOTS.seek("/logs/seek.jsonl", timestamp=120)["text"] == data["text"]
+
+    data = client.post("/api/seek_log", json={"sessionId": "unknown", "event": 1}).get_json()
+    assert data["status"] is False
+
+
+@patch("coauthor_interface.backend.api_server.print_current_sessions")
+@patch("coauthor_interface.backend.api_server.get_config_for_log")
+def test_end_session_writes_summary_for_get_log(mock_get_config, mock_print_current_sessions, client, fs):
+    """end_session writes a summary sidecar, which get_log reads instead of replaying the log."""
+    fs.create_dir("/logs/demo")
+    srv.proj_dir = "/logs/demo"
+    srv.log_compression = "none"
+    srv.verbose = False
+    srv.SESSIONS.clear()
+    srv.SESSIONS["summarized"] = {"verification_code": "code"}
+    mock_get_config.return_value = {"k": "v"}
+    logs = [
+        {"eventName": "system-initialize", "eventSource": "api", "eventTimestamp": 0, "currentDoc": "Hi"},
+        {
+            "eventName": "text-insert",
+            "eventSource": "user",
+            "eventTimestamp": 2000,
+            "textDelta": {"ops": [{"insert": "a"}]},
+        },
+    ]
+
+    response = client.post("/api/end_session", json={"sessionId": "summarized", "logs": logs})
+    assert response.get_json()["status"] is True
+    assert read_summary("/logs/demo/summarized.jsonl")["duration"] == 2.0
+
+    with (
+        patch("coauthor_interface.backend.api_server.LOG_PATH_INDEX") as mock_log_index,
+        patch("coauthor_interface.backend.api_server.compute_stats") as mock_stats,
+    ):
+        mock_log_index.get.return_value = "/logs/demo/summarized.jsonl"
+        data = client.post("/api/get_log", json={"sessionId": "summarized"}).get_json()
+    mock_stats.assert_not_called()
+    assert data["logs"] == logs
+    assert data["stats"] == {"eventCounter": {"system-initialize": 1, "text-insert": 1}}
+    assert data["last_text"] == "aHi"
+    assert data["config"] == {"k": "v"}
+
+
+@patch("coauthor_interface.backend.api_server.print_current_sessions")
+def test_end_session_write_behind(mock_print_current_sessions, client, tmp_path, monkeypatch):
+    """With the write-behind thread running, end_session queues the log and acknowledges durability."""
+    srv.proj_dir = str(tmp_path)
+    srv.log_compression = "none"
+    srv.verbose = False
+    srv.SESSIONS.clear()
+    srv.SESSIONS["behind"] = {"verification_code": "code"}
+    monkeypatch.setattr(srv, "LOG_PATH_INDEX", MagicMock())
+    monkeypatch.setattr(srv, "write_ack_timeout", 5.0)
+    logs = [{"eventName": "text-insert", "n": i} for i in range(3)]
+
+    srv.WRITE_BEHIND.start()
+    try:
+        data = client.post("/api/end_session", json={"sessionId": "behind", "logs": logs}).get_json()
+    finally:
+        srv.WRITE_BEHIND.stop()
+
+    assert data["status"] is True
+    assert data["durable"] is True
+    assert srv.read_log(str(tmp_path / "behind.jsonl")) == logs
+
+
+@patch("coauthor_interface.backend.api_server.print_current_sessions")
+@patch("coauthor_interface.backend.api_server.get_config_for_log")
+def test_end_session_streams_large_bodies(
+    mock_get_config, mock_print_current_sessions, client, fs, monkeypatch
+):
+    """Bodies of at least stream_ingest_min_bytes are streamed to the log file; checkpoints still work."""
+    fs.create_dir("/logs/demo")
+    srv.proj_dir = "/logs/demo"
+    srv.log_compression = "none"
+    srv.verbose = False
+    srv.SESSIONS.clear()
+    srv.SESSIONS["streamed"] = {"verification_code": "code"}
+    mock_get_config.return_value = {"k": "v"}
+    monkeypatch.setattr(srv, "stream_ingest_min_bytes", 1)
+    monkeypatch.setattr(srv, "LOG_PATH_INDEX", MagicMock())
+    logs = [{"eventName": "text-insert", "eventTimestamp": i * 1000, "n": i} for i in range(5)]
+
+    body = {"sessionId": "streamed", "logs": logs, "remove_session": False}
+    data = client.post("/api/end_session", json=body).get_json()
+    assert data["status"] is True
+    assert data["path"] == "/logs/demo/streamed.jsonl"
+    assert data["verification_code"] == "code"
+    assert srv.read_log("/logs/demo/streamed.jsonl") == logs
+    summary = read_summary("/logs/demo/streamed.jsonl", n_events=5)
+    assert summary["duration"] == 4.0
+    assert summary["config"] == {"k": "v"}
+    assert sorted(fs.listdir("/logs/demo")) == ["streamed.jsonl", "streamed.summary.json"]
+
+    body = {"sessionId": "streamed", "seq": 0, "events": logs}
+    data = client.post("/api/end_session", json=body).get_json()
+    assert data["status"] is True
+    assert data["persisted"] == 5
+
+    response = client.post(
+        "/api/end_session", data='{"sessionId": "streamed", "logs": [', content_type="application/json"
+    )
+    assert response.status_code == 400
+
+
+@patch("coauthor_interface.backend.api_server.print_current_sessions")
+def test_end_session_sharded_layout(mock_print_current_sessions, client, fs, monkeypatch):
+    """Logs are saved in shard directories; sessions with a flat log keep using it."""
+    fs.create_dir("/logs/demo")
+    srv.proj_dir = "/logs/demo"
+    srv.log_compression = "none"
+    srv.verbose = False
+    srv.SESSIONS.clear()
+    srv.SESSIONS["abcd1234"] = {"verification_code": "code"}
+    srv.SESSIONS["ef001234"] = {"verification_code": "code"}
+    monkeypatch.setattr(srv, "log_shard_depth", 2)
+    monkeypatch.setattr(srv, "LOG_PATH_INDEX", MagicMock())
+    logs = [{"eventName": "text-insert", "n": i} for i in range(3)]
+
+    data = client.post("/api/end_session", json={"sessionId": "abcd1234", "logs": logs}).get_json()
+    assert data["status"] is True
+    assert data["path"] == "/logs/demo/ab/cd/abcd1234.jsonl"
+    assert srv.read_log("/logs/demo/ab/cd/abcd1234.jsonl") == logs
+    srv.LOG_PATH_INDEX.record.assert_called_with("/logs/demo/ab/cd/abcd1234.jsonl")
+
+    # A session checkpointed before the layout changed
+    fs.create_file("/logs/demo/ef001234.jsonl", contents='{"n": 0}\n')
+    data = client.post("/api/checkpoint_log", json={"sessionId": "ef001234", "seq": 1, "events": [{"n": 1}]})
+    assert data.get_json()["persisted"] == 2
+    assert srv.read_log("/logs/demo/ef001234.jsonl") == [{"n": 0}, {"n": 1}]
+    assert not fs.exists("/logs/demo/ef")
+
+
+@patch("coauthor_interface.backend.api_server.print_current_sessions")
+def test_end_session_flat_layout_by_default(mock_print_current_sessions, client, fs, monkeypatch):
+    """Without --log_shard_depth, logs are saved flat and the log index finds them."""
+    args = srv.build_arg_parser().parse_args(
+        ["--config_dir", "c", "--log_dir", "/logs", "--port", "1", "--proj_name", "demo"]
+    )
+    assert args.log_shard_depth == 0
+    fs.create_dir("/logs/demo")
+    srv.proj_dir = "/logs/demo"
+    srv.log_compression = "none"
+    srv.verbose = False
+    srv.SESSIONS.clear()
+    srv.SESSIONS["abcd1234"] = {"verification_code": "code"}
+    monkeypatch.setattr(srv, "log_shard_depth", args.log_shard_depth)
+    monkeypatch.setattr(srv, "LOG_PATH_INDEX", LogPathIndex("/logs", check_interval=0))
+    logs = [{"eventName": "text-insert", "n": i} for i in range(3)]
+
+    data = client.post("/api/end_session", json={"sessionId": "abcd1234", "logs": logs}).get_json()
+    assert data["path"] == "/logs/demo/abcd1234.jsonl"
+    assert not fs.exists("/logs/demo/ab")
+    assert srv.LOG_PATH_INDEX.get("abcd1234") == "/logs/demo/abcd1234.jsonl"
+    data = client.post("/api/get_log", json={"sessionId": "abcd1234", "offset": 0}).get_json()
+    assert data["logs"] == logs
+
+
+@patch("coauthor_interface.backend.api_server.print_current_sessions")
+def test_sqlite_log_storage(mock_print_current_sessions, client, tmp_path, monkeypatch):
+    """With --log_storage sqlite, logs are saved to and read from the database, without files."""
+    srv.proj_dir = str(tmp_path)
+    srv.verbose = False
+    srv.SESSIONS.clear()
+    srv.SESSIONS["db"] = {"verification_code": "code"}
+    storage = SQLiteLogStorage(str(tmp_path / "logs.db"), batch_size=4)
+    monkeypatch.setattr(srv, "log_storage", storage)
+    storage.record_session({"session_id": "db", "access_code": "code", "start_timestamp": 1.0})
+    logs = [
+        {
+            "eventName": "system-initialize",
+            "eventSource": "api",
+            "eventTimestamp": 0,
+            "textDelta": "",
+            "currentDoc": "Hi",
+        }
+    ]
+    logs += [
+        {
+            "eventName": "text-insert",
+            "eventSource": "user",
+            "eventTimestamp": i,
+            "textDelta": {"ops": [{"insert": "a"}]},
+        }
+        for i in range(1, 10)
+    ]
+
+    body = {"sessionId": "db", "logs": logs[:5], "remove_session": False}
+    data = client.post("/api/end_session", json=body).get_json()
+    assert data["status"] is True
+    assert data["path"] is None
+    assert data["persisted"] == 5
+
+    data = client.post(
+        "/api/checkpoint_log", json={"sessionId": "db", "seq": 5, "events": logs[5:]}
+    ).get_json()
+    assert data["persisted"] == 10
+
+    data = client.post("/api/get_log", json={"sessionId": "db"}).get_json()
+    assert data["logs"] == logs
+    assert data["last_text"] == "a" * 9 + "Hi"
+    assert data["config"]["access_code"] == "code"
+    data = client.post("/api/get_log", json={"sessionId": "db", "offset": 3, "limit": 2}).get_json()
+    assert (data["logs"], data["total"]) == (logs[3:5], 10)
+
+    response = client.post("/api/stream_log", json={"sessionId": "db", "offset": 8})
+    assert [json.loads(line) for line in response.get_data().splitlines()] == logs[8:]
+    assert client.post("/api/stream_log", json={"sessionId": "unknown"}).status_code == 404
+
+    data = client.post("/api/seek_log", json={"sessionId": "db", "event": 4}).get_json()
+    assert data["text"] == "aaaaHi"
+    assert not list(tmp_path.glob("*.jsonl"))
+
+
+def test_find_sessions(client, tmp_path, monkeypatch):
+    """Sessions are filtered by their metadata and event counts, and paginated."""
+    os.makedirs(tmp_path / "demo")
+    with open(tmp_path / "metadata.txt", "w") as f:
+        for i, engine in enumerate(["gpt", "gpt-4", "gpt"]):
+            session = {"session_id": f"s{i}", "engine": engine, "start_timestamp": 100.0 + i}
+            f.write(json.dumps(session) + "\n")
+    for i in range(3):
+        save_log_to_jsonl(str(tmp_path / "demo" / f"s{i}.jsonl"), [{"eventName": "text-insert"}] * (i + 1))
+    index = SessionQueryIndex(
+        str(tmp_path / "sessions.db"),
+        metadata_path=str(tmp_path / "metadata.txt"),
+        path_index=LogPathIndex(str(tmp_path), check_interval=0),
+        check_interval=0,
+    )
+    monkeypatch.setattr(srv, "SESSION_QUERY_INDEX", index)
+    monkeypatch.setattr(srv, "log_storage", None)
+
+    data = client.post("/api/find_sessions", json={"engine": "gpt", "limit": 1}).get_json()
+    assert data["status"] is True
+    assert [session["session_id"] for session in data["sessions"]] == ["s0"]
+    assert data["sessions"][0]["n_events"] == 1
+    assert data["total"] == 2
+
+    data = client.post("/api/find_sessions", json={"min_events": 2, "offset": 1}).get_json()
+    assert [session["session_id"] for session in data["sessions"]] == ["s2"]
+    assert data["total"] == 2
+
+    data = client.post("/api/find_sessions", json={"limit": -1}).get_json()
+    assert data["status"] is False
+    index.close()
+
+
+def test_export_sessions(client, tmp_path, monkeypatch):
+    """The matching sessions are streamed as one gzipped NDJSON file."""
+    os.makedirs(tmp_path / "demo")
+    with open(tmp_path / "metadata.txt", "w") as f:
+        for i, engine in enumerate(["gpt", "gpt-4", "gpt"]):
+            session = {"session_id": f"s{i}", "engine": engine, "start_timestamp": 100.0 + i}
+            f.write(json.dumps(session) + "\n")
+    for i in range(3):
+        save_log_to_jsonl(str(tmp_path / "demo" / f"s{i}.jsonl"), [{"eventName": "text-insert", "n": i}])
+    path_index = LogPathIndex(str(tmp_path), check_interval=0)
+    index = SessionQueryIndex(
+        str(tmp_path / "sessions.db"),
+        metadata_path=str(tmp_path / "metadata.txt"),
+        path_index=path_index,
+        check_interval=0,
+    )
+    monkeypatch.setattr(srv, "SESSION_QUERY_INDEX", index)
+    monkeypatch.setattr(srv, "log_storage", None)
+    monkeypatch.setattr(srv, "export_storage", FileLogStorage(str(tmp_path), "demo", path_index=path_index))
+
+    response = client.post("/api/export_sessions", json={"engine": "gpt"})
+    assert response.status_code == 200
+    assert response.mimetype == "application/gzip"
+    assert "sessions.ndjson.gz" in response.headers["Content-Disposition"]
+    sessions = [json.loads(line) for line in gzip.decompress(response.get_data()).splitlines()]
+    assert [session["session_id"] for session in sessions] == ["s0", "s2"]
+    assert sessions[1]["logs"] == [{"eventName": "text-insert", "n": 2}]
+
+    response = client.post("/api/export_sessions", json={"format": "zip"})
+    assert response.status_code == 400
+    assert response.get_json()["status"] is False
+    index.close()
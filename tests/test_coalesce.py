@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from coauthor_interface.backend.coalesce import RequestCoalescer
+from coauthor_interface.backend.metrics import Metrics
+
+
+def test_single_request_runs_once():
+    coalescer = RequestCoalescer("parse", metrics=Metrics())
+    assert coalescer.submit("s", [1, 2], len) == 2
+    assert coalescer.metrics.counters["parse_runs"] == 1
+    assert "parse_collapsed" not in coalescer.metrics.counters
+
+
+def test_requests_queued_behind_a_run_collapse_into_one_run_with_latest_value():
+    coalescer = RequestCoalescer("parse", metrics=Metrics())
+    started = threading.Event()
+    release = threading.Event()
+    seen_values = []
+
+    def analyze(value):
+        seen_values.append(value)
+        if value == "first":
+            started.set()
+            release.wait()
+        return f"result for {value}"
+
+    results = dict()
+
+    def submit(value):
+        results[value] = coalescer.submit("s", value, analyze)
+
+    first = threading.Thread(target=submit, args=("first",))
+    first.start()
+    started.wait()
+
+    queued = []
+    for value in ["second", "third", "fourth"]:
+        thread = threading.Thread(target=submit, args=(value,))
+        thread.start()
+        queued.append(thread)
+        # Wait until the request has joined the pending batch
+        while getattr(coalescer._states["s"].pending, "waiters", 0) < len(queued):
+            pass
+
+    release.set()
+    for thread in [first, *queued]:
+        thread.join()
+
+    assert seen_values == ["first", "fourth"]
+    assert results["first"] == "result for first"
+    assert results["second"] == results["third"] == results["fourth"] == "result for fourth"
+    assert coalescer.metrics.counters["parse_collapsed"] == 2
+    assert coalescer.metrics.counters["parse_runs"] == 2
+
+
+def test_different_keys_are_not_collapsed():
+    coalescer = RequestCoalescer("parse", metrics=Metrics())
+    assert coalescer.submit("a", "x", str.upper) == "X"
+    assert coalescer.submit("b", "y", str.upper) == "Y"
+    assert coalescer.metrics.counters["parse_runs"] == 2
+
+
+def test_errors_are_raised_to_waiters():
+    coalescer = RequestCoalescer("parse", metrics=Metrics())
+
+    def fail(value):
+        raise ValueError(value)
+
+    with pytest.raises(ValueError, match="boom"):
+        coalescer.submit("s", "boom", fail)
+    assert coalescer.submit("s", "ok", str.upper) == "OK"
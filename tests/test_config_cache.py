@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+from coauthor_interface.backend.config_cache import ConfigCache
+from coauthor_interface.backend.metrics import Metrics
+
+ACCESS_CODES = "access_code,example,prompt\ncode_a,example_1,prompt_1\n"
+PROMPTS = "0\tprompt_1\tOnce upon a time\n"
+
+
+@pytest.fixture
+def config_dir(fs):
+    fs.create_file("/config/examples/example_1.txt", contents="First example")
+    fs.create_file("/config/prompts.tsv", contents=PROMPTS)
+    fs.create_file("/config/access_codes.csv", contents=ACCESS_CODES)
+    return "/config"
+
+
+def touch(path, contents):
+    """Rewrite a file and move its modification time forward."""
+    stat = os.stat(path) if os.path.exists(path) else None
+    with open(path, "w") as f:
+        f.write(contents)
+    if stat is not None:
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_initial_load(config_dir):
+    cache = ConfigCache(config_dir, metrics=Metrics())
+    snapshot = cache.get()
+
+    assert snapshot.version == 1
+    assert snapshot.examples == {"na": "", "example_1": "First example "}
+    assert snapshot.prompts == {"na": "", "prompt_1": "Once upon a time"}
+    assert list(snapshot.access_codes) == ["code_a"]
+
+
+def test_unchanged_files_are_not_parsed_again(config_dir):
+    metrics = Metrics()
+    cache = ConfigCache(config_dir, check_interval=0, metrics=metrics)
+
+    first = cache.get()
+    second = cache.get()
+
+    assert second is first
+    assert metrics.snapshot()["counters"]["config_files_parsed"] == 3
+
+
+def test_only_changed_files_are_parsed(config_dir):
+    metrics = Metrics()
+    cache = ConfigCache(config_dir, check_interval=0, metrics=metrics)
+    first = cache.get()
+
+    touch("/config/examples/example_1.txt", "Edited example")
+    touch("/config/examples/example_2.txt", "Second example")
+    snapshot = cache.get()
+
+    assert snapshot.version == 2
+    assert snapshot.examples["example_1"] == "Edited example "
+    assert snapshot.examples["example_2"] == "Second example "
+    assert snapshot.prompts is first.prompts
+    assert metrics.snapshot()["counters"]["config_files_parsed"] == 5
+    assert first.examples["example_1"] == "First example "  # Old snapshots are never modified
+
+
+def test_removed_files_are_dropped(config_dir):
+    cache = ConfigCache(config_dir, check_interval=0, metrics=Metrics())
+    cache.get()
+
+    os.remove("/config/access_codes.csv")
+    touch("/config/pilot_access_codes.csv", "access_code,example,prompt\ncode_b,na,na\n")
+
+    assert list(cache.get().access_codes) == ["code_b"]
+
+
+def test_changes_are_checked_at_most_every_interval(config_dir):
+    cache = ConfigCache(config_dir, check_interval=3600, metrics=Metrics())
+    first = cache.get()
+
+    touch("/config/examples/example_1.txt", "Edited example")
+
+    assert cache.get() is first
+    assert cache.get(check=False) is first
+    assert cache.refresh().examples["example_1"] == "Edited example "
+
+
+def test_failed_reload_keeps_previous_snapshot(config_dir):
+    metrics = Metrics()
+    cache = ConfigCache(config_dir, check_interval=0, metrics=metrics)
+    first = cache.get()
+
+    os.remove("/config/prompts.tsv")
+
+    assert cache.get() is first
+    assert metrics.snapshot()["counters"]["config_reload_errors"] == 1
+
+
+def test_missing_config_fails_on_first_load(fs):
+    fs.create_dir("/config")
+    cache = ConfigCache("/config", metrics=Metrics())
+
+    with pytest.raises(FileNotFoundError):
+        cache.get()
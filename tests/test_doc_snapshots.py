@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+from coauthor_interface import json_codec
+from coauthor_interface.backend.doc_snapshots import DocumentSnapshots, get_snapshot_path
+from coauthor_interface.backend.helper import get_last_text_from_log, get_text_and_mask, save_log_to_jsonl
+from coauthor_interface.backend.metrics import Metrics
+
+
+def make_log(n_events, start_timestamp=1000):
+    log = [
+        {
+            "eventName": "session-start",
+            "eventSource": "user",
+            "eventTimestamp": start_timestamp,
+            "textDelta": "",
+        },
+        {
+            "eventName": "system-initialize",
+            "eventSource": "api",
+            "eventTimestamp": start_timestamp + 1,
+            "textDelta": "",
+            "currentDoc": "Once upon a time ",
+        },
+    ]
+    length = len("Once upon a time")
+    for i in range(n_events):
+        if i % 7 == 6:
+            ops = [{"retain": length - 2}, {"delete": 1}]
+            length -= 1
+        else:
+            ops = [{"retain": length}, {"insert": "ab"[i % 2]}]
+            length += 1
+        source = "api" if i % 5 == 0 else "user"
+        log.append(
+            {
+                "eventName": "text-insert",
+                "eventSource": source,
+                "eventTimestamp": start_timestamp + 10 * (i + 1),
+                "textDelta": {"ops": ops},
+            }
+        )
+    return log
+
+
+def get_document(log, event):
+    """The document after the event at index `event`, from the start of the log."""
+    return get_text_and_mask(log[1:], event, remove_prompt=False)
+
+
+@pytest.fixture
+def snapshots():
+    return DocumentSnapshots(interval=10, metrics=Metrics())
+
+
+@pytest.fixture
+def log_path(fs):
+    fs.create_dir("/logs")
+    save_log_to_jsonl("/logs/s.jsonl", make_log(95))
+    return "/logs/s.jsonl"
+
+
+def test_seek_event(snapshots, log_path):
+    log = make_log(95)
+    snapshots.update(log_path)
+
+    for event in (1, 2, 10, 11, 12, 50, 96):
+        document = snapshots.seek(log_path, event=event)
+        assert (document["text"], document["mask"]) == get_document(log, event)
+        assert document["event"] == event
+    assert snapshots.seek(log_path, event=len(log) - 1)["text"] == get_last_text_from_log(log)
+    assert snapshots.seek(log_path, event=1000)["event"] == len(log) - 1
+
+
+def test_seek_timestamp(snapshots, log_path):
+    log = make_log(95)
+    snapshots.update(log_path)
+
+    document = snapshots.seek(log_path, timestamp=1000 + 10 * 40 + 5)
+    assert document["event"] == 41
+    assert document["timestamp"] == 1400
+    assert (document["text"], document["mask"]) == get_document(log, 41)
+    assert snapshots.seek(log_path, timestamp=0)["text"] == "Once upon a time"
+
+
+def test_snapshots_are_appended_as_the_log_grows(snapshots, log_path):
+    snapshots.update(log_path)
+    with open(get_snapshot_path(log_path)) as f:
+        n_snapshots = len(f.readlines())
+
+    log = make_log(120)
+    with open(log_path, "a") as f:
+        f.write("".join(json_codec.dumps(event) + "\n" for event in log[97:]))
+    snapshots.update(log_path)
+
+    with open(get_snapshot_path(log_path)) as f:
+        assert len(f.readlines()) == n_snapshots + 3  # Events 101, 111 and 121
+    assert snapshots.metrics.snapshot()["counters"]["snapshot_rebuilds"] == 1
+    assert snapshots.seek(log_path, event=len(log) - 1)["text"] == get_last_text_from_log(log)
+
+
+def test_replaced_log_rebuilds_snapshots(snapshots, log_path):
+    snapshots.update(log_path)
+
+    log = make_log(60, start_timestamp=5000)
+    save_log_to_jsonl(log_path, log)
+
+    # Seeking replays the replaced log without the stale sidecar; saving it rebuilds the sidecar
+    assert snapshots.seek(log_path, event=len(log) - 1)["text"] == get_last_text_from_log(log)
+    assert snapshots.metrics.snapshot()["counters"]["snapshot_replays"] == 1
+    assert snapshots.metrics.snapshot()["counters"]["snapshot_rebuilds"] == 1
+    snapshots.update(log_path)
+    assert snapshots.metrics.snapshot()["counters"]["snapshot_rebuilds"] == 2
+    assert snapshots.seek(log_path, event=len(log) - 1)["text"] == get_last_text_from_log(log)
+    assert snapshots.metrics.snapshot()["counters"]["snapshot_replays"] == 1
+
+
+def test_seek_does_not_write_sidecars(snapshots, log_path):
+    log = make_log(95)
+
+    document = snapshots.seek(log_path, event=50)
+    assert (document["text"], document["mask"]) == get_document(log, 50)
+    assert not os.path.exists(get_snapshot_path(log_path))
+    assert snapshots.metrics.snapshot()["counters"]["snapshot_replays"] == 1
+    assert snapshots.seek(log_path, event=50, replay=False) is None
+
+
+def test_in_memory_log_and_disabled_snapshots(fs):
+    fs.create_dir("/logs")
+    log = make_log(30)
+
+    document = DocumentSnapshots(interval=10).seek("/logs/missing.jsonl", event=20, log=log)
+    assert (document["text"], document["mask"]) == get_document(log, 20)
+
+    assert DocumentSnapshots(interval=0).update("/logs/other.jsonl", log=log) is None
+    document = DocumentSnapshots(interval=0).seek("/logs/other.jsonl", event=20, log=log)
+    assert (document["text"], document["mask"]) == get_document(log, 20)
+    with pytest.raises(ValueError):
+        DocumentSnapshots().seek("/logs/missing.jsonl", log=log)
@@ -0,0 +1,98 @@
+import gc
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from coauthor_interface.backend.gc_policy import GCPolicy
+from coauthor_interface.backend.metrics import Metrics
+
+
+@pytest.fixture
+def policy():
+    policy = GCPolicy(metrics=Metrics())
+    yield policy
+    policy.uninstall()
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        GCPolicy(mode="sometimes", metrics=Metrics())
+
+
+def test_pauses_are_recorded(policy):
+    policy.install()
+    gc.collect(generation=2)
+    gc.collect(generation=0)
+    policy.flush_metrics()
+
+    timings = policy.metrics.snapshot()["timings"]
+    assert timings["gc_pause_seconds"]["count"] >= 2
+    assert timings["gc_pause_seconds_gen2"]["count"] >= 1
+    assert timings["gc_pause_seconds_gen0"]["count"] >= 1
+
+
+def test_uninstall_stops_recording(policy):
+    policy.install()
+    policy.uninstall()
+    gc.collect()
+    policy.flush_metrics()
+
+    assert "gc_pause_seconds" not in policy.metrics.snapshot()["timings"]
+
+
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
+def test_no_forced_collection_by_default(mock_collect, policy):
+    policy.collect_after_request()
+
+    mock_collect.assert_not_called()
+
+
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
+def test_forced_collection(mock_collect, policy):
+    policy.configure(mode="forced")
+    policy.collect_after_request()
+
+    mock_collect.assert_called_once_with(generation=2)
+    assert policy.metrics.snapshot()["counters"]["gc_forced_collections"] == 1
+
+
+def test_thresholds_are_applied(policy):
+    original = gc.get_threshold()
+    try:
+        policy.configure(thresholds=(50000, 20, 30))
+        policy.install()
+        assert gc.get_threshold() == (50000, 20, 30)
+    finally:
+        gc.set_threshold(*original)
+
+
+@patch("coauthor_interface.backend.gc_policy.gc.freeze")
+def test_freeze_after_warmup_only_if_enabled(mock_freeze, policy):
+    policy.after_warmup()
+    mock_freeze.assert_not_called()
+
+    policy.configure(freeze=True)
+    policy.after_warmup()
+    mock_freeze.assert_called_once()
+
+
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
+def test_scheduled_collection_runs_in_background(mock_collect, policy):
+    collected = threading.Event()
+    mock_collect.side_effect = lambda generation: collected.set()
+
+    policy.configure(mode="scheduled", interval=0.01)
+    policy.start()
+    assert collected.wait(timeout=5)
+    policy.stop()
+
+    mock_collect.assert_called_with(generation=2)
+    assert policy.metrics.snapshot()["counters"]["gc_scheduled_collections"] >= 1
+
+
+@patch("coauthor_interface.backend.gc_policy.gc.collect")
+def test_start_does_nothing_unless_scheduled(mock_collect, policy):
+    policy.start()
+
+    assert policy._thread is None
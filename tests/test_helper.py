@@ -2,9 +2,10 @@ import json
 import os
 import time
 from pathlib import Path
-from unittest.mock import patch
 import pytest
 
+from coauthor_interface.backend.action_history import ActionHistory
+from coauthor_interface.backend.metadata_index import MetadataIndex
 from coauthor_interface.backend.helper import (
     append_session_to_file,
     apply_ops,
@@ -16,6 +17,7 @@ from coauthor_interface.backend.helper import (
     retrieve_log_paths,
     save_log_to_json,
     save_log_to_jsonl,
+    shard_for_session,
     check_for_level_3_actions,
 )
 from coauthor_interface.thought_toolkit.PluginInterface import (
@@ -70,6 +72,17 @@ def test_append_session_to_file(fs):
     assert json.loads(content) == session
 
 
+def test_append_session_to_file_with_action_history(fs):
+    path = Path("/logs/history.jsonl")
+    fs.create_file(path)
+    history = ActionHistory(window_size=2)
+    history.extend([{"level_1_action_type": "insert_text"}])
+    session = {"id": "abc", "parsed_actions": history}
+    append_session_to_file(session, path)
+    content = path.read_text().strip()
+    assert json.loads(content) == {"id": "abc", "parsed_actions": [{"level_1_action_type": "insert_text"}]}
+
+
 def test_save_log_to_json(fs):
     path = Path("/logs/log.json")
     fs.create_file(path)
@@ -137,20 +150,14 @@ def test_get_text_and_mask_keep_prompt():
 
 def test_get_config_for_log(fs):
     session_id = "session123"
-    metadata = {session_id: {"config": "abc"}}
-    metadata_path = Path("/logs/meta.json")
+    metadata_path = Path("/logs/metadata.txt")
     metadata_path.parent.mkdir(parents=True, exist_ok=True)
-    metadata_path.write_text(json.dumps(metadata))
-
-    def mock_update_metadata(metadata, path):
-        return json.loads(path.read_text())
+    metadata_path.write_text(json.dumps({"session_id": session_id, "config": "abc"}) + "\n")
+    metadata_index = MetadataIndex(str(metadata_path))
 
-    with patch(
-        "coauthor_interface.backend.helper.update_metadata",
-        side_effect=mock_update_metadata,
-    ):
-        config = get_config_for_log(session_id, {}, metadata_path)
-        assert config["config"] == "abc"
+    config = get_config_for_log(session_id, metadata_index)
+    assert config["config"] == "abc"
+    assert get_config_for_log("unknown", metadata_index) == ""
 
 
 @pytest.fixture
@@ -238,3 +245,12 @@ def test_check_for_level_3_actions_when_no_plugins_meet_threshold(mock_plugins):
     ]
     result = check_for_level_3_actions(actions, mock_plugins, n_actions=3, pattern_count_threshold=2)
     assert len(result) == 0
+
+
+def test_shard_for_session_is_stable_and_spread():
+    session_ids = [f"{i:032x}" for i in range(400)]
+    shards = [shard_for_session(session_id, 4) for session_id in session_ids]
+
+    assert shards == [shard_for_session(session_id, 4) for session_id in session_ids]
+    assert set(shards) == {0, 1, 2, 3}
+    assert all(shards.count(shard) > 50 for shard in range(4))
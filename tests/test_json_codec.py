@@ -0,0 +1,65 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from coauthor_interface import json_codec
+from coauthor_interface.json_codec import get_codec, set_codec
+
+pytestmark = pytest.mark.parametrize(
+    "codec_name",
+    [
+        "stdlib",
+        pytest.param("orjson", marks=pytest.mark.skipif(json_codec.orjson is None, reason="no orjson")),
+    ],
+)
+
+EVENT = {"eventName": "text-insert", "textDelta": {"ops": [{"retain": 3}, {"insert": "é"}]}, "currentN": "5"}
+
+
+def test_roundtrip(codec_name):
+    codec = get_codec(codec_name)
+
+    data = codec.dumps([EVENT, None, 1.5])
+
+    assert codec.loads(data) == [EVENT, None, 1.5]
+    assert codec.loads(data.encode("utf-8")) == [EVENT, None, 1.5]
+    assert json.loads(data) == [EVENT, None, 1.5]
+
+
+def test_same_documents_as_stdlib(codec_name):
+    codec = get_codec(codec_name)
+
+    assert codec.loads(codec.dumps({1: "int key", "big": 2**70})) == {"1": "int key", "big": 2**70}
+    assert codec.dumps({"b": 1, "a": 2}, sort_keys=True).replace(" ", "") == '{"a":2,"b":1}'
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads("invalid json content")
+
+
+def test_default(codec_name):
+    codec = get_codec(codec_name)
+
+    def default(obj):
+        if isinstance(obj, set):
+            return sorted(obj)
+        raise TypeError
+
+    assert codec.loads(codec.dumps({"s": {2, 1}}, default=default)) == {"s": [1, 2]}
+    assert codec.loads(codec.dumps(datetime(2024, 1, 2), default=datetime.isoformat)) == "2024-01-02T00:00:00"
+
+
+def test_set_codec(codec_name, monkeypatch):
+    monkeypatch.setattr(json_codec, "_codec", json_codec._codec)
+
+    assert set_codec(codec_name).name == codec_name
+    assert json_codec.loads(json_codec.dumps(EVENT)) == EVENT
+
+
+def test_missing_orjson(codec_name, monkeypatch):
+    monkeypatch.setattr(json_codec, "orjson", None)
+
+    assert get_codec("auto").name == "stdlib"
+    with pytest.raises(RuntimeError, match="orjson"):
+        get_codec("orjson")
+    with pytest.raises(ValueError):
+        get_codec(codec_name + "-unknown")
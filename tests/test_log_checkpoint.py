@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+
+from coauthor_interface.backend.log_checkpoint import (
+    CheckpointGapError,
+    LogCheckpointer,
+    LogSealedError,
+    get_seal_path,
+)
+from coauthor_interface.backend.metrics import Metrics
+from coauthor_interface.backend.reader import read_log
+
+LOG_PATH = "/logs/demo/session.jsonl"
+
+
+@pytest.fixture
+def checkpointer(fs):
+    fs.create_dir("/logs/demo")
+    return LogCheckpointer(fsync_interval=60, metrics=Metrics())
+
+
+def events(start, stop):
+    return [{"eventName": "text-insert", "n": i} for i in range(start, stop)]
+
+
+def test_checkpoints_are_appended(checkpointer):
+    assert checkpointer.append(LOG_PATH, 0, events(0, 3)) == 3
+    assert checkpointer.append(LOG_PATH, 3, events(3, 5)) == 5
+
+    assert read_log(LOG_PATH) == events(0, 5)
+
+
+def test_overlapping_checkpoint_appends_only_new_events(checkpointer):
+    checkpointer.append(LOG_PATH, 0, events(0, 3))
+
+    # Retry of a checkpoint whose response was lost, with new events
+    assert checkpointer.append(LOG_PATH, 1, events(1, 4)) == 4
+    assert read_log(LOG_PATH) == events(0, 4)
+
+
+def test_gap_reports_persisted_count(checkpointer):
+    checkpointer.append(LOG_PATH, 0, events(0, 2))
+
+    with pytest.raises(CheckpointGapError) as e:
+        checkpointer.append(LOG_PATH, 5, events(5, 6))
+    assert e.value.persisted == 2
+    assert read_log(LOG_PATH) == events(0, 2)
+
+
+def test_seal(checkpointer):
+    checkpointer.append(LOG_PATH, 0, events(0, 2))
+    assert checkpointer.append(LOG_PATH, 2, events(2, 3), seal=True) == 3
+
+    with open(get_seal_path(LOG_PATH)) as f:
+        assert json.load(f)["n_events"] == 3
+    with pytest.raises(LogSealedError):
+        checkpointer.append(LOG_PATH, 3, events(3, 4))
+    assert read_log(LOG_PATH) == events(0, 3)
+
+
+def test_incomplete_last_event_is_truncated(checkpointer):
+    with open(LOG_PATH, "w") as f:
+        f.write(json.dumps(events(0, 1)[0]) + "\n" + '{"eventName": "te')
+
+    # A new process counts the complete events in the file
+    assert checkpointer.append(LOG_PATH, 1, events(1, 2)) == 2
+    assert read_log(LOG_PATH) == events(0, 2)
+
+
+def test_file_changed_by_another_writer_is_recounted(checkpointer):
+    checkpointer.append(LOG_PATH, 0, events(0, 2))
+    other = LogCheckpointer(fsync_interval=60, metrics=Metrics())
+    other.append(LOG_PATH, 2, events(2, 4))
+
+    assert checkpointer.append(LOG_PATH, 4, events(4, 5)) == 5
+    assert read_log(LOG_PATH) == events(0, 5)
+
+
+def test_fsyncs_are_batched(checkpointer, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, "fsync", synced.append)
+
+    checkpointer.append(LOG_PATH, 0, events(0, 1))
+    checkpointer.append(LOG_PATH, 1, events(1, 2))
+    assert synced == []
+
+    checkpointer.flush()
+    assert len(synced) == 1
+    assert checkpointer.metrics.snapshot()["counters"]["checkpoint_fsync_batches"] == 1
@@ -0,0 +1,71 @@
+import gzip
+import os
+
+import pytest
+
+from coauthor_interface.backend import log_compression
+from coauthor_interface.backend.helper import retrieve_log_paths, save_log_to_jsonl
+from coauthor_interface.backend.log_compression import (
+    check_compression,
+    compress_log_file,
+    get_compressed_path,
+    split_log_suffix,
+)
+from coauthor_interface.backend.log_index import LogPathIndex
+from coauthor_interface.backend.metrics import Metrics
+from coauthor_interface.backend.reader import read_log
+
+LOG = [{"eventName": "text-insert", "currentN": "5", "n": i} for i in range(100)]
+
+
+def test_split_log_suffix():
+    assert split_log_suffix("/logs/s.jsonl") == ("/logs/s", ".jsonl", "none")
+    assert split_log_suffix("/logs/s.jsonl.gz") == ("/logs/s", ".jsonl", "gzip")
+    assert split_log_suffix("/logs/s.json.zst") == ("/logs/s", ".json", "zstd")
+    assert split_log_suffix("/logs/s.txt.gz")[1] is None
+    assert get_compressed_path("/logs/s.jsonl", "gzip") == "/logs/s.jsonl.gz"
+    assert get_compressed_path("/logs/s.jsonl", "none") == "/logs/s.jsonl"
+
+
+def test_save_and_read_compressed_log(fs):
+    fs.create_dir("/logs")
+    save_log_to_jsonl("/logs/s.jsonl.gz", LOG)
+
+    with gzip.open("/logs/s.jsonl.gz", "rt") as f:
+        assert len(f.readlines()) == len(LOG)
+    assert read_log("/logs/s.jsonl.gz") == LOG
+
+
+def test_compress_log_file(fs):
+    fs.create_dir("/logs")
+    save_log_to_jsonl("/logs/s.jsonl", LOG)
+    os.utime("/logs/s.jsonl", (100, 100))
+    size = os.path.getsize("/logs/s.jsonl")
+
+    path = compress_log_file("/logs/s.jsonl", "gzip")
+
+    assert path == "/logs/s.jsonl.gz"
+    assert not os.path.exists("/logs/s.jsonl")
+    assert os.path.getsize(path) < size / 5
+    assert os.path.getmtime(path) == 100  # Keeps the order of the versions of a log
+    assert read_log(path) == LOG
+    assert compress_log_file(path, "gzip") == path  # Already compressed
+
+
+def test_compressed_logs_are_found(fs):
+    fs.create_dir("/logs/a")
+    save_log_to_jsonl("/logs/a/s1.jsonl.gz", LOG)
+    fs.create_file("/logs/a/s1.json", contents="[]")
+    fs.create_file("/logs/a/s2.json", contents="[]")
+
+    assert retrieve_log_paths("/logs") == {"s1": "/logs/a/s1.jsonl.gz", "s2": "/logs/a/s2.json"}
+    assert LogPathIndex("/logs", metrics=Metrics()).get("s1") == "/logs/a/s1.jsonl.gz"
+
+
+def test_zstd_requires_zstandard(monkeypatch):
+    monkeypatch.setattr(log_compression, "zstandard", None)
+
+    with pytest.raises(RuntimeError, match="zstandard"):
+        check_compression("zstd")
+    with pytest.raises(ValueError):
+        check_compression("lz4")
@@ -0,0 +1,109 @@
+import gzip
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+import coauthor_interface.backend.log_export as log_export
+from coauthor_interface.backend.log_export import SessionExporter, iter_sessions
+from coauthor_interface.backend.log_storage import FileLogStorage, SQLiteLogStorage
+from coauthor_interface.backend.metrics import Metrics
+
+
+def make_events(n_events):
+    return [{"eventName": "text-insert", "eventTimestamp": 1000 + i, "n": i} for i in range(n_events)]
+
+
+def count_events(events):
+    return [{"action_type": "insert", "n_events": len(events)}]
+
+
+@pytest.fixture(params=["sqlite", "files"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        storage = SQLiteLogStorage(str(tmp_path / "logs.db"), batch_size=4, metrics=Metrics())
+    else:
+        os.mkdir(tmp_path / "demo")
+        storage = FileLogStorage(str(tmp_path), "demo", metrics=Metrics())
+    for i in range(3):
+        storage.record_session({"session_id": f"s{i}", "engine": "gpt", "start_timestamp": 100.0 + i})
+        storage.save_log(f"s{i}", make_events(5 * i + 1))
+    storage.record_session({"session_id": "nolog", "engine": "gpt", "start_timestamp": 50.0})
+    yield storage
+    storage.close()
+
+
+def get_sessions(storage):
+    # Files are queried through the session index in the server; the records are the same
+    records = sorted(storage.records(), key=lambda record: record["start_timestamp"])
+    sessions = []
+    for record in records:
+        try:
+            n_events = storage.count(record["session_id"])
+        except KeyError:
+            n_events = None
+        sessions.append(dict(record, n_events=n_events))
+    return sessions
+
+
+def export(storage, **kwargs):
+    exporter = SessionExporter(storage, metrics=Metrics(), **kwargs)
+    return b"".join(exporter.iter_export(get_sessions(storage)))
+
+
+def test_export_ndjson(storage):
+    lines = gzip.decompress(export(storage)).decode("utf-8").splitlines()
+
+    sessions = [json.loads(line) for line in lines]
+    assert [session["session_id"] for session in sessions] == ["s0", "s1", "s2"]
+    for i, session in enumerate(sessions):
+        assert session["metadata"]["engine"] == "gpt"
+        assert session["logs"] == make_events(5 * i + 1)
+        assert session["n_events"] == 5 * i + 1
+        assert "actions" not in session
+
+
+def test_export_tar(storage):
+    data = export(storage, format="tar", compression="none")
+
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        assert tar.getnames() == ["logs/s0.jsonl", "logs/s1.jsonl", "logs/s2.jsonl", "metadata.jsonl"]
+        lines = tar.extractfile("logs/s2.jsonl").read().splitlines()
+        assert [json.loads(line) for line in lines] == make_events(11)
+        metadata = [json.loads(line) for line in tar.extractfile("metadata.jsonl").read().splitlines()]
+        assert [record["session_id"] for record in metadata] == ["s0", "s1", "s2"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_export_with_analysis(storage, monkeypatch, workers):
+    monkeypatch.setattr(log_export, "analyze_events", count_events)
+
+    lines = gzip.decompress(export(storage, analyze=True, workers=workers)).splitlines()
+    assert [json.loads(line)["actions"] for line in lines] == [
+        count_events(make_events(5 * i + 1)) for i in range(3)
+    ]
+
+    with tarfile.open(fileobj=io.BytesIO(export(storage, format="tar", analyze=True))) as tar:
+        assert json.load(tar.extractfile("actions/s1.json")) == count_events(make_events(6))
+
+
+def test_iter_sessions_pages(tmp_path):
+    storage = SQLiteLogStorage(str(tmp_path / "logs.db"), metrics=Metrics())
+    for i in range(7):
+        storage.record_session(
+            {"session_id": f"s{i}", "engine": "gpt" if i % 2 else "gpt-4", "start_timestamp": i}
+        )
+
+    assert [session["session_id"] for session in iter_sessions(storage, page_size=2)] == [
+        f"s{i}" for i in range(7)
+    ]
+    assert [session["session_id"] for session in iter_sessions(storage, page_size=2, engine="gpt")] == [
+        "s1",
+        "s3",
+        "s5",
+    ]
+    with pytest.raises(ValueError):
+        SessionExporter(storage, format="zip")
+    storage.close()
@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+from coauthor_interface.backend import log_index
+from coauthor_interface.backend.log_index import LogPathIndex
+from coauthor_interface.backend.metrics import Metrics
+
+
+@pytest.fixture
+def logs(fs, monkeypatch):
+    # Trust directory mtimes right away; the tests set them explicitly
+    monkeypatch.setattr(log_index, "RACY_WINDOW_NS", 0)
+    fs.create_file("/logs/a/s1.json")
+    fs.create_file("/logs/a/s1.jsonl")
+    fs.create_file("/logs/b/s2.json")
+    fs.create_file("/logs/b/s1.actions.jsonl")  # Sidecar, not a log
+    for directory in ("/logs", "/logs/a", "/logs/b"):
+        os.utime(directory, (100, 100))
+    return "/logs"
+
+
+def test_lookup_prefers_jsonl(logs):
+    index = LogPathIndex(logs, check_interval=0, metrics=Metrics())
+
+    assert index.get("s1") == "/logs/a/s1.jsonl"
+    assert index.get("s2") == "/logs/b/s2.json"
+    assert index.get("missing") is None
+    assert index.paths() == {"s1": "/logs/a/s1.jsonl", "s2": "/logs/b/s2.json"}
+
+
+def test_most_recent_log_wins(logs, fs):
+    fs.create_file("/logs/b/s1.jsonl")
+    os.utime("/logs/a/s1.jsonl", (200, 200))
+    os.utime("/logs/b/s1.jsonl", (300, 300))
+    os.utime("/logs/b", (300, 300))
+    index = LogPathIndex(logs, check_interval=0, metrics=Metrics())
+
+    assert index.get("s1") == "/logs/b/s1.jsonl"
+
+
+def test_only_changed_directories_are_listed(logs, fs):
+    metrics = Metrics()
+    index = LogPathIndex(logs, check_interval=0, metrics=metrics)
+    index.refresh()
+    assert metrics.snapshot()["counters"]["log_index_dirs_listed"] == 3
+
+    index.refresh()
+    assert metrics.snapshot()["counters"]["log_index_dirs_listed"] == 3
+
+    fs.create_file("/logs/b/s3.jsonl")
+    os.utime("/logs/b", (200, 200))
+    assert index.get("s3") == "/logs/b/s3.jsonl"
+    assert metrics.snapshot()["counters"]["log_index_dirs_listed"] == 4
+
+
+def test_refresh_checks_only_recorded_directories(logs, fs):
+    metrics = Metrics()
+    index = LogPathIndex(logs, check_interval=0, metrics=metrics)
+    index.refresh()  # The first refresh scans every directory
+    assert metrics.snapshot()["counters"]["log_index_scans"] == 1
+
+    # A plain log replaced by its compressed copy, recorded by the writer
+    fs.create_file("/logs/a/s1.jsonl.gz")
+    os.utime("/logs/a/s1.jsonl.gz", (50, 50))
+    os.remove("/logs/a/s1.jsonl")
+    os.utime("/logs/a", (200, 200))
+    index.record("/logs/a/s1.jsonl.gz")
+    # A log written by another process
+    fs.create_file("/logs/b/s3.jsonl")
+    os.utime("/logs/b", (200, 200))
+
+    assert index.get("s1") == "/logs/a/s1.jsonl.gz"
+    counters = metrics.snapshot()["counters"]
+    assert (counters["log_index_scans"], counters["log_index_dirs_listed"]) == (1, 4)
+
+    # Found by a scan after the miss
+    assert index.get("s3") == "/logs/b/s3.jsonl"
+    assert metrics.snapshot()["counters"]["log_index_scans"] == 2
+
+
+def test_removed_files_and_directories(logs, fs):
+    index = LogPathIndex(logs, check_interval=0, metrics=Metrics())
+    index.refresh()
+
+    os.remove("/logs/a/s1.jsonl")
+    os.utime("/logs/a", (200, 200))
+    assert index.get("s1") == "/logs/a/s1.json"
+
+    fs.remove_object("/logs/b")
+    os.utime("/logs", (200, 200))
+    assert index.get("s2") is None
+
+
+def test_record_written_log(logs, fs):
+    index = LogPathIndex(logs, check_interval=60, metrics=Metrics())
+    index.refresh()
+
+    # Written within the same mtime tick of the directory: only record() makes it visible
+    fs.create_file("/logs/a/s4.jsonl")
+    os.utime("/logs/a", (100, 100))
+    index.record("/logs/a/s4.jsonl")
+    index.record("/elsewhere/s5.jsonl")
+
+    assert index.get("s4") == "/logs/a/s4.jsonl"
+    assert index.get("s5") is None
+
+
+def test_record_log_in_new_shard_directory(logs, fs):
+    index = LogPathIndex(logs, check_interval=60, metrics=Metrics())
+    index.refresh()
+
+    fs.create_file("/logs/a/ab/cd/s6.jsonl")
+    index.record("/logs/a/ab/cd/s6.jsonl")
+
+    assert index.get("s6") == "/logs/a/ab/cd/s6.jsonl"
+    assert index.paths()["s6"] == "/logs/a/ab/cd/s6.jsonl"
+
+
+def test_index_is_saved_and_loaded(logs, fs):
+    fs.create_dir("/state")
+    metrics = Metrics()
+    index = LogPathIndex(logs, index_path="/state/log_paths.idx", check_interval=0, metrics=metrics)
+    index.refresh()
+    assert os.path.exists("/state/log_paths.idx")
+
+    fs.create_file("/logs/b/s3.jsonl")
+    os.utime("/logs/b", (200, 200))
+    restarted = LogPathIndex(logs, index_path="/state/log_paths.idx", check_interval=0, metrics=metrics)
+    assert restarted.get("s1") == "/logs/a/s1.jsonl"
+    assert restarted.get("s3") == "/logs/b/s3.jsonl"
+    # Only the directory that changed while the server was down is listed again
+    assert metrics.snapshot()["counters"]["log_index_dirs_listed"] == 4
+
+
+def test_corrupt_index_file_is_ignored(logs, fs):
+    fs.create_file("/logs/log_paths.idx", contents="{not json")
+
+    index = LogPathIndex(logs, index_path="/logs/log_paths.idx", check_interval=0, metrics=Metrics())
+
+    assert index.get("s2") == "/logs/b/s2.json"
@@ -0,0 +1,143 @@
+import io
+import json
+import tracemalloc
+
+import pytest
+
+from coauthor_interface.backend.doc_snapshots import DocumentSnapshots, get_snapshot_path
+from coauthor_interface.backend.helper import save_log_to_jsonl
+from coauthor_interface.backend.log_ingest import LogIngestor, StreamingParseError, parse_streaming_object
+from coauthor_interface.backend.log_summary import summarize_log
+from coauthor_interface.backend.metrics import Metrics
+from coauthor_interface.backend.reader import read_log
+
+
+def make_log(n_events, initialize=True):
+    log = [{"eventName": "session-start", "eventSource": "user", "eventTimestamp": 1000, "textDelta": ""}]
+    if initialize:
+        log.append(
+            {
+                "eventName": "system-initialize",
+                "eventSource": "api",
+                "eventTimestamp": 1001,
+                "textDelta": "",
+                "currentDoc": "Il était une fois ",
+            }
+        )
+    for i in range(n_events):
+        log.append(
+            {
+                "eventName": "text-insert",
+                "eventSource": "api" if i % 4 == 0 else "user",
+                "eventTimestamp": 1010 + 10 * i,
+                "textDelta": {"ops": [{"retain": 17 + i}, {"insert": "é"}]},
+                "currentDoc": "",
+                "currentN": 12345,
+            }
+        )
+    return log
+
+
+def ingest(log_dir, log, **kwargs):
+    ingestor = LogIngestor(log_dir, snapshot_interval=10, **kwargs)
+    for event in log:
+        ingestor.add(event)
+    return ingestor
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_parse_streaming_object(chunk_size):
+    log = make_log(30)
+    body = json.dumps({"sessionId": "s", "logs": log, "remove_session": False, "n": 1.5}).encode("utf-8")
+    events = []
+
+    content, n_events = parse_streaming_object(io.BytesIO(body), "logs", events.append, chunk_size=chunk_size)
+
+    assert content == {"sessionId": "s", "remove_session": False, "n": 1.5}
+    assert n_events == len(log)
+    assert events == log
+
+
+def test_parse_streaming_object_without_items():
+    content, n_events = parse_streaming_object(io.BytesIO(b' {"events": [1, 2], "seq": 10} '), "logs", None)
+    assert content == {"events": [1, 2], "seq": 10}
+    assert n_events is None
+
+    assert parse_streaming_object(io.BytesIO(b'{"logs": [ ]}'), "logs", None) == ({}, 0)
+    assert parse_streaming_object(io.BytesIO(b"{}"), "logs", None) == ({}, None)
+
+
+@pytest.mark.parametrize(
+    "body", [b'{"logs": [{"a": 1}, {"a":', b"[1, 2]", b'{"logs": [1 2]}', b'{"a" 1}', b""]
+)
+def test_parse_streaming_object_rejects_invalid_bodies(body):
+    with pytest.raises(StreamingParseError):
+        parse_streaming_object(io.BytesIO(body), "logs", lambda event: None, chunk_size=4)
+
+
+@pytest.mark.parametrize("initialize", [True, False])
+def test_ingested_log_matches_saved_log(fs, initialize):
+    fs.create_dir("/logs")
+    log = make_log(45, initialize=initialize)
+
+    ingestor = ingest("/logs", log)
+    ingestor.commit("/logs/s.jsonl")
+
+    assert read_log("/logs/s.jsonl") == log
+    assert ingestor.summarize({"k": "v"}) == summarize_log(log, config={"k": "v"})
+
+    # The snapshots are the ones DocumentSnapshots would make
+    if initialize:
+        with open(get_snapshot_path("/logs/s.jsonl")) as f:
+            snapshots = f.read()
+        save_log_to_jsonl("/logs/t.jsonl", log)
+        DocumentSnapshots(interval=10, metrics=Metrics()).update("/logs/t.jsonl")
+        with open(get_snapshot_path("/logs/t.jsonl")) as f:
+            assert snapshots == f.read()
+    else:
+        assert not fs.exists(get_snapshot_path("/logs/s.jsonl"))
+    assert not [name for name in fs.listdir("/logs") if name.startswith(".ingest-")]
+
+
+def test_compressed_and_discarded_logs(fs):
+    fs.create_dir("/logs")
+    log = make_log(5)
+
+    ingestor = ingest("/logs", log, compression="gzip")
+    assert ingestor.tmp_path.endswith(".jsonl.gz")
+    ingestor.commit("/logs/s.jsonl.gz")
+    assert read_log("/logs/s.jsonl.gz") == log
+
+    ingest("/logs", log).discard()
+    assert sorted(fs.listdir("/logs")) == ["s.jsonl.gz", "s.snapshots.jsonl"]
+
+    with pytest.raises(StreamingParseError):
+        LogIngestor("/logs").add([1, 2])
+
+
+class GeneratedBody(io.RawIOBase):
+    """A request body of n_events events, generated as it is read."""
+
+    def __init__(self, n_events):
+        event = json.dumps(make_log(1)[-1]).encode("utf-8")
+        self.parts = iter([b'{"sessionId": "s", "logs": [', *([event + b","] * (n_events - 1)), event, b"]}"])
+        self.size = len(event) * n_events
+
+    def read(self, size=-1):
+        return next(self.parts, b"")
+
+
+def test_memory_does_not_grow_with_the_log(tmp_path):
+    body = GeneratedBody(20000)
+    ingestor = LogIngestor(str(tmp_path), snapshot_interval=0)
+
+    tracemalloc.start()
+    try:
+        parse_streaming_object(body, "logs", ingestor.add)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    ingestor.close()
+
+    assert ingestor.n_events == 20000
+    assert peak < body.size / 10
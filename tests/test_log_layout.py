@@ -0,0 +1,81 @@
+import os
+
+from coauthor_interface.backend.helper import retrieve_log_paths
+from coauthor_interface.backend.log_layout import (
+    get_session_path,
+    get_shard_dirs,
+    migrate_to_sharded,
+)
+
+SESSION_ID = "abcdef0123456789abcdef0123456789"
+
+
+def test_get_shard_dirs():
+    assert get_shard_dirs(SESSION_ID) == ["ab", "cd"]
+    assert get_shard_dirs(SESSION_ID, depth=3) == ["ab", "cd", "ef"]
+    assert get_shard_dirs(SESSION_ID, depth=0) == []
+
+    # Other ids are sharded by their hash, so they cannot escape the project directory
+    shards = get_shard_dirs("../Session.1")
+    assert shards == get_shard_dirs("../Session.1")
+    assert all(len(shard) == 2 and shard.isalnum() for shard in shards)
+
+
+def test_get_session_path(fs):
+    fs.create_dir("/logs/demo")
+
+    # Logs are flat unless sharding is turned on
+    assert get_session_path("/logs/demo", SESSION_ID) == f"/logs/demo/{SESSION_ID}.jsonl"
+    assert not fs.exists("/logs/demo/ab")
+
+    path = get_session_path("/logs/demo", SESSION_ID, depth=2)
+    assert path == f"/logs/demo/ab/cd/{SESSION_ID}.jsonl"
+    assert fs.isdir("/logs/demo/ab/cd")
+    assert (
+        get_session_path("/logs/demo", SESSION_ID, ".actions.jsonl", depth=2)
+        == f"/logs/demo/ab/cd/{SESSION_ID}.actions.jsonl"
+    )
+
+    get_session_path("/logs/demo", "ffff", depth=2, create=False)
+    assert not fs.exists("/logs/demo/ff")
+
+
+def test_legacy_flat_logs_are_still_used(fs):
+    fs.create_file(f"/logs/demo/{SESSION_ID}.jsonl.gz")
+
+    assert get_session_path("/logs/demo", SESSION_ID, depth=2) == f"/logs/demo/{SESSION_ID}.jsonl"
+
+    # Once a sharded version exists, it is preferred
+    fs.create_file(f"/logs/demo/ab/cd/{SESSION_ID}.jsonl")
+    assert get_session_path("/logs/demo", SESSION_ID, depth=2) == f"/logs/demo/ab/cd/{SESSION_ID}.jsonl"
+
+
+def test_migrate_to_sharded(fs):
+    names = [f"{SESSION_ID}{suffix}" for suffix in (".jsonl", ".actions.jsonl", ".summary.json", ".seal")]
+    for name in [*names, "0000.json", ".ingest-x.jsonl"]:
+        fs.create_file(f"/logs/demo/{name}")
+    fs.create_file("/logs/demo/ff/ff/ffff.jsonl")
+    fs.create_file("/logs/demo/ffff.jsonl")
+
+    assert migrate_to_sharded("/logs/demo", dry_run=True) == {"moved": 5, "skipped": ["ffff.jsonl"]}
+    assert not fs.exists("/logs/demo/ab")
+
+    assert migrate_to_sharded("/logs/demo") == {"moved": 5, "skipped": ["ffff.jsonl"]}
+    assert sorted(os.listdir("/logs/demo/ab/cd")) == sorted(names)
+    assert os.listdir("/logs/demo/00/00") == ["0000.json"]
+    assert sorted(name for name in os.listdir("/logs/demo") if not fs.isdir(f"/logs/demo/{name}")) == [
+        ".ingest-x.jsonl",
+        "ffff.jsonl",
+    ]
+
+    assert migrate_to_sharded("/logs/demo") == {"moved": 0, "skipped": ["ffff.jsonl"]}
+
+
+def test_retrieve_log_paths_finds_both_layouts(fs):
+    fs.create_file("/logs/demo/s1.jsonl")
+    fs.create_file("/logs/demo/ab/cd/s2.jsonl")
+    fs.create_file("/logs/demo/ab/cd/s2.actions.jsonl")
+    fs.create_file("/logs/demo/ab/cd/s2.summary.json")
+    fs.create_file("/logs/demo/.ingest-x.jsonl")
+
+    assert retrieve_log_paths("/logs") == {"s1": "/logs/demo/s1.jsonl", "s2": "/logs/demo/ab/cd/s2.jsonl"}
@@ -0,0 +1,157 @@
+import json
+import os
+
+import pytest
+
+from coauthor_interface import json_codec
+from coauthor_interface.backend.helper import save_log_to_jsonl
+from coauthor_interface.backend.log_reader import LineOffsetIndex, LogReader, MappedLog, get_line_index_path
+from coauthor_interface.backend.metrics import Metrics
+
+LOG = [{"eventName": "text-insert", "n": i, "text": "é" * (i % 3)} for i in range(50)]
+
+
+@pytest.fixture
+def reader():
+    return LogReader(metrics=Metrics())
+
+
+@pytest.fixture
+def log_path(fs):
+    fs.create_dir("/logs")
+    save_log_to_jsonl("/logs/s.jsonl", LOG)
+    return "/logs/s.jsonl"
+
+
+def test_read_range(reader, log_path):
+    assert reader.read_range(log_path, 10, 5) == (LOG[10:15], 50)
+    assert reader.read_range(log_path, 45) == (LOG[45:], 50)
+    assert reader.read_range(log_path, 60, 5) == ([], 50)
+    assert reader.count(log_path) == 50
+
+
+def test_only_requested_bytes_are_read(reader, log_path):
+    reader.read_range(log_path, 10, 5)
+
+    expected = sum(len(json_codec.dumps(event).encode("utf-8")) + 1 for event in LOG[10:15])
+    assert reader.metrics.snapshot()["counters"]["log_bytes_read"] == expected
+
+
+def test_iter_lines_passes_through_raw_lines(reader, log_path):
+    data = b"".join(reader.iter_lines(log_path, 1, 2))
+
+    assert data == b"".join((json_codec.dumps(event) + "\n").encode("utf-8") for event in LOG[1:3])
+
+
+def test_appended_lines_are_indexed_incrementally(log_path):
+    index = LineOffsetIndex(log_path)
+    total = index.update()
+
+    with open(log_path, "a") as f:
+        f.write(json.dumps({"n": 50}) + "\n" + '{"n": 5')  # The last line is still being written
+    assert index.update() < total
+    assert len(index) == 51
+
+    with open(log_path, "a") as f:
+        f.write("1}\n")
+    index.update()
+    assert len(index) == 52
+
+
+def test_rewritten_log_is_reindexed(reader, log_path):
+    reader.read_range(log_path, 0, 1)
+
+    save_log_to_jsonl(log_path, [{"n": "x" * 1000}] + LOG)
+
+    assert reader.read_range(log_path, 0, 2) == ([{"n": "x" * 1000}, LOG[0]], 51)
+
+
+def test_compressed_and_json_logs(reader, fs):
+    fs.create_dir("/logs")
+    save_log_to_jsonl("/logs/s.jsonl.gz", LOG)
+    fs.create_file("/logs/t.json", contents=json.dumps(LOG))
+
+    assert reader.read_range("/logs/s.jsonl.gz", 10, 5) == (LOG[10:15], 50)
+    assert reader.read_range("/logs/t.json", 10, 5) == (LOG[10:15], 50)
+    assert b"".join(reader.iter_lines("/logs/s.jsonl.gz", 48)).count(b"\n") == 2
+    assert reader.count("/logs/t.json") == 50
+
+
+def test_line_index_is_saved_next_to_large_logs(tmp_path):
+    path = str(tmp_path / "s.jsonl")
+    save_log_to_jsonl(path, LOG)
+    LogReader(persist_min_bytes=0, metrics=Metrics()).count(path)
+    assert os.path.exists(get_line_index_path(path))
+
+    # Another reader (e.g., after a restart) loads the index instead of scanning the log
+    reader = LogReader(persist_min_bytes=0, metrics=Metrics())
+    assert reader.read_range(path, 10, 5) == (LOG[10:15], 50)
+    counters = reader.metrics.snapshot()["counters"]
+    assert counters["log_offset_index_loads"] == 1
+    assert counters["log_bytes_indexed"] == 0
+
+    # A saved index is checked against the log
+    with open(path, "a") as f:
+        f.write(json.dumps({"n": 50}) + "\n")
+    assert LogReader(persist_min_bytes=0, metrics=Metrics()).read_range(path, 49) == (
+        LOG[49:] + [{"n": 50}],
+        51,
+    )
+    save_log_to_jsonl(path, LOG[:3])
+    assert LogReader(persist_min_bytes=0, metrics=Metrics()).read_range(path) == (LOG[:3], 3)
+
+    with open(get_line_index_path(path), "r+b") as f:
+        f.truncate(20)
+    assert LineOffsetIndex.load(path) is None
+
+    save_log_to_jsonl(str(tmp_path / "t.jsonl"), LOG)
+    LogReader(metrics=Metrics()).count(str(tmp_path / "t.jsonl"))  # Smaller than PERSIST_MIN_BYTES
+    assert not os.path.exists(get_line_index_path(str(tmp_path / "t.jsonl")))
+
+
+def test_mapped_log(tmp_path):
+    path = str(tmp_path / "s.jsonl")
+    save_log_to_jsonl(path, LOG)
+
+    with MappedLog(path) as log:
+        assert len(log) == 50
+        assert log[3] == LOG[3]
+        assert log[-1] == LOG[-1]
+        assert list(log) == LOG
+        assert log.get_line(1) == (json_codec.dumps(LOG[1]) + "\n").encode("utf-8")
+        view = log[10:20]
+        assert isinstance(view, MappedLog)
+        assert (len(view), view[0], list(view[5:])) == (10, LOG[10], LOG[15:20])
+        assert log[45:100:2] == LOG[45:100:2]
+        assert len(log[30:10]) == 0
+        with pytest.raises(IndexError):
+            log[50]
+
+    with open(str(tmp_path / "empty.jsonl"), "w"):
+        pass
+    with MappedLog(str(tmp_path / "empty.jsonl")) as log:
+        assert list(log) == []
+
+
+def test_mapped_log_survives_rewrite(tmp_path):
+    path = str(tmp_path / "s.jsonl")
+    save_log_to_jsonl(path, LOG)
+
+    with MappedLog(path) as log:
+        save_log_to_jsonl(path, LOG[:1])  # Replaces the file instead of truncating the mapped one
+        assert list(log) == LOG
+    with MappedLog(path) as log:
+        assert list(log) == LOG[:1]
+    assert os.listdir(tmp_path) == ["s.jsonl"]
+
+
+def test_map_log(tmp_path):
+    reader = LogReader(metrics=Metrics())
+    save_log_to_jsonl(str(tmp_path / "s.jsonl"), LOG)
+    save_log_to_jsonl(str(tmp_path / "s.jsonl.gz"), LOG)
+
+    with reader.map_log(str(tmp_path / "s.jsonl")) as log:
+        assert isinstance(log, MappedLog)
+        assert list(log) == LOG
+    with reader.map_log(str(tmp_path / "s.jsonl.gz")) as log:
+        assert log == LOG
@@ -0,0 +1,216 @@
+import json
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from coauthor_interface.backend.log_checkpoint import CheckpointGapError, LogSealedError
+from coauthor_interface.backend.log_storage import FileLogStorage, LogStorage, SQLiteLogStorage
+from coauthor_interface.backend.metrics import Metrics
+
+
+def make_events(start, stop):
+    return [{"eventName": "text-insert", "eventTimestamp": 1000 + 10 * i, "n": i} for i in range(start, stop)]
+
+
+def make_session(session_id, access_code="code", domain="story", start_timestamp=100.0):
+    return {
+        "session_id": session_id,
+        "access_code": access_code,
+        "domain": domain,
+        "engine": "gpt",
+        "start_timestamp": start_timestamp,
+    }
+
+
+@pytest.fixture(params=["sqlite", "files"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        storage = SQLiteLogStorage(str(tmp_path / "logs.db"), batch_size=4, metrics=Metrics())
+    else:
+        os.mkdir(tmp_path / "demo")
+        storage = FileLogStorage(str(tmp_path), "demo", metrics=Metrics())
+    yield storage
+    storage.close()
+
+
+def test_save_and_read_log(storage):
+    log = make_events(0, 10)
+    assert storage.save_log("s1", iter(log)) == 10
+
+    assert storage.count("s1") == 10
+    assert storage.read_log("s1") == log
+    assert storage.read_range("s1", 3, 4) == (log[3:7], 10)
+    assert storage.read_range("s1", 8) == (log[8:], 10)
+    assert storage.read_range("s1", 12, 5) == ([], 10)
+    assert b"".join(storage.iter_lines("s1", 2, 5)).decode("utf-8").count("\n") == 5
+    assert storage.sessions() == ["s1"]
+
+    # A save replaces the log
+    assert storage.save_log("s1", log[:3]) == 3
+    assert storage.read_log("s1") == log[:3]
+
+    with pytest.raises(KeyError):
+        storage.count("missing")
+    with pytest.raises(KeyError):
+        storage.read_range("missing")
+
+
+def test_line_separators_in_event_text(storage):
+    """Only newlines separate events; other line boundaries can appear raw in JSON strings."""
+    log = [
+        dict(event, text=f"a{char}b")
+        for event, char in zip(make_events(0, 9), "\u2028\u2029\x85\x0b\x0c\x1c\x1d\x1e\r")
+    ]
+    storage.save_log("s1", log)
+
+    assert storage.read_range("s1", 1, 6) == (log[1:7], 9)
+    assert storage.read_log("s1") == log
+    lines = b"".join(storage.iter_lines("s1", 2)).split(b"\n")[:-1]
+    assert [json.loads(line) for line in lines] == log[2:]
+
+
+def test_append_events(storage):
+    log = make_events(0, 11)
+
+    assert storage.append_events("s1", 0, log[:3]) == 3
+    assert storage.append_events("s1", 1, log[1:6]) == 6  # Retried from an earlier event
+    with pytest.raises(CheckpointGapError) as e:
+        storage.append_events("s1", 8, log[8:])
+    assert e.value.persisted == 6
+    assert storage.append_events("s1", 6, log[6:], seal=True) == 11
+    assert storage.read_log("s1") == log
+    assert storage.read_range("s1", 5, 3) == (log[5:8], 11)
+
+    with pytest.raises(LogSealedError):
+        storage.append_events("s1", 11, make_events(11, 12))
+
+
+def test_record_sessions(storage):
+    assert storage.get("s1") is None
+    storage.record_session(make_session("s1"))
+    storage.record_session(make_session("s2"))
+    storage.record_session(dict(make_session("s1"), domain="essay"))
+
+    assert storage.get("s1")["domain"] == "essay"
+    assert sorted(record["session_id"] for record in storage.records()) == ["s1", "s2"]
+
+
+def test_incomplete_storage_cannot_be_instantiated():
+    class ReadOnlyStorage(LogStorage):
+        def read_range(self, session_id, offset=0, limit=None):
+            return [], 0
+
+    with pytest.raises(TypeError):
+        ReadOnlyStorage()
+
+
+def test_events_are_stored_in_batches(tmp_path):
+    metrics = Metrics()
+    storage = SQLiteLogStorage(str(tmp_path / "logs.db"), batch_size=4, metrics=metrics)
+    storage.save_log("s1", make_events(0, 10))
+    for i in range(10):
+        storage.append_events("s2", i, make_events(i, i + 1))
+
+    with storage._connection() as connection:
+        rows = connection.execute(
+            "SELECT session_id, first_event, n_events, first_timestamp, last_timestamp FROM event_batches"
+            " ORDER BY session_id, first_event"
+        ).fetchall()
+        row = connection.execute(
+            "SELECT n_events, first_timestamp, last_timestamp FROM logs WHERE session_id = 's2'"
+        ).fetchone()
+    assert rows == [
+        ("s1", 0, 4, 1000, 1030),
+        ("s1", 4, 4, 1040, 1070),
+        ("s1", 8, 2, 1080, 1090),
+        ("s2", 0, 4, 1000, 1030),
+        ("s2", 4, 4, 1040, 1070),
+        ("s2", 8, 2, 1080, 1090),
+    ]
+    assert row == (10, 1000, 1090)
+
+    metrics.reset()
+    storage.read_range("s1", 5, 2)
+    assert metrics.snapshot()["counters"]["log_db_batches_read"] == 1
+
+
+def test_find_sessions(tmp_path):
+    storage = SQLiteLogStorage(str(tmp_path / "logs.db"), metrics=Metrics())
+    storage.record_session(make_session("s1", start_timestamp=100.0))
+    storage.record_session(make_session("s2", domain="essay", start_timestamp=200.0))
+    storage.record_session(make_session("s3", access_code="other", start_timestamp=300.0))
+
+    def find(**kwargs):
+        return [record["session_id"] for record in storage.find_sessions(**kwargs)]
+
+    assert find() == ["s1", "s2", "s3"]
+    assert find(access_code="code") == ["s1", "s2"]
+    assert find(domain="essay") == ["s2"]
+    assert find(start=150, end=300) == ["s2"]
+    assert find(offset=1, limit=1) == ["s2"]
+
+    with storage._connection() as connection:
+        plan = connection.execute(
+            "EXPLAIN QUERY PLAN SELECT record FROM sessions WHERE access_code = ? ORDER BY start_timestamp",
+            ("code",),
+        ).fetchall()
+    assert "sessions_access_code" in " ".join(row[-1] for row in plan)
+
+
+def test_connections_are_pooled(tmp_path, monkeypatch):
+    storage = SQLiteLogStorage(str(tmp_path / "logs.db"), metrics=Metrics())
+    storage.pool_size = 2
+    opened = []
+    created = []
+    open_connection, create_tables = storage._open, storage._create_tables
+    monkeypatch.setattr(storage, "_open", lambda: opened.append(1) or open_connection())
+    monkeypatch.setattr(storage, "_create_tables", lambda c: created.append(1) or create_tables(c))
+
+    def save(session_id):
+        for i in range(5):
+            storage.append_events(session_id, i, make_events(i, i + 1))
+            storage.count(session_id)
+
+    threads = [threading.Thread(target=save, args=(f"s{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert len(opened) < 8 * 10
+    assert len(storage._idle) <= 2
+    idle = list(storage._idle)
+    storage.close()
+    assert storage._idle == []
+    with pytest.raises(sqlite3.ProgrammingError):
+        idle[0].execute("SELECT 1")
+    # The storage can be used again after it is closed
+    assert storage.count("s0") == 5
+
+
+def test_concurrent_writers(tmp_path):
+    path = str(tmp_path / "logs.db")
+    errors = []
+
+    def checkpoint(session_id):
+        storage = SQLiteLogStorage(path, batch_size=4, metrics=Metrics())
+        try:
+            for i in range(20):
+                storage.append_events(session_id, i, make_events(i, i + 1))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            storage.close()
+
+    threads = [threading.Thread(target=checkpoint, args=(f"s{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    storage = SQLiteLogStorage(path, metrics=Metrics())
+    assert all(storage.read_log(f"s{i}") == make_events(0, 20) for i in range(4))
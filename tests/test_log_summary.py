@@ -0,0 +1,95 @@
+import pytest
+
+from coauthor_interface.backend.helper import save_log_to_jsonl
+from coauthor_interface.backend.log_summary import (
+    get_summary_path,
+    load_summary,
+    read_summary,
+    remove_summary,
+    summarize_log,
+    write_summary,
+)
+
+LOG = [
+    {"eventName": "session-start", "eventSource": "user", "eventTimestamp": 1000, "textDelta": ""},
+    {
+        "eventName": "system-initialize",
+        "eventSource": "api",
+        "eventTimestamp": 1500,
+        "textDelta": "",
+        "currentDoc": "Hi ",
+    },
+    {
+        "eventName": "text-insert",
+        "eventSource": "user",
+        "eventTimestamp": 2000,
+        "textDelta": {"ops": [{"retain": 2}, {"insert": "abc"}]},
+    },
+    {
+        "eventName": "suggestion-select",
+        "eventSource": "api",
+        "eventTimestamp": 4000,
+        "textDelta": {"ops": [{"retain": 5}, {"insert": "de"}]},
+    },
+    {
+        "eventName": "text-insert",
+        "eventSource": "user",
+        "eventTimestamp": 6000,
+        "textDelta": {"ops": [{"retain": 7}, {"insert": "f"}]},
+    },
+]
+
+
+@pytest.fixture
+def log_path(fs):
+    fs.create_dir("/logs")
+    save_log_to_jsonl("/logs/s.jsonl.gz", LOG)
+    return "/logs/s.jsonl.gz"
+
+
+def test_summarize_log():
+    summary = summarize_log(LOG, config={"k": "v"})
+
+    assert summary["n_events"] == 5
+    assert summary["duration"] == 5.0
+    assert summary["stats"] == {
+        "eventCounter": {"session-start": 1, "system-initialize": 1, "text-insert": 2, "suggestion-select": 1}
+    }
+    assert summary["last_text"] == "Hiabcdef"
+    assert summary["authorship"] == {"prompt": 0.25, "user": 0.5, "api": 0.25}
+    assert summary["config"] == {"k": "v"}
+    assert summarize_log(LOG, "text", "UUUA")["authorship"]["user"] == 0.75
+    assert summarize_log([])["authorship"] == {"prompt": 0.0, "user": 0.0, "api": 0.0}
+
+
+def test_read_and_write_summary(log_path):
+    assert read_summary(log_path) is None
+
+    summary = summarize_log(LOG)
+    assert write_summary(log_path, summary) == "/logs/s.summary.json"
+    assert get_summary_path("/logs/s.jsonl") == "/logs/s.summary.json"
+
+    assert read_summary(log_path) == summary
+    assert read_summary(log_path, n_events=5) == summary
+    assert read_summary(log_path, n_events=6) is None  # The log has grown since
+
+    remove_summary(log_path)
+    remove_summary(log_path)
+    assert read_summary(log_path) is None
+
+
+def test_invalid_summary_is_ignored(log_path, fs):
+    fs.create_file("/logs/s.summary.json", contents='{"n_events": 5')
+    assert read_summary(log_path) is None
+
+    write_summary(log_path, dict(summarize_log(LOG), version=0))
+    assert read_summary(log_path) is None
+
+
+def test_load_summary(log_path):
+    summary = load_summary(log_path, save=False)
+    assert summary == summarize_log(LOG)
+    assert read_summary(log_path) is None
+
+    assert load_summary(log_path) == summary
+    assert read_summary(log_path) == summary
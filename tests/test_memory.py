@@ -0,0 +1,41 @@
+from coauthor_interface.backend.memory import format_memory_usage, read_memory_usage
+
+SMAPS_ROLLUP = """55c497758000-7fff32954000 ---p 00000000 00:00 0                          [rollup]
+Rss:                1436 kB
+Pss:                 409 kB
+Pss_Dirty:           104 kB
+Shared_Clean:       1292 kB
+Shared_Dirty:          0 kB
+Private_Clean:        40 kB
+Private_Dirty:       104 kB
+"""
+
+
+def test_read_memory_usage_from_smaps_rollup(fs):
+    fs.create_file("/proc/123/smaps_rollup", contents=SMAPS_ROLLUP)
+
+    usage = read_memory_usage(123)
+
+    assert usage == {"rss": 1436 * 1024, "pss": 409 * 1024, "shared": 1292 * 1024, "private": 144 * 1024}
+
+
+def test_read_memory_usage_falls_back_to_statm(fs, monkeypatch):
+    fs.create_file("/proc/123/statm", contents="660 313 288 5 0 123 0\n")
+    monkeypatch.setattr("os.sysconf", lambda name: 4096)
+
+    usage = read_memory_usage(123)
+
+    assert usage == {"rss": 313 * 4096, "pss": None, "shared": 288 * 4096, "private": 25 * 4096}
+
+
+def test_read_memory_usage_unavailable(fs):
+    assert read_memory_usage(123) is None
+    assert format_memory_usage("worker", None) == "worker: memory usage unavailable"
+
+
+def test_format_memory_usage():
+    usage = {"rss": 3 * 1024 * 1024, "pss": None, "shared": 2 * 1024 * 1024, "private": 1024 * 1024}
+
+    line = format_memory_usage("worker 0", usage)
+
+    assert line == "worker 0: rss=3.0 MiB shared=2.0 MiB private=1.0 MiB pss=n/a"
@@ -0,0 +1,112 @@
+import json
+import os
+
+import pytest
+
+from coauthor_interface.backend.metadata_index import MetadataIndex
+from coauthor_interface.backend.metrics import Metrics
+
+METADATA_PATH = "/logs/metadata.txt"
+
+
+def append_sessions(*sessions, path=METADATA_PATH):
+    with open(path, "a") as f:
+        for session in sessions:
+            json.dump(session, f)
+            f.write("\n")
+
+
+@pytest.fixture
+def metadata_file(fs):
+    fs.create_file(METADATA_PATH)
+    append_sessions(
+        {"access_code": "demo", "session_id": "a", "n": 1},
+        {"access_code": "demo", "session_id": "b", "n": 2},
+    )
+    return METADATA_PATH
+
+
+def test_lookup(metadata_file):
+    index = MetadataIndex(metadata_file, metrics=Metrics())
+
+    assert index.get("a") == {"access_code": "demo", "session_id": "a", "n": 1}
+    assert index.get("b")["n"] == 2
+    assert index.get("c") is None
+
+
+def test_new_lines_are_indexed_incrementally(metadata_file):
+    metrics = Metrics()
+    index = MetadataIndex(metadata_file, metrics=metrics)
+    index.update()
+
+    append_sessions({"access_code": "demo", "session_id": "c", "n": 3})
+    append_sessions({"access_code": "demo", "session_id": "a", "n": 4})  # The most recent record wins
+
+    assert index.get("c")["n"] == 3
+    assert index.get("a")["n"] == 4
+    assert metrics.snapshot()["counters"]["metadata_lines_indexed"] == 4
+
+
+def test_partial_line_is_indexed_once_complete(metadata_file):
+    index = MetadataIndex(metadata_file, metrics=Metrics())
+    index.update()
+
+    with open(metadata_file, "a") as f:
+        f.write('{"access_code": "demo", "session_id": "c"')
+    assert index.get("c") is None
+
+    with open(metadata_file, "a") as f:
+        f.write(', "n": 3}\n')
+    assert index.get("c")["n"] == 3
+
+
+def test_session_id_inside_values_is_ignored(metadata_file):
+    index = MetadataIndex(metadata_file, metrics=Metrics())
+    append_sessions({"access_code": '"session_id": "x"', "session_id": "c"})
+
+    assert index.get("c")["access_code"] == '"session_id": "x"'
+    assert index.get("x") is None
+
+
+def test_index_is_reused_after_restart(metadata_file):
+    MetadataIndex(metadata_file, metrics=Metrics()).update()
+    assert os.path.exists(f"{metadata_file}.idx")
+
+    metrics = Metrics()
+    index = MetadataIndex(metadata_file, metrics=metrics)
+    assert index.get("b")["n"] == 2
+    assert "metadata_lines_indexed" not in metrics.snapshot()["counters"]
+
+    append_sessions({"access_code": "demo", "session_id": "c", "n": 3})
+    assert index.get("c")["n"] == 3
+    assert metrics.snapshot()["counters"]["metadata_lines_indexed"] == 1
+
+
+def test_index_file_is_shared_without_duplicates(metadata_file):
+    first = MetadataIndex(metadata_file, metrics=Metrics())
+    second = MetadataIndex(metadata_file, metrics=Metrics())
+    first.update()
+    second.update()
+
+    with open(f"{metadata_file}.idx") as f:
+        assert len(f.readlines()) == 2
+
+
+def test_stale_index_is_rebuilt(metadata_file):
+    MetadataIndex(metadata_file, metrics=Metrics()).update()
+
+    # Replace the metadata file with different content
+    with open(metadata_file, "w") as f:
+        f.write("")
+    append_sessions({"access_code": "other", "session_id": "z", "n": 9})
+
+    index = MetadataIndex(metadata_file, metrics=Metrics())
+    assert index.get("z")["n"] == 9
+    assert index.get("a") is None
+
+
+def test_missing_metadata_file(fs):
+    index = MetadataIndex("/logs/missing.txt", metrics=Metrics())
+
+    with pytest.raises(FileNotFoundError):
+        index.update()
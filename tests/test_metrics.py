@@ -0,0 +1,31 @@
+from coauthor_interface.backend.metrics import Metrics
+
+
+def test_counters_and_gauges():
+    metrics = Metrics()
+    metrics.increment("requests")
+    metrics.increment("requests", 2)
+    metrics.set_gauge("sessions", 5)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {"requests": 3}
+    assert snapshot["gauges"] == {"sessions": 5}
+
+
+def test_timings():
+    metrics = Metrics()
+    metrics.observe("latency", 1.0)
+    metrics.observe("latency", 3.0)
+    with metrics.timer("block"):
+        pass
+
+    timings = metrics.snapshot()["timings"]
+    assert timings["latency"] == {"count": 2, "total": 4.0, "max": 3.0, "mean": 2.0}
+    assert timings["block"]["count"] == 1
+
+
+def test_reset():
+    metrics = Metrics()
+    metrics.increment("requests")
+    metrics.reset()
+    assert metrics.snapshot() == {"counters": {}, "gauges": {}, "timings": {}}
@@ -0,0 +1,61 @@
+from coauthor_interface.backend.metrics import Metrics
+from coauthor_interface.backend.overload import DEGRADED, NORMAL, SHEDDING, LoadMonitor
+
+
+def test_disabled_thresholds_never_degrade():
+    monitor = LoadMonitor(metrics=Metrics(), cpu_load_fcn=lambda: 100.0)
+    for _ in range(100):
+        monitor.request_started()
+    assert monitor.level() == NORMAL
+    assert monitor.metrics.gauges["degradation_level"] == NORMAL
+
+
+def test_queue_depth_thresholds():
+    monitor = LoadMonitor(max_queue_depth=4, shed_ratio=2.0, metrics=Metrics())
+
+    for _ in range(3):
+        monitor.request_started()
+    assert monitor.level() == NORMAL
+
+    monitor.request_started()
+    assert monitor.level() == DEGRADED
+
+    for _ in range(4):
+        monitor.request_started()
+    assert monitor.level() == SHEDDING
+    assert monitor.metrics.gauges["degradation_level"] == SHEDDING
+
+    for _ in range(8):
+        monitor.request_finished()
+    assert monitor.level() == NORMAL
+    assert monitor.metrics.gauges["in_flight_requests"] == 0
+
+
+def test_upstream_calls_threshold():
+    monitor = LoadMonitor(max_upstream_calls=1, metrics=Metrics())
+    with monitor.upstream_call():
+        assert monitor.level() == DEGRADED
+        assert monitor.metrics.gauges["in_flight_upstream_calls"] == 1
+    assert monitor.level() == NORMAL
+
+
+def test_cpu_load_threshold_is_sampled():
+    samples = [0.5, 2.0]
+    monitor = LoadMonitor(
+        max_cpu_load=1.0,
+        cpu_sample_interval=3600,
+        cpu_load_fcn=lambda: samples.pop(0),
+        metrics=Metrics(),
+    )
+    assert monitor.level() == NORMAL
+    # The load is not sampled again within the sampling interval
+    assert monitor.level() == NORMAL
+
+    monitor.cpu_sample_interval = 0
+    assert monitor.level() == SHEDDING
+
+
+def test_unavailable_cpu_load_is_ignored():
+    monitor = LoadMonitor(max_cpu_load=1.0, cpu_load_fcn=lambda: None, metrics=Metrics())
+    assert monitor.load_ratios() == {}
+    assert monitor.level() == NORMAL
@@ -0,0 +1,128 @@
+import json
+import threading
+import urllib.request
+
+import pytest
+
+from coauthor_interface.backend.helper import shard_for_session
+from coauthor_interface.backend.router import SessionRouter, get_worker_socket_path
+from coauthor_interface.backend.serve import BoundedThreadedWSGIServer
+
+
+EXPORT_CHUNK = b"x" * (1 << 16)
+EXPORT_CHUNKS = 64
+
+
+def make_worker_app(index, export_read):
+    def export(start_response):
+        """A large export without Content-Length, whose rest is only sent once its start reached the client."""
+        start_response("200 OK", [("Content-Type", "application/x-ndjson")])
+        yield EXPORT_CHUNK
+        if export_read.wait(timeout=10):
+            for _ in range(EXPORT_CHUNKS - 1):
+                yield EXPORT_CHUNK
+
+    def app(environ, start_response):
+        if environ["PATH_INFO"] == "/api/export":
+            return export(start_response)
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length)
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [json.dumps({"worker": index, "path": environ["PATH_INFO"], "length": len(body)}).encode()]
+
+    return app
+
+
+@pytest.fixture
+def router(tmp_path):
+    """A router in front of three workers listening on Unix sockets, and the event that releases exports."""
+    socket_paths = [get_worker_socket_path(tmp_path, index) for index in range(3)]
+    export_read = threading.Event()
+    servers = [
+        BoundedThreadedWSGIServer(f"unix://{path}", 0, make_worker_app(index, export_read), max_threads=2)
+        for index, path in enumerate(socket_paths)
+    ]
+    servers.append(BoundedThreadedWSGIServer("127.0.0.1", 0, SessionRouter(socket_paths), max_threads=4))
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield f"http://127.0.0.1:{servers[-1].server_address[1]}", export_read
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post(url, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_select_worker_by_session_id():
+    router = SessionRouter(["a", "b", "c", "d"])
+
+    for session_id in ["abc", "0123456789abcdef", "ffff"]:
+        body = json.dumps({"session_id": session_id, "logs": []}).encode()
+        assert router.select_worker(body) == shard_for_session(session_id, 4)
+
+        body = json.dumps({"sessionId": session_id, "logs": []}).encode()
+        assert router.select_worker(body) == shard_for_session(session_id, 4)
+
+
+def test_select_worker_ignores_session_ids_inside_values():
+    router = SessionRouter(["a", "b", "c"])
+    body = json.dumps({"logs": [{"text": '"session_id": "abc"'}], "session_id": "def"}).encode()
+
+    assert router.select_worker(body) == shard_for_session("def", 3)
+
+
+def test_select_worker_without_session_id():
+    router = SessionRouter(["a", "b", "c"])
+
+    assert [router.select_worker(b"{}") for _ in range(4)] == [0, 1, 2, 0]
+    assert router.select_worker(b"", "worker=2") == 2
+    assert router.select_worker(b"", "worker=7") in (0, 1, 2)
+
+
+def test_requests_are_forwarded_to_the_session_worker(router):
+    router_url, _ = router
+    for session_id in ["abc", "def", "0123"]:
+        data = post(f"{router_url}/api/parse_logs", {"session_id": session_id, "logs": [1, 2, 3]})
+
+        assert data["worker"] == shard_for_session(session_id, 3)
+        assert data["path"] == "/api/parse_logs"
+        assert data["length"] > 0
+
+
+def test_large_requests_are_forwarded_to_the_session_worker(router):
+    router_url, _ = router
+    logs = [{"text": "x" * 1000}] * 4000
+
+    data = post(f"{router_url}/api/end_session", {"session_id": "abc", "logs": logs})
+    assert data["worker"] == shard_for_session("abc", 3)
+    assert data["length"] > 4000 * 1000
+
+    # The session ID is found after the logs as well
+    data = post(f"{router_url}/api/end_session", {"logs": logs, "session_id": "def"})
+    assert data["worker"] == shard_for_session("def", 3)
+
+
+def test_large_exports_are_streamed(router):
+    router_url, export_read = router
+
+    with urllib.request.urlopen(f"{router_url}/api/export?worker=1") as response:
+        start = response.read1(len(EXPORT_CHUNK))
+        export_read.set()
+        data = start + response.read()
+
+    assert len(data) == EXPORT_CHUNKS * len(EXPORT_CHUNK)
+    assert set(data) == {ord("x")}
+
+
+def test_router_liveness(router):
+    router_url, _ = router
+    with urllib.request.urlopen(f"{router_url}/healthz/live") as response:
+        assert response.status == 200
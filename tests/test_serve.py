@@ -0,0 +1,61 @@
+import os
+import signal
+from argparse import Namespace
+
+import pytest
+
+from coauthor_interface.backend import api_server as srv
+from coauthor_interface.backend.serve import parse_args, serve_until_stopped
+from coauthor_interface.backend.write_behind import WriteBehindWriter
+
+
+class StoppedServer:
+    """A server that receives SIGTERM while it serves."""
+
+    def serve_forever(self):
+        os.kill(os.getpid(), signal.SIGTERM)
+        raise AssertionError("SIGTERM did not stop the server")
+
+
+@pytest.fixture
+def restore_sigterm():
+    handler = signal.getsignal(signal.SIGTERM)
+    yield
+    signal.signal(signal.SIGTERM, handler)
+
+
+def test_sigterm_flushes_queued_writes(tmp_path, monkeypatch, restore_sigterm):
+    writer = WriteBehindWriter(fsync_interval=0)
+    monkeypatch.setattr(srv, "WRITE_BEHIND", writer)
+    writer.start()
+    path = tmp_path / "metadata.txt"
+    ticket = writer.append(str(path), "record\n")
+
+    with pytest.raises(SystemExit):
+        serve_until_stopped(StoppedServer())
+
+    assert ticket.done
+    assert not writer.running
+    assert path.read_text() == "record\n"
+
+
+def test_background_tasks_are_stopped_at_exit(monkeypatch):
+    registered = []
+    monkeypatch.setattr(srv, "args", Namespace(session_spill_dir=None), raising=False)
+    monkeypatch.setattr(srv.atexit, "register", registered.append)
+    monkeypatch.setattr(srv.atexit, "unregister", lambda function: None)
+    for task in (srv.LOG_CHECKPOINTS, srv.WRITE_BEHIND, srv.GC_POLICY):
+        monkeypatch.setattr(task, "start", lambda: None)
+
+    srv.start_background_tasks()
+
+    assert registered == [srv.stop_background_tasks]
+
+
+def test_several_workers_require_stateless_sessions():
+    required = ["--config_dir", "c", "--log_dir", "l", "--port", "1", "--proj_name", "p"]
+
+    assert parse_args(required).workers == 1
+    with pytest.raises(SystemExit):
+        parse_args(required + ["--workers", "2"])
+    assert parse_args(required + ["--workers", "2", "--stateless_sessions"]).workers == 2
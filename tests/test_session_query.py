@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+
+from coauthor_interface.backend.helper import save_log_to_jsonl
+from coauthor_interface.backend.log_index import LogPathIndex
+from coauthor_interface.backend.log_storage import SQLiteLogStorage
+from coauthor_interface.backend.metrics import Metrics
+from coauthor_interface.backend.session_query import SessionQueryIndex
+
+
+def make_session(session_id, engine="gpt", show_interventions=True, start_timestamp=100.0):
+    return {
+        "session_id": session_id,
+        "access_code": "code",
+        "domain": "story",
+        "engine": engine,
+        "show_interventions": show_interventions,
+        "start_timestamp": start_timestamp,
+    }
+
+
+def append_sessions(path, sessions):
+    with open(path, "a") as f:
+        for session in sessions:
+            f.write(json.dumps(session) + "\n")
+
+
+def save_log(log_dir, session_id, n_events):
+    path = os.path.join(log_dir, "demo", session_id + ".jsonl")
+    save_log_to_jsonl(path, [{"eventName": "text-insert", "n": i} for i in range(n_events)])
+    return path
+
+
+def make_index(tmp_path, metrics):
+    os.makedirs(tmp_path / "demo", exist_ok=True)
+    return SessionQueryIndex(
+        str(tmp_path / "sessions.db"),
+        metadata_path=str(tmp_path / "metadata.txt"),
+        path_index=LogPathIndex(str(tmp_path), check_interval=0, metrics=metrics),
+        check_interval=0,
+        metrics=metrics,
+    )
+
+
+def find(index, **filters):
+    return [session["session_id"] for session in index.find_sessions(**filters)]
+
+
+def test_find_sessions(tmp_path):
+    metrics = Metrics()
+    index = make_index(tmp_path, metrics)
+    append_sessions(
+        tmp_path / "metadata.txt",
+        [
+            make_session("s1", start_timestamp=100.0),
+            make_session("s2", engine="gpt-4", show_interventions=False, start_timestamp=200.0),
+            make_session("s3", start_timestamp=300.0),
+        ],
+    )
+    save_log(str(tmp_path), "s1", 3)
+    save_log(str(tmp_path), "s2", 10)
+
+    assert find(index) == ["s1", "s2", "s3"]
+    assert find(index, engine="gpt-4") == ["s2"]
+    assert find(index, show_interventions=True) == ["s1", "s3"]
+    assert find(index, start=150, end=300) == ["s2"]
+    assert find(index, min_events=5) == ["s2"]
+    assert find(index, max_events=5) == ["s1"]
+    assert find(index, offset=1, limit=1) == ["s2"]
+    assert [session["n_events"] for session in index.find_sessions()] == [3, 10, None]
+    assert index.count_sessions(engine="gpt") == 2
+
+    with index._connection() as connection:
+        plan = connection.execute(
+            "EXPLAIN QUERY PLAN SELECT record FROM sessions WHERE engine = ? ORDER BY start_timestamp",
+            ("gpt",),
+        ).fetchall()
+    assert "sessions_engine" in " ".join(row[-1] for row in plan)
+    index.close()
+
+
+def test_updates_are_incremental(tmp_path):
+    metrics = Metrics()
+    index = make_index(tmp_path, metrics)
+    metadata_path = tmp_path / "metadata.txt"
+    append_sessions(metadata_path, [make_session("s1"), make_session("s2")])
+    path = save_log(str(tmp_path), "s1", 3)
+    save_log(str(tmp_path), "s2", 4)
+    index.update()
+    counters = metrics.snapshot()["counters"]
+    assert counters["session_index_records"] == 2
+    assert counters["session_index_logs_counted"] == 2
+
+    # Only the new records and the modified logs are read
+    metrics.reset()
+    append_sessions(metadata_path, [make_session("s3")])
+    with open(metadata_path, "a") as f:
+        f.write('{"session_id": "s4", "start_timestamp": 400.0')  # Still being written
+    save_log(str(tmp_path), "s1", 7)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    os.remove(os.path.join(tmp_path, "demo", "s2.jsonl"))
+    index.update()
+    counters = metrics.snapshot()["counters"]
+    assert counters["session_index_records"] == 1
+    assert counters["session_index_logs_counted"] == 1
+    assert {session["session_id"]: session["n_events"] for session in index.find_sessions()} == {
+        "s1": 7,
+        "s2": None,
+        "s3": None,
+    }
+
+    # The index is shared with other processes through the database
+    with open(metadata_path, "a") as f:
+        f.write("}\n")
+    index.close()
+    index = make_index(tmp_path, metrics)
+    assert find(index) == ["s1", "s2", "s3", "s4"]
+
+    # A truncated metadata.txt is indexed again
+    os.remove(metadata_path)
+    append_sessions(metadata_path, [make_session("s5")])
+    assert find(index) == ["s5"]
+    index.close()
+
+
+def test_upgrade_database_without_show_interventions(tmp_path):
+    path = str(tmp_path / "logs.db")
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE sessions (session_id TEXT PRIMARY KEY, access_code TEXT, domain TEXT, engine TEXT,"
+        " start_timestamp REAL, record TEXT NOT NULL)"
+    )
+    connection.execute(
+        "INSERT INTO sessions VALUES ('s1', 'code', 'story', 'gpt', 100.0, ?)",
+        (json.dumps(make_session("s1", show_interventions=False)),),
+    )
+    connection.commit()
+    connection.close()
+
+    storage = SQLiteLogStorage(path, metrics=Metrics())
+    storage.record_session(make_session("s2"))
+    assert find(storage, show_interventions=False) == ["s1"]
+    assert find(storage, show_interventions=True) == ["s2"]
+    storage.close()
@@ -0,0 +1,164 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from coauthor_interface.backend.action_history import ActionHistory
+from coauthor_interface.backend.metrics import Metrics
+from coauthor_interface.backend.session_store import SessionStore
+
+
+@pytest.fixture
+def store(fs):
+    fs.create_dir("/spill")
+    return SessionStore(spill_dir="/spill", idle_timeout=60, metrics=Metrics())
+
+
+def make_session():
+    history = ActionHistory(window_size=2)
+    history.extend([{"level_1_action_type": "insert_text"}])
+    return {
+        "start_timestamp": 0,
+        "last_query_timestamp": 0,
+        "current_action_in_progress": {"action_type": "insert_text", "action_logs": [{"eventName": "x"}]},
+        "parsed_actions": history,
+    }
+
+
+def test_behaves_like_a_dict_without_spilling():
+    store = SessionStore(metrics=Metrics())
+    store["a"] = {"value": 1}
+
+    assert "a" in store
+    assert store["a"]["value"] == 1
+    assert len(store) == 1
+    assert store.pop("a") == {"value": 1}
+    assert "a" not in store
+    with pytest.raises(KeyError):
+        store["a"]
+    assert store.spill_idle_sessions() == []
+
+
+def test_idle_sessions_are_spilled_and_paged_back(store):
+    store["idle"] = make_session()
+    store["active"] = {"start_timestamp": 0, "last_query_timestamp": 0}
+    store._last_access["idle"] -= 120
+
+    assert store.spill_idle_sessions() == ["idle"]
+    assert Path("/spill/idle.session").exists()
+    assert "idle" in store
+    assert set(store.resident()) == {"active"}
+    assert len(store) == 2
+
+    session = store["idle"]
+    assert session["current_action_in_progress"]["action_type"] == "insert_text"
+    assert session["parsed_actions"].total_count == 1
+    assert not Path("/spill/idle.session").exists()
+    assert set(store.resident()) == {"active", "idle"}
+
+
+def test_stats_report_hit_rate_and_page_in_latency(store):
+    store["s"] = make_session()
+    store["s"]
+    store.spill("s")
+    store["s"]
+
+    stats = store.stats()
+    assert stats["resident"] == 1
+    assert stats["spilled"] == 0
+    assert stats["hit_rate"] == 0.5
+
+    snapshot = store.metrics.snapshot()
+    assert snapshot["counters"]["session_cache_page_ins"] == 1
+    assert snapshot["timings"]["session_page_in_seconds"]["count"] == 1
+
+
+def test_delete_and_clear_remove_spilled_files(store):
+    store["a"] = make_session()
+    store["b"] = make_session()
+    store.spill("a")
+    store.spill("b")
+
+    del store["a"]
+    assert not Path("/spill/a.session").exists()
+
+    store.clear()
+    assert len(store) == 0
+    assert not Path("/spill/b.session").exists()
+
+
+def test_spilled_sessions_survive_a_restart(store):
+    store["a"] = make_session()
+    store.spill("a")
+
+    restarted = SessionStore(spill_dir="/spill", idle_timeout=60, metrics=Metrics())
+    assert "a" in restarted
+    assert restarted["a"]["parsed_actions"].total_count == 1
+
+
+def test_lock_serializes_requests_for_the_same_session():
+    store = SessionStore(metrics=Metrics())
+    store["s"] = {"counter": 0}
+
+    def increment():
+        for _ in range(200):
+            with store.lock("s"):
+                value = store["s"]["counter"]
+                time.sleep(0)
+                store["s"]["counter"] = value + 1
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store["s"]["counter"] == 800
+    assert store.metrics.counters["session_lock_acquisitions"] == 800
+
+
+def test_lock_records_contention():
+    store = SessionStore(metrics=Metrics())
+    store["s"] = {}
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with store.lock("s"):
+            acquired.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    acquired.wait()
+
+    def wait():
+        with store.lock("s"):
+            pass
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    holder.join()
+    waiter.join()
+
+    assert store.metrics.counters["session_lock_contended"] == 1
+    assert store.metrics.snapshot()["timings"]["session_lock_wait_seconds"]["count"] == 1
+
+
+def test_lock_unknown_session_raises():
+    store = SessionStore(metrics=Metrics())
+    with pytest.raises(KeyError):
+        with store.lock("missing"):
+            pass
+
+
+def test_locked_sessions_are_not_spilled(store):
+    store["busy"] = make_session()
+    store._last_access["busy"] -= 120
+
+    with store.lock("busy"):
+        assert store.spill_idle_sessions() == []
+    assert store.spill_idle_sessions() == ["busy"]
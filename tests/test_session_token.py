@@ -0,0 +1,167 @@
+import random
+from time import time
+
+import pytest
+
+from coauthor_interface.backend.action_history import ActionHistory
+from coauthor_interface.backend.metrics import Metrics
+from coauthor_interface.backend.session_token import (
+    SessionTokenCodec,
+    SessionTokenError,
+    encode_session,
+    session_from_token_state,
+    session_to_token_state,
+)
+
+
+def make_session(n_actions=3):
+    history = ActionHistory(window_size=10)
+    history.extend(
+        [
+            {
+                "level_1_action_type": "insert_text",
+                "level_3_action_type": "mindless_edit",
+                "action_delta": ["INSERT", 0, 5],
+                "action_logs": [{"eventName": "text-insert"}] * 20,
+            }
+            for _ in range(n_actions)
+        ]
+    )
+    return {
+        "session_id": "abc",
+        "access_code": "demo",
+        "verification_code": "abc",
+        "start_timestamp": time(),
+        "last_query_timestamp": time(),
+        "show_interventions": True,
+        "current_action_in_progress": {"action_type": "insert_text", "action_logs": []},
+        "parsed_actions": history,
+        "cached_suggestions": {"key": [], "results": {}},
+    }
+
+
+def test_round_trip():
+    codec = SessionTokenCodec("secret", metrics=Metrics())
+    state = {"session_id": "abc", "values": [1, 2, 3]}
+
+    decoded = codec.decode(codec.encode(state))
+
+    assert decoded["session_id"] == "abc"
+    assert decoded["values"] == [1, 2, 3]
+    assert "issued_at" in decoded
+
+
+def test_tampered_token_is_rejected():
+    codec = SessionTokenCodec("secret", metrics=Metrics())
+    version, body, signature = codec.encode({"session_id": "abc"}).split(".")
+    tampered = f"{version}.{body[:-2]}AA.{signature}"
+
+    with pytest.raises(SessionTokenError):
+        codec.decode(tampered)
+
+
+def test_token_signed_with_another_secret_is_rejected():
+    token = SessionTokenCodec("secret", metrics=Metrics()).encode({"session_id": "abc"})
+
+    with pytest.raises(SessionTokenError):
+        SessionTokenCodec("other", metrics=Metrics()).decode(token)
+
+
+def test_malformed_token_is_rejected():
+    codec = SessionTokenCodec("secret", metrics=Metrics())
+
+    for token in [None, "", "abc", "v2.abc.def", "v1.abc.def"]:
+        with pytest.raises(SessionTokenError):
+            codec.decode(token)
+
+
+def test_oversized_token_is_rejected():
+    metrics = Metrics()
+    codec = SessionTokenCodec("secret", max_token_size=64, metrics=metrics)
+
+    with pytest.raises(SessionTokenError):
+        codec.encode({"data": [str(i) for i in range(1000)]})
+    assert metrics.snapshot()["counters"]["session_token_oversized"] == 1
+
+
+def test_expired_token_is_rejected():
+    codec = SessionTokenCodec("secret", max_age=60, metrics=Metrics())
+    token = codec.encode({"session_id": "abc"})
+
+    codec.decode(token)
+    codec.max_age = -1
+    with pytest.raises(SessionTokenError):
+        codec.decode(token)
+
+
+def test_session_state_round_trip():
+    codec = SessionTokenCodec("secret", metrics=Metrics())
+    session = make_session()
+
+    state = codec.decode(encode_session(codec, session))
+    restored = session_from_token_state(state)
+
+    assert restored["stateless"] is True
+    assert restored["session_id"] == "abc"
+    assert restored["show_interventions"] is True
+    assert restored["current_action_in_progress"] == session["current_action_in_progress"]
+    assert "cached_suggestions" not in restored
+
+    history = restored["parsed_actions"]
+    assert history.total_count == 3
+    assert history.count("mindless_edit") == 3
+    assert history.inserted_chars == 15
+    assert len(history) == 3
+    assert all("action_logs" not in action for action in history)
+
+
+def test_token_state_keeps_only_recent_actions():
+    state = session_to_token_state(make_session(n_actions=8), n_actions=2)
+
+    assert len(state["parsed_actions"]["recent"]) == 2
+    assert state["parsed_actions"]["total_count"] == 8
+
+
+def test_encode_session_drops_actions_when_too_large():
+    codec = SessionTokenCodec("secret", metrics=Metrics())
+    session = make_session()
+    without_actions = len(codec.encode(session_to_token_state(session, 0)))
+    with_actions = len(codec.encode(session_to_token_state(session)))
+    codec.max_token_size = (without_actions + with_actions) // 2
+
+    state = codec.decode(encode_session(codec, session))
+
+    assert state["parsed_actions"]["recent"] == []
+    assert state["parsed_actions"]["total_count"] == 3
+
+
+def test_encode_session_summarizes_oversized_action_in_progress():
+    metrics = Metrics()
+    codec = SessionTokenCodec("secret", metrics=metrics)
+    session = make_session()
+    rng = random.Random(0)
+    documents = ["".join(rng.choices("abcdefgh ", k=100)) for _ in range(2000)]
+    session["current_action_in_progress"] = {
+        "action_type": "insert_text",
+        "action_source": "user",
+        "action_logs": [{"eventTimestamp": i, "currentDoc": doc} for i, doc in enumerate(documents)],
+        "action_start_writing": documents[0],
+        "writing_at_save": "Hello world.",
+        "mask_at_save": "UUUUUUUUUUUU",
+        "delta_at_save": ["INSERT", "world.", 6],
+        "sentences_seen_so_far": {"Hello world.": 0},
+    }
+
+    state = codec.decode(encode_session(codec, session))
+
+    action = state["current_action_in_progress"]
+    assert action["action_logs"] == [{"eventTimestamp": 1999}]
+    assert "action_start_writing" not in action
+    assert action["writing_at_save"] == "Hello world."
+    assert action["sentences_seen_so_far"] == {"Hello world.": 0}
+    assert state["parsed_actions"]["recent"] == []
+    assert metrics.snapshot()["counters"]["session_token_summarized"] == 1
+
+    codec.max_token_size = 64
+    with pytest.raises(SessionTokenError):
+        encode_session(codec, session)
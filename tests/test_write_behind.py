@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from coauthor_interface.backend.metrics import Metrics
+from coauthor_interface.backend.write_behind import WriteBehindWriter
+
+
+@pytest.fixture
+def writer():
+    writer = WriteBehindWriter(fsync_interval=0, metrics=Metrics())
+    yield writer
+    writer.stop()
+
+
+def hold_writer_thread(writer, path):
+    """Queue a write that blocks the writer thread until the returned event is set."""
+    started, release = threading.Event(), threading.Event()
+
+    def blocked_write():
+        started.set()
+        release.wait(5)
+        path.write_text("held")
+
+    writer.write(str(path), blocked_write)
+    assert started.wait(5)
+    return release
+
+
+def test_writes_run_synchronously_until_started(writer, tmp_path):
+    path = tmp_path / "metadata.txt"
+
+    assert writer.append(str(path), "a\n").wait(0)
+    assert writer.write(str(tmp_path / "log.jsonl"), lambda: (tmp_path / "log.jsonl").write_text("x")).wait(0)
+    assert path.read_text() == "a\n"
+
+    ticket = writer.write(str(path), lambda: 1 / 0)
+    assert ticket.done and isinstance(ticket.error, ZeroDivisionError)
+
+
+def test_appends_are_batched_and_writes_coalesced(writer, tmp_path):
+    writer.start()
+    release = hold_writer_thread(writer, tmp_path / "held")
+    metadata_path = str(tmp_path / "metadata.txt")
+    log_path = tmp_path / "log.jsonl"
+    calls = []
+
+    appends = [writer.append(metadata_path, f"{i}\n") for i in range(3)]
+    first = writer.write(str(log_path), lambda: calls.append("first"))
+    second = writer.write(str(log_path), lambda: (calls.append("second"), log_path.write_text("second")))
+    assert not first.done
+    release.set()
+
+    assert writer.flush(5)
+    assert all(ticket.wait(0) for ticket in [*appends, first, second])
+    assert (tmp_path / "metadata.txt").read_text() == "0\n1\n2\n"
+    assert calls == ["second"]
+    counters = writer.metrics.snapshot()["counters"]
+    assert counters["write_behind_coalesced"] == 1
+    assert counters["write_behind_batches"] == 2
+
+
+def test_durability_is_acknowledged_after_fsync(tmp_path):
+    writer = WriteBehindWriter(fsync_interval=60, metrics=Metrics())
+    writer.start()
+    try:
+        ticket = writer.append(str(tmp_path / "metadata.txt"), "a\n")
+        assert not ticket.wait(0.2)  # Written, but not fsynced yet
+        assert (tmp_path / "metadata.txt").read_text() == "a\n"
+
+        assert writer.flush(5)
+        assert ticket.wait(0)
+    finally:
+        writer.stop()
+
+
+def test_failed_write_is_reported(writer, tmp_path):
+    writer.start()
+
+    ticket = writer.write(str(tmp_path / "log.jsonl"), lambda: 1 / 0)
+
+    assert not ticket.wait(5)
+    assert isinstance(ticket.error, ZeroDivisionError)
+    assert writer.metrics.snapshot()["counters"]["write_behind_failures"] == 1
+
+
+def test_bounded_queue_and_stop(tmp_path):
+    writer = WriteBehindWriter(max_queue=1, fsync_interval=60, metrics=Metrics())
+    writer.start()
+    release = hold_writer_thread(writer, tmp_path / "held")
+    writer.append(str(tmp_path / "a.txt"), "a\n")
+
+    blocked = threading.Thread(target=writer.append, args=(str(tmp_path / "b.txt"), "b\n"))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()  # Waits for room in the queue
+
+    release.set()
+    blocked.join(5)
+    writer.stop()
+
+    assert (tmp_path / "a.txt").read_text() == "a\n"
+    assert (tmp_path / "b.txt").read_text() == "b\n"
+    assert writer.metrics.snapshot()["counters"]["write_behind_queue_full"] == 1
+    assert writer.append(str(tmp_path / "a.txt"), "c\n").wait(0)  # Synchronous once stopped